@@ -316,28 +316,107 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
 // PREDICTION SERVICE FUNCTIONS
 // ============================================================================
 
+// Last page snapshot sent per tab: { snapshotId, pageUrl, elements: Map(idx -> JSON) }
+const pageSnapshots = new Map();
+
+chrome.tabs.onRemoved.addListener((tabId) => {
+  pageSnapshots.delete(tabId.toString());
+});
+
+async function sendPage(method, payload) {
+  return fetch(`${PREDICTION_SERVICE_URL}/predict/page`, {
+    method: method,
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify(payload)
+  });
+}
+
+async function syncPageSnapshot(tabId, allElements, pageUrl) {
+  // Register the page once, afterwards send only added/removed/changed elements
+  const serialized = new Map(allElements.map(el => [el.idx, JSON.stringify(el)]));
+  const known = pageSnapshots.get(tabId);
+  let response = null;
+  
+  if (known && known.pageUrl === pageUrl) {
+    const added = [];
+    const changed = [];
+    const removed = [];
+    for (const [idx, json] of serialized) {
+      if (!known.elements.has(idx)) added.push(JSON.parse(json));
+      else if (known.elements.get(idx) !== json) changed.push(JSON.parse(json));
+    }
+    for (const idx of known.elements.keys()) {
+      if (!serialized.has(idx)) removed.push(idx);
+    }
+    
+    if (added.length === 0 && changed.length === 0 && removed.length === 0) {
+      return known.snapshotId;
+    }
+    response = await sendPage('PATCH', {
+      tab_id: tabId,
+      snapshot_id: known.snapshotId,
+      added: added,
+      removed: removed,
+      changed: changed
+    });
+    // 409: the snapshot expired on the server, register the full page again
+    if (response.status === 409) response = null;
+  }
+  
+  if (!response) {
+    response = await sendPage('POST', {
+      tab_id: tabId,
+      page_url: pageUrl,
+      all_elements: allElements
+    });
+  }
+  
+  if (!response.ok) {
+    pageSnapshots.delete(tabId);
+    const error = await response.json();
+    throw new Error(error.error || `HTTP ${response.status}`);
+  }
+  
+  const data = await response.json();
+  pageSnapshots.set(tabId, { snapshotId: data.snapshot_id, pageUrl: pageUrl, elements: serialized });
+  return data.snapshot_id;
+}
+
 async function predictNextElement(tabId, currentElement, allElements, pageUrl, instruction) {
   // Predict next element to interact with
   try {
     console.log('[NeuroSEDA] Calling prediction service for tab:', tabId);
     
-    const payload = {
-      tab_id: tabId.toString(),
-      current_element: currentElement,
-      all_elements: allElements,
-      page_url: pageUrl,
-      instruction: instruction,
-      top_k: 3
-    };
-    
-    const response = await fetch(`${PREDICTION_SERVICE_URL}/predict/next-element`, {
+    const tabKey = tabId.toString();
+    const request = async () => fetch(`${PREDICTION_SERVICE_URL}/predict/next-element`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json'
       },
-      body: JSON.stringify(payload)
+      body: JSON.stringify({
+        tab_id: tabKey,
+        current_element: currentElement,
+        snapshot_id: await syncPageSnapshot(tabKey, allElements, pageUrl),
+        instruction: instruction,
+        top_k: 3
+      })
     });
     
+    let response = await request();
+    if (response.status === 409) {
+      // Snapshot expired between the update and the prediction, resend once
+      pageSnapshots.delete(tabKey);
+      response = await request();
+    }
+    
+    if (response.status === 410) {
+      // Superseded: a newer prediction request for this tab replaced this one
+      console.log('[NeuroSEDA] Prediction superseded by a newer request');
+      return [];
+    }
+    
     if (!response.ok) {
       const error = await response.json();
       throw new Error(error.error || `HTTP ${response.status}`);
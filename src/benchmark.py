@@ -0,0 +1,1932 @@
+# ============================================================================
+# Benchmarks and Parity Checks
+# ============================================================================
+# Checks that optimized code paths return the same results as the original
+# per-element implementations, and times them on synthetic pages.
+# Run: python benchmark.py
+# ============================================================================
+
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, Counter
+from typing import List, Dict, Tuple, Optional
+
+import hybrid_selector
+import page_index
+from predictor_simplified import (
+    MAX_PAGE_SNAPSHOTS, ElementRelationshipAnalyzer, ActionHistory, NextElementPredictor, PredictionSession, normalize_text
+)
+from history_store import SQLiteHistoryStore, MAX_DELTA_CHAIN
+from session_store import SessionStore
+from page_index import PageIndex
+from text_processing import extract_keywords, text_cache_stats
+from fuzzywuzzy import fuzz
+from hybrid_selector import (
+    compute_text_match_score, rule_based_selection, rule_based_top_k, score_elements_batch,
+    ElementIndex, ElementIndexCache, HybridElementSelector, InstructionQuery, config, prefilter_stats
+)
+
+
+# ============================================================================
+# SYNTHETIC PAGES
+# ============================================================================
+
+WORDS = [
+    'home', 'login', 'sign', 'up', 'submit', 'form', 'cancel', 'search',
+    'cart', 'checkout', 'account', 'settings', 'profile', 'help', 'contact',
+    'about', 'products', 'pricing', 'blog', 'news', 'next', 'previous',
+    'download', 'upload', 'save', 'delete', 'edit', 'share', 'menu', 'close',
+]
+
+INSTRUCTIONS = [
+    "Click the login button",
+    "Submit the form",
+    "Open account settings",
+    "Go to the checkout page",
+    "Search for products",
+    "Download the pricing sheet",
+]
+
+
+def make_elements(n: int, seed: int = 0) -> List[Dict]:
+    """Build a synthetic page with n elements"""
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n):
+        words = rng.sample(WORDS, rng.randint(0, 3))
+        text = ' '.join(words).title()
+        if rng.random() < 0.1:
+            text += rng.choice(['!', '...', ' →', ' (2)'])
+        x, y = rng.random() * 0.9, rng.random() * 0.9
+        elements.append({
+            'idx': i,
+            'text': text,
+            'tag': rng.choice(['button', 'a', 'input', 'div']),
+            'bbox': [x, y, x + 0.1, y + 0.05],
+        })
+    return elements
+
+
+# ============================================================================
+# REFERENCE IMPLEMENTATIONS
+# ============================================================================
+
+def reference_text_match_score(instruction: str, element_text: str) -> float:
+    """Original fuzzywuzzy compute_text_match_score, frozen for parity checks"""
+    if not element_text or not element_text.strip():
+        return 0.0
+
+    inst_norm = reference_normalize_text(instruction)
+    elem_norm = reference_normalize_text(element_text)
+    keywords = reference_extract_keywords(instruction)
+
+    scores = []
+    for kw in keywords:
+        if kw in elem_norm:
+            scores.append(100)
+    for kw in keywords:
+        scores.append(fuzz.partial_ratio(kw, elem_norm))
+    scores.append(fuzz.token_set_ratio(inst_norm, elem_norm))
+    return max(scores) if scores else 0.0
+
+
+def reference_rule_based_selection(
+    instruction: str,
+    elements: List[Dict],
+    confidence_threshold: float = 90
+) -> Tuple[Optional[int], float, str]:
+    """Original per-element rule_based_selection, kept for parity checks"""
+    if not elements:
+        return None, 0.0, "No elements provided"
+
+    scores = []
+    for i, elem in enumerate(elements):
+        text = elem.get('text', '')
+        score = reference_text_match_score(instruction, text)
+        scores.append((i, score, text))
+
+    scores.sort(key=lambda x: x[1], reverse=True)
+    best_idx, best_score, best_text = scores[0]
+
+    if best_score >= confidence_threshold:
+        return best_idx, best_score, f"High confidence text match: '{best_text}' (score={best_score:.1f})"
+    elif best_score >= 70:
+        return best_idx, best_score, f"Partial text match: '{best_text}' (score={best_score:.1f})"
+    else:
+        return None, best_score, f"No confident match (best score={best_score:.1f})"
+
+
+def reference_normalize_text(text: str) -> str:
+    """Original uncached normalize_text"""
+    text = text.lower().strip()
+    text = re.sub(r'[^\w\s]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+def reference_extract_keywords(instruction: str) -> List[str]:
+    """Original uncached extract_keywords"""
+    stop_words = {
+        'click', 'press', 'tap', 'select', 'choose', 'open', 'close',
+        'the', 'a', 'an', 'on', 'to', 'of', 'in', 'for', 'at', 'by',
+        'navigate', 'go', 'view', 'see', 'show', 'display'
+    }
+    keywords = [w for w in instruction.lower().split() if w not in stop_words and len(w) > 2]
+    phrases = [' '.join(keywords[:2])] if len(keywords) >= 2 else []
+    return keywords + phrases
+
+
+# ============================================================================
+# TEXT PROCESSING
+# ============================================================================
+
+def check_text_parity(samples: int = 100000, seed: int = 0) -> int:
+    """Compare cached / ASCII fast-path text processing with the originals"""
+    rng = random.Random(seed)
+    alphabet = [chr(c) for c in range(128)] + list('éÄß→日本 \u00a0\u2003') + WORDS
+    mismatches = 0
+    for _ in range(samples):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        for _ in range(2):  # cold, then cached
+            if normalize_text(text) != reference_normalize_text(text):
+                mismatches += 1
+                print(f"  ✗ normalize_text mismatch: {text!r}")
+            if extract_keywords(text) != reference_extract_keywords(text):
+                mismatches += 1
+                print(f"  ✗ extract_keywords mismatch: {text!r}")
+
+    print(f"Text parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+# ============================================================================
+# SELECTOR
+# ============================================================================
+
+# Misspelled and stop-word-heavy instructions, where fuzzy scoring decides
+PARITY_INSTRUCTIONS = INSTRUCTIONS + ["Click the logn button", "Go to the chekout", "Open the menu"]
+
+
+def _typed(values) -> List[Tuple[str, object]]:
+    """Values with their types, so 100 and 100.0 do not compare equal"""
+    return [(type(value).__name__, value) for value in values]
+
+
+def check_selector_parity(sizes=(0, 1, 10, 200, 1000), seeds=range(5)) -> int:
+    """Compare per-element, batch and indexed selection against the frozen original"""
+    mismatches = 0
+    for n in sizes:
+        for seed in seeds:
+            elements = make_elements(n, seed)
+            texts = [e['text'] for e in elements]
+            for instruction in PARITY_INSTRUCTIONS:
+                expected_scores = _typed(reference_text_match_score(instruction, t) for t in texts)
+                if _typed(compute_text_match_score(instruction, t) for t in texts) != expected_scores:
+                    mismatches += 1
+                    print(f"  ✗ per-element score mismatch: n={n} seed={seed} '{instruction}'")
+
+                if _typed(score_elements_batch(instruction, texts)) != expected_scores:
+                    mismatches += 1
+                    print(f"  ✗ score mismatch: n={n} seed={seed} '{instruction}'")
+
+                if _typed(ElementIndex(texts).score(InstructionQuery(instruction))) != expected_scores:
+                    mismatches += 1
+                    print(f"  ✗ index score mismatch: n={n} seed={seed} '{instruction}'")
+
+                expected = reference_rule_based_selection(instruction, elements, 90)
+                config.prefilter = False
+                for index in (None, ElementIndex(texts)):
+                    actual = rule_based_selection(instruction, elements, 90, index=index)
+                    if _typed(actual) != _typed(expected):
+                        mismatches += 1
+                        print(f"  ✗ selection mismatch: n={n} seed={seed} '{instruction}'")
+                        print(f"    expected {expected}")
+                        print(f"    actual   {actual}")
+
+    print(f"Selector parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def check_top_k_parity(sizes=(0, 1, 10, 200, 1000), seeds=range(3), ks=(1, 3, 5)) -> int:
+    """select_top_k / rule_based_top_k rank like a stable full sort of the scores, ties included"""
+    selector = HybridElementSelector(config)
+    mismatches = 0
+    for n in sizes:
+        for seed in seeds:
+            elements = make_elements(n, seed)
+            elements += [dict(e, idx=n + i) for i, e in enumerate(elements[::7])]  # Tied duplicates
+            texts = [e['text'] for e in elements]
+            for instruction in PARITY_INSTRUCTIONS:
+                scores = score_elements_batch(instruction, texts)
+                ranked = [i for i in sorted(range(len(scores)), key=lambda i: -scores[i])
+                          if scores[i] >= config.partial_match_threshold]
+                config.prefilter = False
+                for k in ks:
+                    expected = _typed(x for i in ranked[:k] for x in (i, scores[i]))
+                    for index in (None, ElementIndex(texts)):
+                        actual = rule_based_top_k(instruction, elements, k, 90, index=index)
+                        if _typed(x for i, score, _ in actual for x in (i, score)) != expected:
+                            mismatches += 1
+                            print(f"  ✗ top-{k} mismatch: n={n} seed={seed} '{instruction}'")
+                    top = selector.select_top_k(instruction, elements, k)
+                    if _typed(x for t in top for x in (t['element_idx'], t['confidence'])) != expected:
+                        mismatches += 1
+                        print(f"  ✗ select_top_k({k}) mismatch: n={n} seed={seed} '{instruction}'")
+
+                # The best alternative is what select() picks, with or without the prefilter
+                for config.prefilter in (False, True):
+                    best = selector.select(instruction, elements, verbose=False)
+                    top = selector.select_top_k(instruction, elements, 3)
+                    fields = ('element_idx', 'confidence', 'reason')
+                    if [best[f] for f in fields] != ([top[0][f] for f in fields] if top else [None, 0.0, best['reason']]):
+                        mismatches += 1
+                        print(f"  ✗ select_top_k()[0] differs from select(): n={n} seed={seed} '{instruction}'")
+    config.prefilter = True
+
+    print(f"Top-k parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def check_score_bounds(samples: int = 3000, seed: int = 0) -> int:
+    """rapidfuzz bounds used to prune selection are never below the fuzzywuzzy score"""
+    if hybrid_selector.rapid_fuzz is None:
+        print("Score bounds: skipped (rapidfuzz not installed)")
+        return 0
+    rng = random.Random(seed)
+    alphabet = list('abcdefghij  ') + list('éÄß→日本-') + WORDS
+    failures = 0
+    for _ in range(samples):
+        words = rng.choice([4, 12, 60])
+        instruction = ' '.join(rng.choice(alphabet) for _ in range(rng.randint(1, words)))
+        choices = [normalize_text(''.join(rng.choice(alphabet) for _ in range(rng.randint(1, words))))
+                   for _ in range(5)]
+        query = InstructionQuery(instruction)
+        bounds = hybrid_selector._score_bounds(query, choices)
+        for choice, bound in zip(choices, bounds):
+            score = hybrid_selector._fuzzy_score(query, choice)
+            if score > bound:
+                failures += 1
+                print(f"  ✗ bound {bound} below score {score}: {instruction!r} / {choice!r}")
+
+    print(f"Score bounds: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def check_prefilter_recall(n: int = 2000, seeds=range(5)):
+    """Report how often the pruned selection picks the same element"""
+    prefilter_stats.reset()
+    agree = total = 0
+    for seed in seeds:
+        elements = make_elements(n, seed)
+        index = ElementIndex([e['text'] for e in elements])
+        for instruction in INSTRUCTIONS:
+            expected = reference_rule_based_selection(instruction, elements, 90)
+            config.prefilter = True
+            actual = rule_based_selection(instruction, elements, 90, index=index)
+            agree += actual[0] == expected[0]
+            total += 1
+
+    print(f"Prefilter (max_elements={config.max_elements}) on {n} elements:")
+    print(f"  same element selected: {agree}/{total}")
+    print(f"  stats: {prefilter_stats.to_dict()}")
+
+
+def bench_selector(n: int = 2000, repeats: int = 5):
+    """Time batch selection against the per-element reference"""
+    elements = make_elements(n)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for instruction in INSTRUCTIONS:
+            reference_rule_based_selection(instruction, elements)
+    reference_ms = (time.perf_counter() - start) * 1000 / (repeats * len(INSTRUCTIONS))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for instruction in INSTRUCTIONS:
+            rule_based_selection(instruction, elements)
+    batch_ms = (time.perf_counter() - start) * 1000 / (repeats * len(INSTRUCTIONS))
+
+    timings = {}
+    for prefilter in (False, True):
+        config.prefilter = prefilter
+        cache = ElementIndexCache(64 * 1024 * 1024)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for instruction in INSTRUCTIONS:
+                rule_based_selection(instruction, elements, index=cache.get(elements))
+        timings[prefilter] = (time.perf_counter() - start) * 1000 / (repeats * len(INSTRUCTIONS))
+    indexed_ms, pruned_ms = timings[False], timings[True]
+
+    print(f"rule_based_selection on {n} elements:")
+    print(f"  per-element: {reference_ms:8.2f} ms/instruction")
+    print(f"  batch:       {batch_ms:8.2f} ms/instruction ({reference_ms / batch_ms:.1f}x)")
+    print(f"  page index:  {indexed_ms:8.2f} ms/instruction ({reference_ms / indexed_ms:.1f}x)")
+    print(f"  prefilter:   {pruned_ms:8.2f} ms/instruction ({reference_ms / pruned_ms:.1f}x)")
+
+
+
+# ============================================================================
+# PREDICTOR
+# ============================================================================
+
+def reference_infer_action(element: Dict) -> str:
+    """Original NextElementPredictor._infer_action"""
+    tag = element.get('tag', '').lower()
+    elem_type = element.get('type', '').lower()
+    text = element.get('text', '').lower()
+
+    if tag in ['input', 'textarea'] or elem_type in ['text', 'password', 'email']:
+        return 'input'
+    if tag in ['button', 'a'] or 'button' in text:
+        return 'click'
+    if tag == 'select' or 'select' in text or 'dropdown' in text:
+        return 'select'
+    if elem_type in ['checkbox', 'radio']:
+        return 'toggle'
+    return 'click'
+
+
+def check_proximity_parity(sizes=(0, 1, 50, 1000), seeds=range(3)) -> int:
+    """Compare PageIndex queries against the linear scan, with and without NumPy"""
+    numpy = page_index.np
+    mismatches = 0
+    for page_index.np in ([numpy, None] if numpy is not None else [None]):
+        mismatches += _check_proximity_parity(sizes, seeds)
+    page_index.np = numpy
+
+    print(f"Proximity parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def _check_proximity_parity(sizes, seeds) -> int:
+    backend = 'numpy' if page_index.np is not None else 'grid'
+    mismatches = 0
+    for n in sizes:
+        for seed in seeds:
+            elements = make_elements(n, seed)
+            # Duplicate boxes exercise distance ties
+            elements += [dict(e, idx=n + i) for i, e in enumerate(elements[:n // 10])]
+            for i, e in enumerate(elements[:n // 5]):
+                e['type'] = ['text', 'checkbox', 'radio', 'submit'][i % 4]
+                e['tag'] = ['select', 'textarea', 'span', 'a', 'button'][i % 5] if i % 3 else e['tag']
+            page = PageIndex(elements)
+            if [page.action_of(e) for e in elements] != [reference_infer_action(e) for e in elements]:
+                mismatches += 1
+                print(f"  ✗ [{backend}] action mismatch: n={n} seed={seed}")
+            for ref in elements[:50] + [{'idx': -1, 'bbox': [0.5, 0.5, 0.5, 0.5]}, {'idx': -2}]:
+                for k in (1, 3, 5):
+                    expected = ElementRelationshipAnalyzer.find_related_elements(ref, elements, k)
+                    if page.find_related(ref, k) != expected:
+                        mismatches += 1
+                        print(f"  ✗ [{backend}] find_related mismatch: n={n} seed={seed} ref={ref.get('idx')}")
+
+                    dists = [
+                        (ElementRelationshipAnalyzer.compute_spatial_proximity(ref.get('bbox', [0, 0, 1, 1]), e['bbox']), i)
+                        for i, e in enumerate(elements) if e.get('idx') != ref.get('idx')
+                    ]
+                    expected_nearest = [(elements[i], d) for d, i in sorted(dists)[:k]]
+                    if page.nearest(ref, k) != expected_nearest:
+                        mismatches += 1
+                        print(f"  ✗ [{backend}] nearest mismatch: n={n} seed={seed} ref={ref.get('idx')}")
+            refs = elements[:300] + [{'idx': -1, 'bbox': [0.5, 0.5, 0.5, 0.5]}, {'idx': -2}, {'bbox': [0.2, 0.2, 0.3, 0.3]}]
+            for k in (1, 5):
+                if page.find_related_many(refs, k) != [page.find_related(ref, k) for ref in refs]:
+                    mismatches += 1
+                    print(f"  ✗ [{backend}] find_related_many mismatch: n={n} seed={seed} k={k}")
+    return mismatches
+
+
+def random_delta(elements: List[Dict], rng: random.Random, next_idx: int):
+    """Random added / removed / changed elements for a page"""
+    fresh = make_elements(rng.randint(0, 8), rng.randint(0, 10 ** 6))
+    added = [dict(e, idx=next_idx + i) for i, e in enumerate(fresh)]
+    sample = rng.sample(elements, min(len(elements), rng.randint(0, 10)))
+    half = len(sample) // 2
+    removed = [e['idx'] for e in sample[:half]]
+    changed = [dict(e, text=e['text'] + ' (1)', tag=rng.choice(['input', 'a', 'select']),
+                    bbox=[b + 0.01 for b in e['bbox']]) for e in sample[half:]]
+    return added, removed, changed
+
+
+def _index_signature(page: PageIndex) -> Tuple:
+    """Everything a query can observe from a PageIndex"""
+    refs = page.elements[:20] + [{'idx': -1, 'bbox': [0.5, 0.5, 0.5, 0.5]}]
+    return (
+        [id(e) for e in page.elements], page.centers, page.texts, page.normalized,
+        {t: [id(e) for e in es] for t, es in page.elements_by_text.items()},
+        [page.action_of(e) for e in page.elements],
+        [[id(e) for e in page.find_related(ref, 3)] for ref in refs],
+        [[(id(e), d) for e, d in page.nearest(ref, 3)] for ref in refs],
+    )
+
+
+def check_delta_parity(n: int = 500, steps: int = 30, seeds=range(3)) -> int:
+    """Compare PageIndex.apply_delta chains against rebuilding from scratch"""
+    numpy = page_index.np
+    mismatches = 0
+    for page_index.np in ([numpy, None] if numpy is not None else [None]):
+        backend = 'numpy' if page_index.np is not None else 'grid'
+        for seed in seeds:
+            rng = random.Random(seed)
+            page = PageIndex(make_elements(n, seed))
+            next_idx = n
+            for step in range(steps):
+                added, removed, changed = random_delta(page.elements, rng, next_idx)
+                next_idx += len(added)
+                page = page.apply_delta(added, removed, changed)
+                if _index_signature(page) != _index_signature(PageIndex(page.elements)):
+                    mismatches += 1
+                    print(f"  ✗ [{backend}] delta mismatch: seed={seed} step={step}")
+    page_index.np = numpy
+    mismatches += _check_snapshot_api(n)
+
+    print(f"Delta parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def _check_snapshot_api(n: int) -> int:
+    """Predictions against a registered and patched snapshot match sending the full page"""
+    import logging
+    import prediction_api
+    import predictor_service
+    logging.getLogger('predictor_service').setLevel(logging.WARNING)
+    prediction_api.prediction_sessions = SessionStore()
+    client = predictor_service.app.test_client()
+    elements = make_elements(n)
+    added, removed, changed = random_delta(elements, random.Random(1), n)
+
+    snapshot = client.post('/predict/page', json={
+        'tab_id': 'delta', 'page_url': 'https://example.com', 'all_elements': elements
+    }).get_json()['snapshot_id']
+    patched = client.patch('/predict/page', json={
+        'tab_id': 'delta', 'snapshot_id': snapshot, 'added': added, 'removed': removed, 'changed': changed
+    }).get_json()['snapshot_id']
+    page = PageIndex(elements).apply_delta(added, removed, changed)
+
+    mismatches = 0
+    for current in page.elements[:20]:
+        by_snapshot = client.post('/predict/next-element', json={
+            'tab_id': 'delta', 'current_element': current, 'snapshot_id': patched
+        }).get_json()
+        full = client.post('/predict/next-element', json={
+            'tab_id': 'full', 'current_element': current,
+            'page_url': 'https://example.com', 'all_elements': page.elements
+        }).get_json()
+        if by_snapshot != full:
+            mismatches += 1
+            print(f"  ✗ snapshot prediction mismatch: current={current['idx']}")
+
+    stale = client.post('/predict/next-element', json={
+        'tab_id': 'delta', 'current_element': elements[0], 'snapshot_id': 'missing'
+    })
+    if stale.status_code != 409:
+        mismatches += 1
+        print(f"  ✗ unknown snapshot answered {stale.status_code}")
+
+    # Inline pages set the current page without taking a snapshot slot
+    for _ in range(2 * MAX_PAGE_SNAPSHOTS):
+        client.post('/predict/next-element', json={
+            'tab_id': 'delta', 'current_element': elements[0],
+            'page_url': 'https://example.com', 'all_elements': elements
+        })
+    session = prediction_api.get_session('delta')
+    if patched not in session.page_snapshots or len(session.page_snapshots) != 2:
+        mismatches += 1
+        print(f"  ✗ inline pages evicted registered snapshots: {len(session.page_snapshots)} kept")
+    return mismatches
+
+
+def bench_delta(n: int = 2000, repeats: int = 50):
+    """Full page resend + rebuild vs. registering once and sending deltas"""
+    import json
+    elements = make_elements(n)
+    rng = random.Random(0)
+    page = PageIndex(elements)
+    deltas = [random_delta(elements, rng, n + 100 * i) for i in range(repeats)]
+
+    full_payload = json.dumps({'all_elements': elements})
+    start = time.perf_counter()
+    for _ in range(repeats):
+        PageIndex(json.loads(full_payload)['all_elements'])
+    full = (time.perf_counter() - start) / repeats
+
+    payloads = [json.dumps({'added': a, 'removed': r, 'changed': c}) for a, r, c in deltas]
+    start = time.perf_counter()
+    for payload in payloads:
+        delta = json.loads(payload)
+        page.apply_delta(delta['added'], delta['removed'], delta['changed'])
+    incremental = (time.perf_counter() - start) / repeats
+
+    # With serve.py's shared store every snapshot is also persisted
+    with tempfile.TemporaryDirectory() as tmp:
+        session = PredictionSession('bench', SQLiteHistoryStore(os.path.join(tmp, 'history.db')))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            snapshot_id, _ = session.register_page('https://example.com', elements)
+        shared_full = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for added, removed, changed in deltas:
+            snapshot_id, _ = session.patch_page(snapshot_id, added, removed, changed)
+        shared_delta = (time.perf_counter() - start) / repeats
+
+    print(f"Page update on {n} elements:")
+    print(f"  full resend:     {full * 1000:6.2f} ms, {len(full_payload) // 1024} KB")
+    print(f"  delta:           {incremental * 1000:6.2f} ms ({full / incremental:.1f}x), "
+          f"~{sum(map(len, payloads)) // len(payloads)} bytes")
+    print(f"  shared register: {shared_full * 1000:6.2f} ms")
+    print(f"  shared patch:    {shared_delta * 1000:6.2f} ms ({shared_full / shared_delta:.1f}x)")
+
+
+def check_codecs(n: int = 300) -> int:
+    """Every installed codec round-trips service payloads, and the Flask service answers in the negotiated one"""
+    import json
+    import codec
+    elements = make_elements(n)
+    session = PredictionSession()
+    session.update_page('https://example.com', elements)
+    payload = {'success': True, 'predictions': session.predict(elements[0], top_k=3)}
+    for pred in payload['predictions']:
+        del pred['element']
+    failures = 0
+
+    codecs = [c for c in (codec.JSON, codec.MSGPACK) if c is not None]
+    for c in codecs:
+        if c.loads(c.dumps(payload)) != json.loads(json.dumps(payload)):
+            failures += 1
+            print(f"  ✗ {c.mimetype} round trip differs from stdlib json")
+    if codec.request_codec(None) is not codec.JSON or codec.response_codec('*/*') is not codec.JSON:
+        failures += 1
+        print("  ✗ JSON is not the default codec")
+
+    try:
+        import prediction_api
+        import predictor_service
+    except ImportError:
+        print(f"Codecs {[c.mimetype for c in codecs]}: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}"
+              " (service not checked, Flask missing)")
+        return failures
+
+    prediction_api.prediction_sessions = SessionStore()
+    client = predictor_service.app.test_client()
+    body = {'tab_id': 'codec', 'current_element': elements[0], 'all_elements': elements,
+            'page_url': 'https://example.com'}
+    expected = client.post('/predict/next-element', json=body).get_json()
+    for c in codecs:
+        resp = client.post('/predict/next-element', data=c.dumps(body),
+                           headers={'Content-Type': c.mimetype, 'Accept': c.mimetype})
+        if resp.mimetype != c.mimetype or c.loads(resp.get_data()) != expected:
+            failures += 1
+            print(f"  ✗ {c.mimetype} request answered differently")
+    if client.post('/predict/next-element', data=b'<x/>', content_type='application/xml').status_code != 415:
+        failures += 1
+        print("  ✗ unsupported body type not answered with 415")
+
+    print(f"Codecs {[c.mimetype for c in codecs]}: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def bench_codecs(n: int = 2000, repeats: int = 20):
+    """Decode a full-page request and encode a bulk-predict response, stdlib json vs installed codecs"""
+    import json
+    import codec
+    elements = make_elements(n)
+    request_body = json.dumps({'tab_id': 't', 'page_url': 'https://example.com', 'all_elements': elements})
+    session = PredictionSession()
+    session.update_page('https://example.com', elements)
+    response = {'success': True, 'predictions': {}}
+    for elem in elements[:200]:
+        predictions = session.predict(elem, top_k=3)
+        for pred in predictions:
+            del pred['element'], pred['reasons'], pred['element_idx']
+        response['predictions'][str(elem['idx'])] = predictions
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - start) / repeats * 1000
+
+    base_load = timed(lambda: json.loads(request_body))
+    base_dump = timed(lambda: json.dumps(response).encode('utf-8'))
+    print(f"Codecs on a {n}-element request / 200-element bulk response:")
+    print(f"  stdlib json:          decode {base_load:6.2f} ms, encode {base_dump:6.2f} ms")
+    for c in (codec.JSON, codec.MSGPACK):
+        if c is None:
+            continue
+        body = c.dumps(json.loads(request_body))
+        load, dump = timed(lambda: c.loads(body)), timed(lambda: c.dumps(response))
+        print(f"  {c.mimetype:21} decode {load:6.2f} ms ({base_load / load:.1f}x), "
+              f"encode {dump:6.2f} ms ({base_dump / dump:.1f}x), {len(c.dumps(response)) // 1024} KB")
+
+
+def bench_proximity(n: int = 2000, queries: int = 200):
+    """Time proximity queries (one per bulk-predict element)"""
+    elements = make_elements(n)
+    refs = elements[:queries]
+
+    start = time.perf_counter()
+    for ref in refs:
+        ElementRelationshipAnalyzer.find_related_elements(ref, elements, 5)
+    scan_ms = (time.perf_counter() - start) * 1000 / queries
+
+    print(f"find_related on {n} elements:")
+    print(f"  linear scan:  {scan_ms:8.3f} ms/query")
+
+    numpy = page_index.np
+    for label, page_index.np in (('spatial grid', None), ('numpy', numpy)):
+        if label == 'numpy' and numpy is None:
+            continue
+        start = time.perf_counter()
+        page = PageIndex(elements)
+        page.find_related(refs[0], 5)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for ref in refs:
+            page.find_related(ref, 5)
+        query_ms = (time.perf_counter() - start) * 1000 / queries
+        print(f"  {label + ':':13} {query_ms:8.3f} ms/query ({scan_ms / query_ms:.1f}x), build {build_ms:.2f} ms")
+    page_index.np = numpy
+
+
+
+class ReferenceActionHistory:
+    """Original list-based ActionHistory transition counting"""
+    def __init__(self, max_history=50):
+        self.actions = []
+        self.max_history = max_history
+        self.action_sequences = defaultdict(list)
+
+    def add_action(self, element_text: str):
+        self.actions.append(element_text)
+        if len(self.actions) > self.max_history:
+            self.actions.pop(0)
+        if len(self.actions) >= 2:
+            self.action_sequences[normalize_text(self.actions[-2])].append(normalize_text(element_text))
+
+    def get_likely_next_actions(self, current_element_text: str, top_k: int = 3):
+        norm_text = normalize_text(current_element_text)
+        if norm_text not in self.action_sequences:
+            return []
+        next_actions = self.action_sequences[norm_text]
+        total = len(next_actions)
+        return [(a, (c / total) * 100) for a, c in Counter(next_actions).most_common(top_k)]
+
+    def sequences(self):
+        return {k: list(Counter(v).most_common(5)) for k, v in self.action_sequences.items()}
+
+
+def check_history_parity(steps: int = 3000, seeds=range(5)) -> int:
+    """Compare the ranked transition table against recounting the full history"""
+    mismatches = 0
+    for seed in seeds:
+        rng = random.Random(seed)
+        labels = [w.title() for w in WORDS[:12]] + ['Sign up!', 'sign  UP']
+        history, reference = ActionHistory(max_order=1), ReferenceActionHistory()
+        for step in range(steps):
+            # Skewed choice gives a realistic mix of frequent and rare transitions
+            text = labels[min(int(rng.expovariate(0.3)), len(labels) - 1)]
+            history.add_action(text, step, [0, 0, 1, 1])
+            reference.add_action(text)
+            if step % 97 == 0:
+                for label in labels:
+                    for k in (1, 3, 5):
+                        if history.get_likely_next_actions(label, k) != reference.get_likely_next_actions(label, k):
+                            mismatches += 1
+                            print(f"  ✗ next actions mismatch: seed={seed} step={step} '{label}' k={k}")
+        if history.to_dict()['sequences'] != reference.sequences():
+            mismatches += 1
+            print(f"  ✗ sequences mismatch: seed={seed}")
+
+    mismatches += _check_full_contexts()
+    mismatches += _check_variable_order()
+    print(f"History parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def _check_full_contexts() -> int:
+    """A context holding max_successors still learns new successors; counts add up to the total"""
+    mismatches = 0
+    history = ActionHistory(max_order=1, max_successors=3)
+    for successor in ['a', 'b', 'c', 'd'] + ['new'] * 5:
+        history.add_action('home', 0, [0, 0, 1, 1])
+        history.add_action(successor, 0, [0, 0, 1, 1])
+    likely = history.get_likely_next_actions('home', 3)
+    if not likely or likely[0][0] != 'new':
+        mismatches += 1
+        print(f"  ✗ full context did not learn a new successor: {likely}")
+
+    rng = random.Random(0)
+    history = ActionHistory(max_order=2, max_successors=4)
+    for step in range(3000):
+        history.add_action(rng.choice(WORDS), step, [0, 0, 1, 1])
+    for context, row in history.transitions.items():
+        if len(row.ranked) > 4 or abs(sum(row.counts.values()) - row.total) > 1e-9 or \
+                len(set(row.first_seen.values())) != len(row.first_seen):
+            mismatches += 1
+            print(f"  ✗ inconsistent row for {context}: {row.counts} total={row.total}")
+            break
+    return mismatches
+
+
+
+def _check_variable_order() -> int:
+    """Longer contexts separate successors, rare ones back off, pruning bounds the table"""
+    mismatches = 0
+
+    def record(history: ActionHistory, *texts: str):
+        for text in texts:
+            history.add_action(text, 0, [0, 0, 1, 1])
+
+    # home is followed by login after x but by cart after y
+    history = ActionHistory()
+    for _ in range(5):
+        record(history, 'x', 'home', 'login', 'y', 'home', 'cart')
+    for prefix, expected in [('x', 'login'), ('y', 'cart')]:
+        record(history, prefix, 'home')
+        likely = history.get_likely_next_actions('home', 1)
+        if likely != [(expected, 100.0)]:
+            mismatches += 1
+            print(f"  ✗ {prefix},home predicted {likely}")
+
+    # A context seen fewer than min_context_count times falls back to first order
+    history, first_order = ActionHistory(min_context_count=2), ActionHistory(max_order=1)
+    for h in (history, first_order):
+        for _ in range(4):
+            record(h, 'a', 'home', 'login')
+        record(h, 'z', 'home', 'cart', 'z', 'home')
+    if history.get_likely_next_actions('home', 3) != first_order.get_likely_next_actions('home', 3):
+        mismatches += 1
+        print(f"  ✗ rare context did not back off: {history.get_likely_next_actions('home', 3)}")
+    record(history, 'cart', 'z', 'home')
+    if history.get_likely_next_actions('home', 1) != [('cart', 100.0)]:
+        mismatches += 1
+        print(f"  ✗ context seen min_context_count times unused: {history.get_likely_next_actions('home', 1)}")
+
+    # Contexts are pruned to max_contexts under load
+    rng = random.Random(0)
+    history = ActionHistory(max_contexts=200)
+    for step in range(5000):
+        history.add_action(rng.choice(WORDS), step, [0, 0, 1, 1])
+        if len(history.transitions) > history.max_contexts:
+            mismatches += 1
+            print(f"  ✗ {len(history.transitions)} contexts held, max_contexts=200")
+            break
+    if history.successor_entries != sum(len(row.ranked) for row in history.transitions.values()):
+        mismatches += 1
+        print("  ✗ successor_entries out of sync after pruning")
+    return mismatches
+
+
+def trained_predictor(elements: List[Dict], steps: int = 500, seed: int = 0) -> NextElementPredictor:
+    """Predictor whose history holds a random walk over the page"""
+    rng = random.Random(seed)
+    predictor = NextElementPredictor()
+    for _ in range(steps):
+        predictor.record_action(rng.choice(elements[::max(1, len(elements) // 40)]))
+    return predictor
+
+
+def check_predictor_parity(n: int = 1000, seeds=range(3)) -> int:
+    """Compare predictions with and without the page index"""
+    mismatches = 0
+    for seed in seeds:
+        elements = make_elements(n, seed)
+        predictor = trained_predictor(elements, seed=seed)
+        page = PageIndex(elements)
+        for current in elements[:60]:
+            expected = predictor.predict_next_element(current, elements)
+            if predictor.predict_next_element(current, elements, page=page) != expected:
+                mismatches += 1
+                print(f"  ✗ prediction mismatch: seed={seed} current={current['idx']}")
+
+    print(f"Predictor parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def check_bulk_parity(n: int = 1000, seeds=range(3)) -> int:
+    """Batched predictions match predicting each current element alone"""
+    mismatches = 0
+    for seed in seeds:
+        elements = make_elements(n, seed)
+        predictor = trained_predictor(elements, seed=seed)
+        page = PageIndex(elements)
+        currents = elements[:150] + elements[::40] + [{'idx': -1, 'text': elements[0]['text']}]
+        expected = [predictor.predict_next_element(c, elements, page=page) for c in currents]
+        if predictor.predict_many(currents, page) != expected:
+            mismatches += 1
+            print(f"  ✗ bulk prediction mismatch: seed={seed}")
+
+    print(f"Bulk prediction parity: {'✅ OK' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+    return mismatches
+
+
+def bench_bulk_predict(n: int = 2000, m: int = 100, repeats: int = 5):
+    """Time a bulk request of m reference elements, per element vs batched"""
+    elements = make_elements(n)
+    session = PredictionSession()
+    session.predictor = trained_predictor(elements)
+    page = session.update_page('https://example.com', elements)
+    currents = elements[::n // m][:m]
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for current in currents:
+            session.predict(current, top_k=3, page=page)
+    single = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        session.predict_many(currents, top_k=3, page=page)
+    batched = (time.perf_counter() - start) / repeats
+
+    print(f"Bulk predict, {m} references on {n} elements:")
+    print(f"  per element: {single * 1000:7.2f} ms")
+    print(f"  batched:     {batched * 1000:7.2f} ms ({single / batched:.1f}x)")
+
+
+def bench_history_lookup(n: int = 1000, requests: int = 200):
+    """Time history-based predictions (proximity off) per request"""
+    elements = make_elements(n)
+    predictor = trained_predictor(elements)
+    page = PageIndex(elements)
+    currents = [elements[(i * 25) % n] for i in range(requests)]
+
+    timings = {}
+    for label, kwargs in (('linear scan', {}), ('text index', {'page': page})):
+        start = time.perf_counter()
+        for current in currents:
+            predictor.predict_next_element(current, elements, use_proximity=False, **kwargs)
+        timings[label] = (time.perf_counter() - start) * 1000 / requests
+
+    print(f"History lookup on {n} elements:")
+    print(f"  linear scan: {timings['linear scan']:8.3f} ms/request")
+    print(f"  text index:  {timings['text index']:8.3f} ms/request "
+          f"({timings['linear scan'] / timings['text index']:.1f}x)")
+
+
+
+# ============================================================================
+# SERVICE CONCURRENCY
+# ============================================================================
+
+class _SizedSession:
+    """Stand-in session whose approx_bytes a check sets directly"""
+    def __init__(self, tab_id: str):
+        self.tab_id = tab_id
+        self.bytes = 40
+
+    def approx_bytes(self) -> int:
+        return self.bytes
+
+
+def check_session_store() -> int:
+    """TTL, LRU and memory eviction of SessionStore on a fake clock, and the /predict/stats payload"""
+    import prediction_api
+    import predictor_service
+    now = [0.0]
+    failures = 0
+
+    def store(**limits) -> SessionStore:
+        return SessionStore(factory=_SizedSession, clock=lambda: now[0], **limits)
+
+    def expect(sessions: SessionStore, live: List[str], reason: str, evicted: int, label: str):
+        nonlocal failures
+        if list(sessions._entries) != live or sessions.evictions[reason] != evicted:
+            failures += 1
+            print(f"  ✗ {label}: live {list(sessions._entries)}, evictions {sessions.evictions}")
+
+    # Idle sessions expire after idle_ttl
+    sessions = store(idle_ttl=30)
+    sessions.get('a')
+    now[0] = 10
+    sessions.get('b')
+    now[0] = 35
+    sessions.get('b')
+    expect(sessions, ['b'], 'ttl', 1, 'ttl')
+
+    # The least recently used session goes first
+    sessions = store(max_sessions=3)
+    for tab_id in ['a', 'b', 'c', 'a', 'd']:
+        sessions.get(tab_id)
+    expect(sessions, ['c', 'a', 'd'], 'lru', 1, 'lru')
+
+    # Over the byte budget, least recently used sessions go; the newest stays
+    sessions = store(max_bytes=100)
+    for tab_id in ['a', 'b', 'c']:
+        sessions.get(tab_id)
+    expect(sessions, ['b', 'c'], 'memory', 1, 'memory')
+    sessions.get('c').bytes = 500
+    sessions.get('c')
+    expect(sessions, ['c'], 'memory', 2, 'oversized newest session')
+
+    # Sessions that grew without being accessed are evicted by stats()
+    sessions = store(max_bytes=100)
+    sessions.get('a')
+    sessions.get('b')
+    sessions.get('a').bytes = 50
+    sessions.get('b').bytes = 90
+    stats = sessions.stats()
+    expect(sessions, ['b'], 'memory', 1, 'stats over budget')
+    if stats['approx_bytes'] > stats['max_bytes']:
+        failures += 1
+        print(f"  ✗ stats report {stats['approx_bytes']} bytes over a {stats['max_bytes']} budget")
+
+    prediction_api.prediction_sessions = sessions
+    payload = predictor_service.app.test_client().get('/predict/stats').get_json()
+    expected = {
+        'success': True,
+        'sessions': {
+            'live_sessions': 1, 'created': 2, 'evictions': {'ttl': 0, 'lru': 0, 'memory': 1},
+            'approx_bytes': 90, 'max_sessions': 5000, 'max_bytes': 100, 'idle_ttl_seconds': 30 * 60
+        }
+    }
+    if payload != expected:
+        failures += 1
+        print(f"  ✗ /predict/stats payload {payload}")
+
+    print(f"Session store: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def _tab_workload(client, tab_id: str, elements: List[Dict], requests: int, start_barrier):
+    """Alternate recorded actions and next-element predictions for one tab"""
+    start_barrier.wait()
+    for i in range(requests):
+        elem = elements[(i * 7) % len(elements)]
+        if i % 2:
+            resp = client.post('/predict/action', json={'tab_id': tab_id, 'element': elem})
+        else:
+            resp = client.post('/predict/next-element', json={
+                'tab_id': tab_id, 'current_element': elem,
+                'all_elements': elements, 'page_url': 'https://example.com'
+            })
+        assert resp.status_code == 200, resp.get_json()
+
+
+def stress_service(tab_counts=(1, 2, 4, 8), requests: int = 200, n: int = 300) -> int:
+    """
+    Hammer the Flask service from one thread per tab, plus several threads
+    sharing a single tab, and check every tab's history stayed consistent.
+    Under CPython's GIL, CPU-bound throughput stays roughly flat across
+    threads; the point is that it does not collapse from lock contention.
+    """
+    import logging
+    import prediction_api
+    import predictor_service
+    logging.getLogger('predictor_service').setLevel(logging.WARNING)
+    elements = make_elements(n)
+    failures = 0
+
+    print(f"Service stress ({requests} requests per thread, {n} elements):")
+    for tabs, shared in [(t, False) for t in tab_counts] + [(8, True)]:
+        prediction_api.prediction_sessions = SessionStore()
+        tab_ids = ['shared'] * tabs if shared else [f'tab-{t}' for t in range(tabs)]
+        barrier = threading.Barrier(tabs + 1)
+        with ThreadPoolExecutor(max_workers=tabs) as pool:
+            futures = [
+                pool.submit(_tab_workload, predictor_service.app.test_client(),
+                            tab_id, elements, requests, barrier)
+                for tab_id in tab_ids
+            ]
+            barrier.wait()
+            start = time.perf_counter()
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+
+        # Every recorded action after a tab's first adds one first-order transition
+        actions_per_tab = requests // 2 * (tabs if shared else 1)
+        for tab_id in set(tab_ids):
+            history = prediction_api.get_session(tab_id).predictor.history
+            observed = sum(
+                row.observations for context, row in history.transitions.items() if len(context) == 1
+            )
+            if observed != actions_per_tab - 1:
+                failures += 1
+                print(f"  ✗ {tab_id}: {observed} transitions, expected {actions_per_tab - 1}")
+
+        label = f"{tabs} threads on 1 tab" if shared else f"{tabs} tab(s)"
+        print(f"  {label:18} {tabs * requests / elapsed:8.0f} requests/s")
+
+    print(f"Service consistency: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def _record_worker(path: str, tab_id: str, elements: List[Dict], actions: int, seed: int):
+    """One worker process recording actions through its own session"""
+    rng = random.Random(seed)
+    session = PredictionSession(tab_id, SQLiteHistoryStore(path))
+    for _ in range(actions):
+        session.record_action(rng.choice(elements))
+
+
+def _replayed(session: PredictionSession) -> Tuple:
+    """A session's synced transition table, without per-worker action timestamps"""
+    session.sync()
+    state = session.predictor.history.to_state()
+    return state['recent'], state['weight'], state['transitions']
+
+
+def check_shared_history(workers: int = 4, actions: int = 150, n: int = 20) -> int:
+    """
+    Several processes record actions for one tab through a shared SQLite
+    history; every session replaying it must end up with the same history
+    as one session fed the log in order.
+    """
+    elements = make_elements(n)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        SQLiteHistoryStore(path)
+        procs = [
+            multiprocessing.Process(target=_record_worker, args=(path, 'tab', elements, actions, seed))
+            for seed in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        store = SQLiteHistoryStore(path)
+        log = store.fetch_since('tab', 0)
+        reference = PredictionSession()
+        for entry in log:
+            reference.record_action(entry['element'], entry['action_type'])
+
+        sessions = [PredictionSession('tab', SQLiteHistoryStore(path)) for _ in range(2)]
+        expected = reference.get_history_summary()['sequences']
+        if len(log) != workers * actions:
+            failures += 1
+            print(f"  ✗ {len(log)} logged actions, expected {workers * actions}")
+        for session in sessions:
+            if session.get_history_summary()['sequences'] != expected:
+                failures += 1
+                print("  ✗ replayed history differs from the log order")
+
+        # Snapshots registered or patched by one worker resolve in another
+        snapshot_id, page = sessions[0].register_page('https://example.com', elements)
+        patched_id, patched = sessions[1].patch_page(snapshot_id, removed=[elements[0]['idx']])
+        if sessions[0].page_snapshot(patched_id)[1].elements != patched.elements or \
+                sessions[1].page_snapshot(snapshot_id)[1].elements != page.elements:
+            failures += 1
+            print("  ✗ snapshot from another worker differs")
+        # Patches alternating between workers are stored as deltas and rebuilt
+        rng = random.Random(0)
+        current_id, current = patched_id, patched
+        for step in range(2 * MAX_DELTA_CHAIN):
+            added, removed, changed = random_delta(current.elements, rng, n + 10 * step)
+            current_id, page = sessions[step % 2].patch_page(current_id, added, removed, changed)
+            current = current.apply_delta(added, removed, changed)
+            if page.elements != current.elements:
+                failures += 1
+                print(f"  ✗ patch {step} rebuilt from stored deltas differs")
+                break
+        full_pages = store._connect().execute(
+            "SELECT COUNT(*) FROM pages WHERE tab_id = 'tab' AND elements IS NOT NULL").fetchone()[0]
+        if full_pages > 3 or PredictionSession('tab', store).page_snapshot(current_id)[1].elements != current.elements:
+            failures += 1
+            print(f"  ✗ {full_pages} full pages stored for a delta chain")
+
+        for _ in range(MAX_PAGE_SNAPSHOTS):
+            sessions[0].register_page('https://example.com', elements)
+        stored = store._connect().execute("SELECT COUNT(*) FROM pages WHERE tab_id = 'tab'").fetchone()[0]
+        if stored != MAX_PAGE_SNAPSHOTS or store.fetch_page('tab', snapshot_id) is not None:
+            failures += 1
+            print(f"  ✗ {stored} stored snapshots, expected the newest {MAX_PAGE_SNAPSHOTS}")
+
+        # A reset from one worker clears the others on their next sync
+        store.reset('tab')
+        sessions[1].record_action(elements[0])
+        texts = [[a['text'] for a in s.get_history_summary()['actions']] for s in sessions]
+        if texts != [[elements[0]['text']]] * 2:
+            failures += 1
+            print("  ✗ reset did not propagate")
+
+        # Compaction keeps the log bounded and every replica on the same table
+        capped = SQLiteHistoryStore(os.path.join(tmp, 'capped.db'), max_actions_per_tab=50)
+        rng = random.Random(0)
+        busy, quiet = PredictionSession('busy', capped), PredictionSession('quiet', capped)
+        reference, lagging = PredictionSession(), None
+        for i in range(300):
+            element = elements[min(int(rng.expovariate(0.5)), n - 1)]
+            busy.record_action(element)
+            reference.record_action(element)
+            if i % 7 == 0:
+                quiet.record_action(element)
+            if i == 20:
+                lagging = PredictionSession('busy', capped)
+                lagging.sync()
+        stored = len(capped.fetch_since('busy', 0))
+        if stored > capped.max_actions_per_tab:
+            failures += 1
+            print(f"  ✗ {stored} actions kept for a tab compacted at {capped.max_actions_per_tab}")
+        expected = _replayed(reference)
+        for name, session in [('recording', busy), ('lagging', lagging), ('fresh', PredictionSession('busy', capped))]:
+            if _replayed(session) != expected:
+                failures += 1
+                print(f"  ✗ {name} worker's history differs after compaction")
+
+        # Idle tabs are cleared everywhere; tabs that only predict stay active
+        capped.save_page('quiet', 'old', 'https://example.com', elements, MAX_PAGE_SNAPSHOTS)
+        capped.append('reader', elements[0], 'click')
+        capped._connect().execute("UPDATE actions SET created = created - 3600 WHERE tab_id = 'reader'")
+        capped._connect().execute("UPDATE tabs SET last_active = last_active - 3600 WHERE tab_id = 'quiet'")
+        capped.purge_idle(1800)
+        if quiet.get_history_summary()['actions'] or capped.fetch_page('quiet', 'old') is not None or \
+                not capped.fetch_since('reader', 0) or _replayed(PredictionSession('busy', capped)) != expected:
+            failures += 1
+            print("  ✗ purge_idle did not clear only the idle tab")
+        capped._connect().execute("UPDATE actions SET created = created - 3600 WHERE tab_id = 'quiet'")
+        capped.purge_idle(1800)
+        if capped.fetch_since('quiet', 0) or PredictionSession('quiet', capped).get_history_summary()['actions']:
+            failures += 1
+            print("  ✗ reset marker of a purged tab was kept")
+
+    print(f"Shared history ({workers} processes): {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+async def _supersede_then_repeat(step: float = 0.05) -> List:
+    """Outcomes of requests A (key X), B (key Y), C (key X) arriving in turn"""
+    import asyncio
+    from request_scheduler import RequestScheduler, Superseded
+    scheduler = RequestScheduler(max_concurrent=4)
+
+    def slow(name: str):
+        def handler(superseded):
+            time.sleep(step)  # One slow step, A is still running when C arrives
+            return None if superseded() else name
+        return handler
+
+    async def outcome(name: str, key: str):
+        try:
+            return await scheduler.run('tab', 'route', slow(name), key=key)
+        except Superseded:
+            return Superseded
+
+    tasks = []
+    for name, key in [('A', 'X'), ('B', 'Y'), ('C', 'X')]:
+        tasks.append(asyncio.ensure_future(outcome(name, key)))
+        await asyncio.sleep(step / 10)
+    return list(await asyncio.gather(*tasks))
+
+
+def check_async_service(n: int = 300, burst: int = 12) -> int:
+    """
+    Fire bursts at the ASGI service: duplicates must share one prediction,
+    older requests of a tab must be superseded by the newest, the newest must
+    match the Flask service, and a full queue must answer 503.
+    """
+    import asyncio
+    import logging
+    import prediction_api
+    import predictor_service
+    import predictor_service_async as service
+    from request_scheduler import RequestScheduler, Superseded
+    logging.getLogger('predictor_service').setLevel(logging.WARNING)
+    elements = make_elements(n)
+    failures = 0
+
+    def body(i: int) -> Dict:
+        return {'tab_id': 'burst', 'current_element': elements[i % n], 'all_elements': elements,
+                'page_url': 'https://example.com', 'top_k': 3}
+
+    async def fire(payloads):
+        client = service.app.test_client()
+        responses = await asyncio.gather(*[client.post('/predict/next-element', json=p) for p in payloads])
+        return [(r.status_code, await r.get_json()) for r in responses]
+
+    prediction_api.prediction_sessions = SessionStore()
+    service.scheduler = RequestScheduler(max_concurrent=2)
+    start = time.perf_counter()
+    results = asyncio.run(fire([body(i) for i in range(burst)] + [body(burst - 1)] * 3))
+    elapsed = time.perf_counter() - start
+
+    expected = predictor_service.app.test_client().post(
+        '/predict/next-element', json=body(burst - 1)).get_json()
+    statuses = Counter(status for status, _ in results)
+    if any(status != 200 or payload != expected for status, payload in results[burst - 1:]):
+        failures += 1
+        print("  ✗ newest request (and its duplicates) did not get the full prediction")
+    # 409 is reserved for unknown snapshots, clients re-register the page on it
+    superseded = service.SUPERSEDED_STATUS
+    if statuses[superseded] == 0 or set(statuses) - {200, superseded} or any(
+            not payload.get('superseded') for status, payload in results if status == superseded):
+        failures += 1
+        print(f"  ✗ unexpected statuses {dict(statuses)}")
+    counters = service.scheduler.stats()
+    if counters['coalesced'] < 3:
+        failures += 1
+        print(f"  ✗ duplicates not coalesced: {counters}")
+
+    # A (X) runs, B (Y) supersedes it, then C (X again) must not join A's stale job
+    if asyncio.run(_supersede_then_repeat()) != [Superseded, Superseded, 'C']:
+        failures += 1
+        print("  ✗ newest request joined a superseded job")
+
+    service.scheduler = RequestScheduler(max_concurrent=1, max_pending=2)
+    overload = asyncio.run(fire([dict(body(i), tab_id=f'tab-{i}') for i in range(8)]))
+    if Counter(status for status, _ in overload)[503] == 0:
+        failures += 1
+        print("  ✗ no backpressure when the queue was full")
+
+    print(f"Async burst of {burst + 3}: {dict(statuses)} in {elapsed * 1000:.0f} ms, "
+          f"executed {counters['executed']}, coalesced {counters['coalesced']}, "
+          f"superseded {counters['superseded']}")
+    print(f"Async service: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+# ============================================================================
+# MODEL INFERENCE
+# ============================================================================
+
+def tiny_element_model(tmp: str):
+    """Randomly initialized ElementFocusedModel on a small DistilBERT, no download needed"""
+    import torch
+    import transformers
+    from transformers import BertTokenizerFast, DistilBertConfig, DistilBertModel
+    from element_model import ElementFocusedConfig, ElementFocusedModel
+    transformers.logging.disable_progress_bar()
+
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '|', ':', '(', ')', '[', ']', 'task', 'current',
+             'page', 'history', 'none', 'button', 'input', 'link', 'a', 'search', 'submit']
+    vocab += [w for w in WORDS if w not in vocab] + [str(i) for i in range(100)]
+    with open(os.path.join(tmp, 'vocab.txt'), 'w') as f:
+        f.write('\n'.join(vocab))
+    tokenizer = BertTokenizerFast(os.path.join(tmp, 'vocab.txt'))
+    torch.manual_seed(0)
+    DistilBertModel(DistilBertConfig(
+        vocab_size=len(vocab), dim=64, n_layers=2, n_heads=2, hidden_dim=128, max_position_embeddings=512
+    )).save_pretrained(tmp)
+
+    config = ElementFocusedConfig(encoder_model=tmp, hidden_size=64, fusion_hidden_size=32, vocab_size=len(vocab))
+    model = ElementFocusedModel(config).eval()
+    return model, tokenizer, torch.device('cpu'), config
+
+
+def model_examples(count: int, seed: int = 0) -> List[Tuple[str, str, str, List[Dict]]]:
+    """(task, page_summary, prev_actions, elements) examples over synthetic pages"""
+    rng = random.Random(seed)
+    examples = []
+    for i in range(count):
+        elements = [
+            dict(e, type=e['tag'], purpose=rng.choice(['button', 'link', 'search', 'input']))
+            for e in make_elements(rng.randint(3, 25), seed=seed * 1000 + i)
+        ]
+        examples.append((rng.choice(INSTRUCTIONS), 'Page ' + rng.choice(WORDS), 'None', elements))
+    return examples
+
+
+def check_model_server(requests: int = 48) -> int:
+    """Micro-batched predictions match running each example alone"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Model server: skipped (torch / transformers missing)")
+        return 0
+    import torch.nn.functional as F
+    from element_model import prepare_input
+    from model_server import ModelServer, format_predictions
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        examples = model_examples(requests)
+        expected = []
+        with torch.no_grad():
+            for task, page, prev, elements in examples:
+                logits = model(**prepare_input(task, page, prev, elements, tokenizer, config, device))['element_logits']
+                probs = F.softmax(logits[0], dim=0).tolist()
+                expected.append(format_predictions(elements[:config.num_element_candidates], probs, 3))
+
+        server = ModelServer(model, tokenizer, device, config, max_batch_size=16, max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda ex: server.predict(*ex, top_k=3), examples + examples[:8]))
+        for got, want in zip(results, expected + expected[:8]):
+            if [p['element_idx'] for p in got] != [p['element_idx'] for p in want] or any(
+                    abs(a['confidence'] - b['confidence']) > 0.11 for a, b in zip(got, want)):
+                failures += 1
+                print(f"  ✗ batched prediction differs: {got} vs {want}")
+        stats = server.stats()
+        server.close()
+        if stats['batches'] >= requests or stats['cache_hits'] + stats['coalesced'] < 8:
+            failures += 1
+            print(f"  ✗ requests were not batched / cached: {stats}")
+
+    print(f"Model server: {stats['batches']} batches for {stats['requests']} requests "
+          f"(mean size {stats['mean_batch_size']}): {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def check_dynamic_padding(count: int = 24) -> int:
+    """Content padded to its length bucket gives the same outputs as padding to max_content_length"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Dynamic padding: skipped (torch / transformers missing)")
+        return 0
+    from dataclasses import replace
+    from element_model import encode_batch, format_content, format_task
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        model.encoder_cache = None
+        examples = model_examples(count, seed=2)
+        tasks = [format_task(task, page, prev) for task, page, prev, _ in examples]
+        contents = [format_content(elements, config) for *_, elements in examples]
+        full = replace(config, content_length_bucket=0)
+
+        with torch.inference_mode():
+            expected = model(**encode_batch(tasks, contents, tokenizer, full, device))
+            batched = model(**encode_batch(tasks, contents, tokenizer, config, device))
+            single = [model(**encode_batch([t], [c], tokenizer, config, device)) for t, c in zip(tasks, contents)]
+            padded = encode_batch(tasks[:1], contents[:1], tokenizer, config, device)['content_input_ids'].shape[1]
+
+        for name in ('element_logits', 'ranking_logits', 'value_logits'):
+            if not torch.allclose(batched[name], expected[name], atol=1e-5):
+                failures += 1
+                print(f"  ✗ batch with dynamic padding changes {name}")
+            if not torch.allclose(torch.cat([out[name] for out in single]), expected[name], atol=1e-5):
+                failures += 1
+                print(f"  ✗ single examples with dynamic padding change {name}")
+        if padded >= config.max_content_length or padded % config.content_length_bucket:
+            failures += 1
+            print(f"  ✗ content padded to {padded} tokens")
+
+    print(f"Dynamic padding: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def bench_dynamic_padding(requests: int = 128, batch_size: int = 16):
+    """Batched forward passes with content padded to max_content_length vs length buckets"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        return
+    from dataclasses import replace
+    from element_model import bucket_by_length, encode_batch, format_content, format_task
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        model.encoder_cache = None
+        examples = model_examples(requests, seed=3)
+        tasks = [format_task(task, page, prev) for task, page, prev, _ in examples]
+        contents = [format_content(elements, config) for *_, elements in examples]
+
+        timings = {}
+        for label, cfg in (('max_length', replace(config, content_length_bucket=0)), ('bucketed', config)):
+            start = time.perf_counter()
+            with torch.inference_mode():
+                for i in range(0, requests, batch_size):
+                    batch_tasks, batch_contents = tasks[i:i + batch_size], contents[i:i + batch_size]
+                    for positions in bucket_by_length(batch_contents, tokenizer, cfg).values():
+                        model(**encode_batch([batch_tasks[p] for p in positions],
+                                             [batch_contents[p] for p in positions], tokenizer, cfg, device))
+            timings[label] = requests / (time.perf_counter() - start)
+
+    print(f"Content padding ({requests} requests in batches of {batch_size}, tiny encoder):")
+    print(f"  max_length: {timings['max_length']:7.1f} requests/s")
+    print(f"  bucketed:   {timings['bucketed']:7.1f} requests/s ({timings['bucketed'] / timings['max_length']:.1f}x)")
+
+
+def check_joint_encoding(count: int = 12) -> int:
+    """One deduplicated encoder pass gives the same logits as encoding task and content separately"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Joint encoding: skipped (torch / transformers missing)")
+        return 0
+    from dataclasses import replace
+    from element_model import encode_batch, format_content, format_task
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        model.encoder_cache = None
+        passes = []
+        model.encoder.register_forward_hook(lambda module, args, output: passes.append(tuple(args[0].shape)))
+        examples = model_examples(count, seed=4)
+        # Every task twice and every page twice, so rows repeat within the batch
+        tasks = [format_task(task, page, prev) for task, page, prev, _ in examples[:count // 2]] * 2
+        contents = [format_content(elements, config) for *_, elements in examples[::2]] * 2
+
+        for cfg in (config, replace(config, content_length_bucket=0)):
+            inputs = encode_batch(tasks, contents, tokenizer, cfg, device)
+            with torch.inference_mode():
+                expected = model.fuse(
+                    model.encoder(inputs['task_input_ids'], inputs['task_attention_mask']).last_hidden_state,
+                    inputs['task_attention_mask'],
+                    model.encoder(inputs['content_input_ids'], inputs['content_attention_mask']).last_hidden_state,
+                    inputs['content_attention_mask']
+                )
+                passes.clear()
+                got = model(**inputs)
+            if any(not torch.allclose(got[name], expected[name], atol=1e-5) for name in expected):
+                failures += 1
+                print(f"  ✗ joint encoding changes the logits (bucket {cfg.content_length_bucket})")
+            rows = sum(rows for rows, _ in passes)
+            if rows != len(set(tasks)) + len(set(contents)):
+                failures += 1
+                print(f"  ✗ encoded {rows} rows in passes {passes}, expected one per unique sequence")
+
+    print(f"Joint encoding: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def check_encoder_cache(steps: int = 6) -> int:
+    """Cached encoder outputs give the same logits; a page's content is encoded once across task steps"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Encoder cache: skipped (torch / transformers missing)")
+        return 0
+    from element_model import encode_batch, format_content
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        cache, model.encoder_cache = model.encoder_cache, None
+        _, _, _, elements = model_examples(1)[0]
+        content = format_content(elements, config)
+        tasks = [f"Task: {instruction} | Current page: Page | History: step {i}"
+                 for i, instruction in enumerate(INSTRUCTIONS[:steps])]
+        batches = [encode_batch(tasks[:i + 1], [content] * (i + 1), tokenizer, config, device)
+                   for i in range(steps)]
+        with torch.inference_mode():
+            expected = [model(**inputs)['element_logits'] for inputs in batches]
+            model.encoder_cache = cache
+            got = [model(**inputs)['element_logits'] for inputs in batches]
+
+        if any(not torch.allclose(a, b, atol=1e-5) for a, b in zip(got, expected)):
+            failures += 1
+            print("  ✗ cached encoder outputs change the logits")
+        stats = cache.stats()
+        # One content row and one row per task; every other lookup hits
+        if stats['rows'] != steps + 1 or stats['misses'] != steps + 1:
+            failures += 1
+            print(f"  ✗ unexpected cache use: {stats}")
+
+    print(f"Encoder cache ({steps} task steps on one page): {stats['hits']} hits, {stats['misses']} misses: "
+          f"{'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def check_quantized_model(count: int = 24) -> int:
+    """
+    The exported int8 artifact loads back into a quantized model with the
+    same outputs, and stays close to the fp32 model it came from.
+    """
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Quantized model: skipped (torch / transformers missing)")
+        return 0
+    import torch.nn.functional as F
+    from element_model import ElementFocusedModel, prepare_input, quantize_model
+    from export_model import export_quantized
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        path = export_quantized(model, tmp)
+        loaded = quantize_model(ElementFocusedModel(config))
+        loaded.load_state_dict(torch.load(path, weights_only=True))
+        loaded.eval()
+        quantized = quantize_model(model)
+
+        agree, max_diff = 0, 0.0
+        with torch.inference_mode():
+            for task, page, prev, elements in model_examples(count, seed=2):
+                inputs = prepare_input(task, page, prev, elements, tokenizer, config, device)
+                expected, got, reloaded = model(**inputs), quantized(**inputs), loaded(**inputs)
+                if expected.keys() != got.keys() or any(
+                    not torch.equal(got[key], reloaded[key]) for key in got
+                ):
+                    failures += 1
+                    print("  ✗ reloaded int8 artifact gives different outputs")
+                probs = F.softmax(expected['element_logits'], dim=-1)
+                int8_probs = F.softmax(got['element_logits'], dim=-1)
+                agree += int(probs.argmax() == int8_probs.argmax())
+                max_diff = max(max_diff, (probs - int8_probs).abs().max().item())
+
+    # Random weights give near-uniform probabilities, so only gross errors fail
+    if max_diff > 0.05:
+        failures += 1
+        print(f"  ✗ int8 probabilities drift {max_diff:.3f} from fp32")
+    print(f"Quantized model ({count} examples): top-1 agreement {agree}/{count}, "
+          f"max prob. diff {max_diff:.4f}: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def check_head_selection(count: int = 24) -> int:
+    """
+    Requested heads give the full model's logits; the server decodes values
+    only for examples whose best element is a text input, and decodes the
+    same token the full value head picks.
+    """
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Head selection: skipped (torch / transformers missing)")
+        return 0
+    import torch.nn.functional as F
+    from element_model import encode_batch, format_content, format_task
+    from model_server import ModelServer, _best_takes_text
+    from page_index import infer_action
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        examples = model_examples(count, seed=5)
+        inputs = encode_batch([format_task(task, page, prev) for task, page, prev, _ in examples],
+                              [format_content(elements, config) for *_, elements in examples],
+                              tokenizer, config, device)
+        with torch.inference_mode():
+            full = model(**inputs)
+            element_only = model(**inputs, heads=('element',))
+            rows = list(range(0, count, 3))
+            values = model.value_logits(element_only['pooled'], rows)
+        if set(element_only) != {'pooled', 'element_logits'}:
+            failures += 1
+            print(f"  ✗ element-only outputs: {sorted(element_only)}")
+        if not torch.allclose(element_only['element_logits'], full['element_logits'], atol=1e-5) or \
+                not torch.allclose(values, full['value_logits'][rows], atol=1e-5):
+            failures += 1
+            print("  ✗ selected heads change the logits")
+
+        probs = F.softmax(full['element_logits'], dim=-1).tolist()
+        expected = []
+        for (*_, elements), row_probs, token_id in zip(examples, probs, full['value_logits'].argmax(-1).tolist()):
+            text_inputs = tuple(infer_action(e) == 'input' for e in elements[:config.num_element_candidates])
+            typing = _best_takes_text(row_probs, text_inputs)
+            expected.append(tokenizer.decode([token_id], skip_special_tokens=True) if typing else None)
+
+        server = ModelServer(model, tokenizer, device, config, max_batch_size=8, max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda ex: server.predict(*ex), examples))
+        stats = server.stats()
+        server.close()
+        for got, value in zip(results, expected):
+            if got[0].get('value') != value:
+                failures += 1
+                print(f"  ✗ value {got[0].get('value')!r}, expected {value!r}")
+        decoded = sum(value is not None for value in expected)
+        if stats['values_decoded'] != decoded:
+            failures += 1
+            print(f"  ✗ {stats['values_decoded']} values decoded, {decoded} examples type")
+
+    print(f"Head selection: values decoded for {stats['values_decoded']}/{count} examples: "
+          f"{'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def bench_head_selection(batch_size: int = 16, repeats: int = 50):
+    """Fusion and heads with every head vs the element head only, full-size vocabulary"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        return
+    from dataclasses import replace
+    from element_model import ElementFocusedModel, encode_batch, format_content, format_task
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _, tokenizer, device, config = tiny_element_model(tmp)
+        # value_head is sized by the vocabulary, give it DistilBERT's
+        model = ElementFocusedModel(replace(config, vocab_size=30522, fusion_hidden_size=384)).eval()
+        examples = model_examples(batch_size, seed=6)
+        inputs = encode_batch([format_task(task, page, prev) for task, page, prev, _ in examples],
+                              [format_content(elements, config) for *_, elements in examples],
+                              tokenizer, config, device)
+        timings = {}
+        with torch.inference_mode():
+            task_states, content_states = model.encode_batches([
+                (inputs['task_input_ids'], inputs['task_attention_mask']),
+                (inputs['content_input_ids'], inputs['content_attention_mask'])
+            ])
+            for label, heads in (('all heads', ('element', 'ranking', 'value')), ('element only', ('element',))):
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    model.fuse(task_states, inputs['task_attention_mask'],
+                               content_states, inputs['content_attention_mask'], heads)
+                timings[label] = (time.perf_counter() - start) / repeats * 1000
+
+    print(f"Fusion + heads (batch of {batch_size}, vocab 30522):")
+    print(f"  all heads:    {timings['all heads']:7.2f} ms/batch")
+    print(f"  element only: {timings['element only']:7.2f} ms/batch "
+          f"({timings['all heads'] / timings['element only']:.1f}x)")
+
+
+def check_fast_load() -> int:
+    """
+    Checkpoints loaded by load_weights, memory-mapped into an architecture
+    built without weights, give the saved model's outputs; the encoder
+    stays frozen.
+    """
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        print("Fast load: skipped (torch / transformers missing)")
+        return 0
+    from element_model import QUANTIZED_WEIGHTS, load_weights, prepare_input, quantize_model, warm_up
+    from export_model import export_quantized
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        torch.save(model.state_dict(), os.path.join(tmp, 'model.pt'))
+        export_quantized(model, tmp)
+        loaded, _ = load_weights(config, os.path.join(tmp, 'model.pt'))
+        loaded_int8, _ = load_weights(config, os.path.join(tmp, QUANTIZED_WEIGHTS), quantized=True)
+        quantized = quantize_model(model)
+        warm_up(loaded, tokenizer, config, device)
+
+        if any(param.requires_grad for param in loaded.encoder.parameters()):
+            failures += 1
+            print("  ✗ loaded encoder is not frozen")
+        if loaded.encoder_cache.stats()['rows']:
+            failures += 1
+            print("  ✗ warm-up left rows in the encoder cache")
+        with torch.inference_mode():
+            for task, page, prev, elements in model_examples(8, seed=7):
+                inputs = prepare_input(task, page, prev, elements, tokenizer, config, device)
+                for reference, candidate, label in ((model, loaded, 'fp32'), (quantized, loaded_int8, 'int8')):
+                    expected, got = reference(**inputs), candidate(**inputs)
+                    if any(not torch.equal(expected[key], got[key]) for key in expected):
+                        failures += 1
+                        print(f"  ✗ {label} checkpoint loads with different outputs")
+
+    print(f"Fast load: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def bench_cold_start():
+    """Building and loading a DistilBERT-sized model: pretrained encoder + full read vs load_weights"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+        from transformers import DistilBertConfig, DistilBertModel
+    except ImportError:
+        return
+    from element_model import ElementFocusedConfig, ElementFocusedModel, load_weights
+    transformers.logging.disable_progress_bar()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        DistilBertModel(DistilBertConfig()).save_pretrained(tmp)
+        config = ElementFocusedConfig(encoder_model=tmp)
+        path = os.path.join(tmp, 'model.pt')
+        torch.save(ElementFocusedModel(config).state_dict(), path)
+
+        start = time.perf_counter()
+        model = ElementFocusedModel(config)
+        model.load_state_dict(torch.load(path, weights_only=True))
+        full = time.perf_counter() - start
+        del model
+
+        start = time.perf_counter()
+        load_weights(config, path)
+        fast = time.perf_counter() - start
+
+    print("Model cold start (DistilBERT-sized, random weights):")
+    print(f"  pretrained encoder + torch.load: {full:6.2f} s")
+    print(f"  load_weights (no init, mmap):    {fast:6.2f} s ({full / fast:.1f}x)")
+
+
+def check_model_registry(workers: int = 8) -> int:
+    """
+    Registered files come back byte for byte from a read-only snapshot that
+    concurrent workers share; identical content resolves to the same
+    snapshot in any registry, corrupt objects are reported, and
+    load_model_from_drive loads tokenizer, encoder and weights from it offline.
+    """
+    import stat
+    from model_registry import ModelRegistry, RegistryError
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        os.makedirs(os.path.join(source, 'nested'))
+        contents = {'a.bin': os.urandom(4096), 'nested/b.txt': b'hello', 'same.txt': b'hello'}
+        for relpath, data in contents.items():
+            with open(os.path.join(source, *relpath.split('/')), 'wb') as f:
+                f.write(data)
+
+        registry = ModelRegistry(os.path.join(tmp, 'registry'))
+        registry.add('model', source)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            paths = set(pool.map(lambda _: registry.path('model'), range(workers)))
+        path = paths.pop()
+        for relpath, data in contents.items():
+            target = os.path.join(path, *relpath.split('/'))
+            with open(target, 'rb') as f:
+                if f.read() != data:
+                    failures += 1
+                    print(f"  ✗ {relpath} changed in the snapshot")
+            if os.stat(target).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH):
+                failures += 1
+                print(f"  ✗ {relpath} is writable in the snapshot")
+        if paths:
+            failures += 1
+            print(f"  ✗ concurrent checkouts gave different snapshots: {paths | {path}}")
+
+        other = ModelRegistry(os.path.join(tmp, 'other'))
+        other.add('copy', source)
+        if os.path.basename(other.path('copy')) != os.path.basename(path):
+            failures += 1
+            print("  ✗ identical content resolves to different snapshots")
+
+        # Same content is stored once
+        objects = [name for _, _, names in os.walk(os.path.join(registry.root, 'objects')) for name in names]
+        if len(objects) != 2:
+            failures += 1
+            print(f"  ✗ {len(objects)} objects for 2 distinct files")
+
+        entry = registry.manifest('model')['files']['a.bin']
+        obj = os.path.join(registry.root, 'objects', entry['sha256'][:2], entry['sha256'])
+        os.chmod(obj, stat.S_IRUSR | stat.S_IWUSR)
+        with open(obj, 'r+b') as f:
+            f.write(b'corrupt')
+        try:
+            registry.path('model', verify=True)
+            failures += 1
+            print("  ✗ corrupt object passed verification")
+        except RegistryError:
+            pass
+        if registry.verify('model') != ['a.bin']:
+            failures += 1
+            print(f"  ✗ verify reported {registry.verify('model')}")
+
+        failures += _check_offline_load(tmp)
+
+    print(f"Model registry: {'✅ OK' if failures == 0 else f'❌ {failures} failures'}")
+    return failures
+
+
+def _check_offline_load(tmp: str) -> int:
+    """load_model_from_drive from a registry holding a small encoder and its fine-tuned weights"""
+    try:
+        import torch
+        import transformers
+        from transformers import DistilBertConfig, DistilBertModel
+    except ImportError:
+        print("  offline load skipped (torch / transformers missing)")
+        return 0
+    from element_model import (ENCODER_NAME, MODEL_NAME, MODEL_WEIGHTS, ElementFocusedConfig,
+                               ElementFocusedModel, load_model_from_drive, prepare_input)
+    from model_registry import ModelRegistry
+
+    # Default ElementFocusedConfig sizes over a one-layer encoder
+    encoder_dir, weights_dir = os.path.join(tmp, 'encoder'), os.path.join(tmp, 'weights')
+    os.makedirs(weights_dir)
+    _, tokenizer, device, _ = tiny_element_model(tmp)
+    torch.manual_seed(0)
+    DistilBertModel(DistilBertConfig(vocab_size=tokenizer.vocab_size, n_layers=1, hidden_dim=256)
+                    ).save_pretrained(encoder_dir)
+    tokenizer.save_pretrained(encoder_dir)
+    model = ElementFocusedModel(ElementFocusedConfig(encoder_model=encoder_dir)).eval()
+    torch.save(model.state_dict(), os.path.join(weights_dir, MODEL_WEIGHTS))
+
+    registry = ModelRegistry(os.path.join(tmp, 'offline'))
+    registry.add(ENCODER_NAME, encoder_dir)
+    registry.add(MODEL_NAME, weights_dir)
+    offline = os.environ.get('HF_HUB_OFFLINE')
+    os.environ['HF_HUB_OFFLINE'] = '1'
+    try:
+        loaded, loaded_tokenizer, loaded_device, config = load_model_from_drive(registry=registry, verify=True)
+    finally:
+        if offline is None:
+            del os.environ['HF_HUB_OFFLINE']
+        else:
+            os.environ['HF_HUB_OFFLINE'] = offline
+
+    failures = 0
+    with torch.inference_mode():
+        for task, page, prev, elements in model_examples(4, seed=8):
+            expected = model(**prepare_input(task, page, prev, elements, tokenizer, config, device))
+            got = loaded(**prepare_input(task, page, prev, elements, loaded_tokenizer, config, loaded_device))
+            if any(not torch.allclose(expected[key], got[key].cpu(), atol=1e-5) for key in expected):
+                failures += 1
+                print("  ✗ model loaded from the registry gives different outputs")
+    return failures
+
+
+def bench_encoder_cache(steps: int = 20):
+    """Multi-step task on one page, one instruction per forward pass"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        return
+    from element_model import prepare_input
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        _, page, _, elements = model_examples(1)[0]
+        inputs = [prepare_input(INSTRUCTIONS[i % len(INSTRUCTIONS)], page, f"Step {i}", elements,
+                                tokenizer, config, device) for i in range(steps)]
+        cache = model.encoder_cache
+
+        timings = {}
+        for label, enabled in (('no cache', None), ('encoder cache', cache)):
+            model.encoder_cache = enabled
+            start = time.perf_counter()
+            with torch.inference_mode():
+                for batch in inputs:
+                    model(**batch)
+            timings[label] = (time.perf_counter() - start) * 1000 / steps
+
+    print(f"Multi-step task ({steps} steps on one page, tiny encoder):")
+    print(f"  no cache:      {timings['no cache']:7.2f} ms/step")
+    print(f"  encoder cache: {timings['encoder cache']:7.2f} ms/step "
+          f"({timings['no cache'] / timings['encoder cache']:.1f}x)")
+
+
+def bench_model_server(requests: int = 256, threads: int = 32):
+    """Throughput of one example per forward pass vs micro-batched concurrent requests"""
+    try:
+        import torch
+        import transformers  # noqa: F401
+    except ImportError:
+        return
+    from element_model import prepare_input
+    from model_server import ModelServer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model, tokenizer, device, config = tiny_element_model(tmp)
+        # Distinct examples, so the result cache never answers
+        examples = model_examples(requests, seed=1)
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for task, page, prev, elements in examples:
+                model(**prepare_input(task, page, prev, elements, tokenizer, config, device))
+        single = requests / (time.perf_counter() - start)
+
+        server = ModelServer(model, tokenizer, device, config)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda ex: server.predict(*ex), examples))
+        batched = requests / (time.perf_counter() - start)
+        stats = server.stats()
+        server.close()
+
+    print(f"Model inference ({requests} requests, {threads} client threads, tiny encoder):")
+    print(f"  one at a time: {single:7.1f} requests/s")
+    print(f"  micro-batched: {batched:7.1f} requests/s ({batched / single:.1f}x), "
+          f"mean batch {stats['mean_batch_size']}")
+
+
+if __name__ == '__main__':
+    failures = check_text_parity()
+    failures += check_selector_parity()
+    failures += check_top_k_parity()
+    failures += check_score_bounds()
+    failures += check_proximity_parity()
+    failures += check_delta_parity()
+    failures += check_history_parity()
+    failures += check_predictor_parity()
+    failures += check_bulk_parity()
+    failures += check_session_store()
+    failures += stress_service()
+    failures += check_shared_history()
+    failures += check_async_service()
+    failures += check_codecs()
+    failures += check_model_server()
+    failures += check_dynamic_padding()
+    failures += check_joint_encoding()
+    failures += check_encoder_cache()
+    failures += check_quantized_model()
+    failures += check_head_selection()
+    failures += check_fast_load()
+    failures += check_model_registry()
+    check_prefilter_recall()
+    bench_selector()
+    bench_proximity()
+    bench_delta()
+    bench_codecs()
+    bench_history_lookup()
+    bench_bulk_predict()
+    bench_model_server()
+    bench_encoder_cache()
+    bench_dynamic_padding()
+    bench_head_selection()
+    bench_cold_start()
+    print(f"Text caches: {text_cache_stats()}")
+    raise SystemExit(1 if failures else 0)
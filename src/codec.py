@@ -0,0 +1,113 @@
+"""
+Wire Codecs
+Request and response body encoding for the prediction services.
+JSON is encoded with orjson when installed (stdlib json otherwise).
+MessagePack is offered when msgpack is installed: clients select it with
+Content-Type for request bodies and Accept for responses.
+"""
+
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+class UnsupportedMediaType(ValueError):
+    """Request body in a content type no installed codec reads"""
+
+
+class Codec:
+    """Encoder / decoder pair for one content type"""
+
+    def __init__(self, mimetype: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]):
+        self.mimetype = mimetype
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return f'Codec({self.mimetype})'
+
+
+def _to_builtin(obj):
+    """Fallback for NumPy scalars and arrays reaching the encoder"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f'Cannot serialize {type(obj).__name__}')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_to_builtin, option=_ORJSON_OPTIONS)
+
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, default=_to_builtin, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    _json_loads = json.loads
+
+JSON = Codec(JSON_TYPE, _json_dumps, _json_loads)
+
+if msgpack is not None:
+    MSGPACK = Codec(
+        MSGPACK_TYPES[0],
+        lambda obj: msgpack.packb(obj, use_bin_type=True, default=_to_builtin),
+        lambda body: msgpack.unpackb(body, raw=False, strict_map_key=False)
+    )
+else:
+    MSGPACK = None
+
+
+def _media_types(header: Optional[str]):
+    """Media types of a Content-Type / Accept header, parameters and q-values dropped"""
+    for part in (header or '').split(','):
+        media_type = part.split(';', 1)[0].strip().lower()
+        if media_type:
+            yield media_type
+
+
+def request_codec(content_type: Optional[str]) -> Codec:
+    """Codec for a request body; bodies without a Content-Type are read as JSON"""
+    media_type = next(_media_types(content_type), JSON_TYPE)
+    if media_type in MSGPACK_TYPES:
+        if MSGPACK is None:
+            raise UnsupportedMediaType('MessagePack bodies need the msgpack package on the server')
+        return MSGPACK
+    if media_type == JSON_TYPE or media_type.endswith('+json'):
+        return JSON
+    raise UnsupportedMediaType(f'Unsupported Content-Type: {media_type}')
+
+
+def response_codec(accept: Optional[str]) -> Codec:
+    """MessagePack if the client asks for it and msgpack is installed, JSON otherwise"""
+    if MSGPACK is not None:
+        for media_type in _media_types(accept):
+            if media_type in MSGPACK_TYPES:
+                return MSGPACK
+            if media_type == JSON_TYPE:
+                break
+    return JSON
+
+
+def decode(body: bytes, content_type: Optional[str]) -> Any:
+    """Parse a request body, None if empty. Raises ValueError on malformed bodies."""
+    if not body:
+        return None
+    codec = request_codec(content_type)
+    try:
+        return codec.loads(body)
+    except Exception as e:
+        raise ValueError(f'Malformed {codec.mimetype} body: {e}') from None
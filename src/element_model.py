@@ -0,0 +1,553 @@
+"""
+Element-Focused Model
+Model architecture, loading and input preparation shared by test.py and
+the inference server (model_server.py). transformers is imported on
+first model or tokenizer load, not on import. Tokenizer, encoder and
+weights are loaded offline from the local model registry (model_registry.py).
+"""
+
+import contextlib
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import torch
+from dataclasses import dataclass
+
+
+# ============================================================================
+# Configuration (must match training config)
+# ============================================================================
+
+@dataclass
+class ElementFocusedConfig:
+    encoder_model: str = "distilbert-base-uncased"  # Hub name or local directory
+    hidden_size: int = 768
+    fusion_hidden_size: int = 384
+    num_fusion_layers: int = 2
+    max_task_length: int = 128
+    max_content_length: int = 512
+    max_page_text_length: int = 256
+    num_element_candidates: int = 20
+    dropout: float = 0.4
+    max_value_length: int = 64
+    vocab_size: int = 30522
+    freeze_encoders: bool = True
+    encoder_cache_bytes: int = 256 * 1024 * 1024  # Inference only, 0 disables the cache
+    content_length_bucket: int = 64  # Content padded up to a multiple of this, 0 pads to max_content_length
+
+# Sequences of different lengths share an encoder pass while padding them to
+# the longest costs at most this factor of their own lengths
+JOINT_PADDING_SLACK = 1.25
+
+# Output heads; inference callers ask only for the logits they read
+HEADS = ('element', 'ranking', 'value')
+
+# ============================================================================
+# Model Architecture (must match training)
+# ============================================================================
+
+class ContrastiveFusion(torch.nn.Module):
+    def __init__(self, hidden_size, dropout=0.4):
+        super().__init__()
+        self.cross_attn = torch.nn.MultiheadAttention(
+            hidden_size, num_heads=8, dropout=dropout, batch_first=True
+        )
+        self.self_attn = torch.nn.MultiheadAttention(
+            hidden_size, num_heads=8, dropout=dropout, batch_first=True
+        )
+        self.norm1 = torch.nn.LayerNorm(hidden_size)
+        self.norm2 = torch.nn.LayerNorm(hidden_size)
+        self.dropout = torch.nn.Dropout(dropout)
+        
+        self.ffn = torch.nn.Sequential(
+            torch.nn.Linear(hidden_size, hidden_size * 2),
+            torch.nn.GELU(),
+            torch.nn.Dropout(dropout),
+            torch.nn.Linear(hidden_size * 2, hidden_size),
+            torch.nn.Dropout(dropout)
+        )
+        self.norm3 = torch.nn.LayerNorm(hidden_size)
+
+    def forward(self, query, key_value, key_mask=None):
+        attn_out, _ = self.cross_attn(query, key_value, key_value, key_padding_mask=key_mask)
+        query = self.norm1(query + self.dropout(attn_out))
+        
+        self_out, _ = self.self_attn(query, query, query)
+        query = self.norm2(query + self.dropout(self_out))
+        
+        ffn_out = self.ffn(query)
+        query = self.norm3(query + ffn_out)
+        
+        return query
+
+
+class EncoderCache:
+    """
+    LRU cache of frozen-encoder outputs, one last_hidden_state row per
+    tokenized sequence, bounded in bytes. Keys hash a row's token ids and
+    attention mask, padding included: padded task positions take part in
+    the fusion self-attention, so they are part of the result.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    def __getstate__(self):
+        # Copies of the model (deepcopy, quantization) start with an empty cache
+        return {'max_bytes': self.max_bytes}
+    
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+    
+    @staticmethod
+    def keys(input_ids, attention_mask):
+        ids = input_ids.cpu().numpy()
+        mask = attention_mask.cpu().numpy()
+        return [
+            hashlib.blake2b(row.tobytes() + row_mask.tobytes(), digest_size=16).digest()
+            for row, row_mask in zip(ids, mask)
+        ]
+    
+    def get(self, key):
+        with self.lock:
+            row = self._entries.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return row
+    
+    def put(self, key, row):
+        # Own storage, so a cached row does not pin its whole batch
+        row = row.detach().clone()
+        nbytes = row.element_size() * row.nelement()
+        with self.lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.element_size() * old.nelement()
+            self._entries[key] = row
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.element_size() * evicted.nelement()
+    
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self.total_bytes = 0
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'rows': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class ElementFocusedModel(torch.nn.Module):
+    def __init__(self, config: ElementFocusedConfig, pretrained_encoder: bool = True):
+        super().__init__()
+        self.config = config
+
+        from transformers import AutoConfig, AutoModel
+        if pretrained_encoder:
+            self.encoder = AutoModel.from_pretrained(config.encoder_model)
+        else:
+            # Architecture only, for weights that come from a checkpoint anyway
+            self.encoder = AutoModel.from_config(AutoConfig.from_pretrained(config.encoder_model))
+        
+        if config.freeze_encoders:
+            for param in self.encoder.parameters():
+                param.requires_grad = False
+        
+        # Frozen encoder outputs never change, so repeat sequences skip the encoder at inference
+        self.encoder_cache = None
+        if config.freeze_encoders and config.encoder_cache_bytes > 0:
+            self.encoder_cache = EncoderCache(config.encoder_cache_bytes)
+
+        self.proj = torch.nn.Sequential(
+            torch.nn.Linear(config.hidden_size, config.fusion_hidden_size),
+            torch.nn.LayerNorm(config.fusion_hidden_size),
+            torch.nn.GELU(),
+            torch.nn.Dropout(config.dropout)
+        )
+
+        self.fusion_layers = torch.nn.ModuleList([
+            ContrastiveFusion(config.fusion_hidden_size, dropout=config.dropout)
+            for _ in range(config.num_fusion_layers)
+        ])
+
+        self.element_head = torch.nn.Sequential(
+            torch.nn.Dropout(config.dropout),
+            torch.nn.Linear(config.fusion_hidden_size, 256),
+            torch.nn.LayerNorm(256),
+            torch.nn.GELU(),
+            torch.nn.Dropout(config.dropout * 0.5),
+            torch.nn.Linear(256, 128),
+            torch.nn.LayerNorm(128),
+            torch.nn.GELU(),
+            torch.nn.Dropout(config.dropout * 0.3),
+            torch.nn.Linear(128, config.num_element_candidates)
+        )
+
+        self.value_head = torch.nn.Sequential(
+            torch.nn.Dropout(config.dropout),
+            torch.nn.Linear(config.fusion_hidden_size, 512),
+            torch.nn.LayerNorm(512),
+            torch.nn.GELU(),
+            torch.nn.Dropout(config.dropout * 0.5),
+            torch.nn.Linear(512, config.vocab_size)
+        )
+
+        self.ranking_head = torch.nn.Sequential(
+            torch.nn.Dropout(config.dropout),
+            torch.nn.Linear(config.fusion_hidden_size, 128),
+            torch.nn.LayerNorm(128),
+            torch.nn.GELU(),
+            torch.nn.Dropout(config.dropout * 0.5),
+            torch.nn.Linear(128, config.num_element_candidates)
+        )
+
+    def load_state_dict(self, *args, **kwargs):
+        # Cached rows came from the previous encoder weights
+        if self.encoder_cache is not None:
+            self.encoder_cache.clear()
+        return super().load_state_dict(*args, **kwargs)
+
+    def encode_batches(self, batches):
+        """
+        Frozen encoder last_hidden_state for each (input_ids, attention_mask)
+        batch. In eval mode, identical rows across all batches are encoded
+        once, rows seen before come from the cache, and the rest share as
+        few encoder passes as padding allows. Extra padding is masked, so
+        slicing a row back to its own length gives the same states.
+        """
+        with torch.no_grad():
+            if self.training:
+                return [self.encoder(ids, mask).last_hidden_state for ids, mask in batches]
+            
+            keys = [EncoderCache.keys(ids, mask) for ids, mask in batches]
+            states = {}  # key -> [length, hidden] states
+            pending = {}  # key -> (input_ids row, attention_mask row) to encode
+            for (ids, mask), batch_keys in zip(batches, keys):
+                for key, row_ids, row_mask in zip(batch_keys, ids, mask):
+                    if key in states or key in pending:
+                        continue
+                    row = self.encoder_cache.get(key) if self.encoder_cache is not None else None
+                    if row is None:
+                        pending[key] = (row_ids, row_mask)
+                    else:
+                        states[key] = row
+            
+            for group in self._joint_groups(pending):
+                length = len(pending[group[0]][0])
+                ids = torch.zeros((len(group), length), dtype=batches[0][0].dtype, device=batches[0][0].device)
+                mask = torch.zeros((len(group), length), dtype=batches[0][1].dtype, device=batches[0][1].device)
+                for i, key in enumerate(group):
+                    row_ids, row_mask = pending[key]
+                    ids[i, :len(row_ids)] = row_ids
+                    mask[i, :len(row_mask)] = row_mask
+                encoded = self.encoder(ids, mask).last_hidden_state
+                for i, key in enumerate(group):
+                    row = encoded[i, :len(pending[key][0])]
+                    states[key] = row
+                    if self.encoder_cache is not None:
+                        self.encoder_cache.put(key, row)
+            
+            return [torch.stack([states[key] for key in batch_keys]) for batch_keys in keys]
+
+    @staticmethod
+    def _joint_groups(pending):
+        """Keys grouped into encoder passes, longest rows first"""
+        groups = []
+        longest = tokens = 0
+        for key in sorted(pending, key=lambda k: len(pending[k][0]), reverse=True):
+            length = len(pending[key][0])
+            if groups and longest * (len(groups[-1]) + 1) <= JOINT_PADDING_SLACK * (tokens + length):
+                groups[-1].append(key)
+                tokens += length
+            else:
+                groups.append([key])
+                longest = tokens = length
+        return groups
+
+    def forward(self, task_input_ids, task_attention_mask, 
+                content_input_ids, content_attention_mask, heads=HEADS, **kwargs):
+
+        if self.config.freeze_encoders:
+            self.encoder.eval()
+            task_states, content_states = self.encode_batches([
+                (task_input_ids, task_attention_mask),
+                (content_input_ids, content_attention_mask)
+            ])
+        else:
+            task_states = self.encoder(task_input_ids, task_attention_mask).last_hidden_state
+            content_states = self.encoder(content_input_ids, content_attention_mask).last_hidden_state
+
+        return self.fuse(task_states, task_attention_mask, content_states, content_attention_mask, heads)
+
+    def fuse(self, task_states, task_attention_mask, content_states, content_attention_mask, heads=HEADS):
+        """
+        Fusion layers and the requested heads over encoder states.
+        Returns '<head>_logits' per head plus the pooled representation, so
+        value_logits can decode values later for just the rows that need them.
+        """
+        unknown = set(heads) - set(HEADS)
+        if unknown:
+            raise ValueError(f"Unknown heads: {sorted(unknown)}")
+        task_hidden = self.proj(task_states)
+        content_hidden = self.proj(content_states)
+
+        fused = task_hidden
+        content_key_mask = ~content_attention_mask.bool()
+        
+        for fusion_layer in self.fusion_layers:
+            fused = fusion_layer(fused, content_hidden, content_key_mask)
+
+        mask = task_attention_mask.unsqueeze(-1).float()
+        pooled = (fused * mask).sum(1) / task_attention_mask.sum(1, keepdim=True).clamp(min=1e-9)
+
+        outputs = {'pooled': pooled}
+        if 'element' in heads:
+            outputs['element_logits'] = self.element_head(pooled)
+        # 512 -> vocab_size matmul, the largest in the heads
+        if 'value' in heads:
+            outputs['value_logits'] = self.value_head(pooled)
+        if 'ranking' in heads:
+            outputs['ranking_logits'] = self.ranking_head(pooled)
+        return outputs
+
+    def value_logits(self, pooled, rows=None):
+        """value_head logits for the given rows of fuse()'s pooled output"""
+        if rows is not None:
+            pooled = pooled[rows]
+        return self.value_head(pooled)
+
+# ============================================================================
+# Load Model from Drive
+# ============================================================================
+
+# Registry names, see model_registry.py
+ENCODER_NAME = 'distilbert-base-uncased'  # Tokenizer and pretrained encoder, registered by load.py
+MODEL_NAME = 'element-focused'  # Fine-tuned weights
+MODEL_WEIGHTS = 'element_focused_model.pt'
+QUANTIZED_WEIGHTS = 'element_focused_model.int8.pt'  # Written by export_model.py
+
+
+def quantize_model(model, inplace=False):
+    """
+    CPU copy of the model with dynamic int8 Linear layers: weights stored
+    as int8, activations quantized per batch. Same inputs and output dict.
+    The attention output projections stay fp32 (not quantizable by PyTorch).
+    inplace=True converts model itself instead of a copy.
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    return torch.ao.quantization.quantize_dynamic(
+        model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+
+
+def skip_weight_init():
+    """Context skipping random weight initialization of modules built inside it"""
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # transformers < 5
+        try:
+            from transformers.modeling_utils import no_init_weights
+        except ImportError:
+            return contextlib.nullcontext()
+    return no_init_weights()
+
+
+def warm_up(model, tokenizer, config, device):
+    """
+    One forward pass on a dummy example, so the first request does not pay
+    for lazy kernel and allocator setup. Returns its duration in seconds.
+    """
+    start = time.perf_counter()
+    elements = [{'idx': 0, 'type': 'button', 'purpose': 'submit', 'text': 'Submit'}]
+    with torch.inference_mode():
+        model(**prepare_input('Warm up', 'Page', 'None', elements, tokenizer, config, device), heads=('element',))
+    if getattr(model, 'encoder_cache', None) is not None:
+        model.encoder_cache.clear()
+    return time.perf_counter() - start
+
+
+def load_weights(config, model_path, quantized=False, timings=None):
+    """
+    ElementFocusedModel holding the weights at model_path, and its device.
+    The architecture is built without pretrained or random weights, then
+    the memory-mapped checkpoint fills it, so weights are read once.
+    Adds 'architecture' and 'weights' seconds to timings if given.
+    """
+    start = time.perf_counter()
+    with skip_weight_init():
+        model = ElementFocusedModel(config, pretrained_encoder=False)
+        if quantized:
+            # Quantized kernels are CPU only; build the int8 structure, then load into it
+            quantize_model(model, inplace=True)
+    built = time.perf_counter()
+    
+    device = torch.device('cpu' if quantized or not torch.cuda.is_available() else 'cuda')
+    # Pages are read as tensors are used instead of copied up front
+    state_dict = torch.load(model_path, map_location='cpu', weights_only=True, mmap=True)
+    # Packed int8 weights are copied into their modules, fp32 tensors are adopted as is
+    model.load_state_dict(state_dict, assign=not quantized)
+    model.to(device)
+    model.eval()
+    
+    if timings is not None:
+        timings['architecture'] = built - start
+        timings['weights'] = time.perf_counter() - built
+    return model, device
+
+
+def model_dir(drive_path=None, registry=None, verify=False):
+    """drive_path if given, else the registry snapshot of the fine-tuned weights"""
+    if drive_path:
+        return drive_path
+    from model_registry import ModelRegistry
+    return (registry or ModelRegistry()).path(MODEL_NAME, verify=verify)
+
+
+def load_model_from_drive(drive_path=None, quantized=False, warm=True, registry=None, verify=False):
+    """
+    Load model and tokenizer, offline.
+    Weights come from drive_path, or from the model registry if not given;
+    tokenizer and encoder architecture always come from the registry.
+    verify=True checks the SHA-256 of every registry file first.
+    quantized=True loads the int8 CPU artifact from export_model.py instead
+    of the fp32 weights. warm=True runs a warm-up forward pass before
+    returning and the cold start time of each stage is reported.
+    """
+    print("🔄 Loading model...")
+    from transformers import AutoTokenizer
+    from model_registry import ModelRegistry
+    timings = {}
+    start = time.perf_counter()
+    registry = registry or ModelRegistry()
+    drive_path = model_dir(drive_path, registry, verify)
+    encoder_path = registry.path(ENCODER_NAME, verify=verify)
+    timings['registry'] = time.perf_counter() - start
+    
+    # Check if model weights exist
+    model_path = os.path.join(drive_path, QUANTIZED_WEIGHTS if quantized else MODEL_WEIGHTS)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+    
+    print(f"✓ Found model at {model_path}")
+    
+    # Load tokenizer
+    print("📚 Loading tokenizer...")
+    tokenizer = AutoTokenizer.from_pretrained(encoder_path, local_files_only=True)
+    timings['tokenizer'] = time.perf_counter() - start - timings['registry']
+    
+    # Initialize model and load your trained weights
+    print("🏗️ Initializing model architecture and weights...")
+    config = ElementFocusedConfig(encoder_model=encoder_path)
+    model, device = load_weights(config, model_path, quantized, timings)
+    
+    if warm:
+        print("🔥 Warming up...")
+        timings['warm-up'] = warm_up(model, tokenizer, config, device)
+    
+    print(f"✅ Model loaded successfully on {device}{' (int8)' if quantized else ''}!")
+    print(f"⏱️ Cold start {sum(timings.values()):.1f}s: "
+          + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+    
+    return model, tokenizer, device, config
+
+
+# ============================================================================
+# Input Preparation
+# ============================================================================
+
+def format_task(task, page_summary, prev_actions):
+    """Task text the model was trained on"""
+    return f"Task: {task} | Current page: {page_summary} | History: {prev_actions}"
+
+
+def format_content(elements, config):
+    """Content text describing the first num_element_candidates elements"""
+    content_descriptions = []
+    for elem in elements[:config.num_element_candidates]:
+        desc = f"[{elem['idx']}] {elem['type']} ({elem['purpose']}): {elem['text']}"
+        content_descriptions.append(desc)
+    
+    return " | ".join(content_descriptions)
+
+
+def content_length(num_tokens, config):
+    """Padded content length: num_tokens rounded up to its length bucket"""
+    bucket = config.content_length_bucket
+    if bucket <= 0:
+        return config.max_content_length
+    return min(-(-num_tokens // bucket) * bucket, config.max_content_length)
+
+
+def bucket_by_length(content_texts, tokenizer, config):
+    """Batch positions grouped by padded content length, {length: [position, ...]}"""
+    encoding = tokenizer(list(content_texts), max_length=config.max_content_length, truncation=True)
+    buckets = {}
+    for pos, ids in enumerate(encoding['input_ids']):
+        buckets.setdefault(content_length(len(ids), config), []).append(pos)
+    return buckets
+
+
+def encode_batch(task_texts, content_texts, tokenizer, config, device):
+    """
+    Tokenize lists of task and content texts into one batch of model inputs.
+    Content is padded only up to the length bucket of the longest content:
+    padded content positions are masked in the encoder and in the fusion
+    cross-attention, so this does not change the outputs. Task text stays
+    padded to max_task_length, because the fusion self-attention over the
+    task sequence is unmasked and the model was trained with those positions.
+    """
+    task_encoding = tokenizer(
+        list(task_texts),
+        max_length=config.max_task_length,
+        padding='max_length',
+        truncation=True,
+        return_tensors='pt'
+    )
+    
+    content_encoding = tokenizer(
+        list(content_texts),
+        max_length=config.max_content_length,
+        truncation=True
+    )
+    longest = max(len(ids) for ids in content_encoding['input_ids'])
+    content_encoding = tokenizer.pad(
+        content_encoding,
+        padding='max_length',
+        max_length=content_length(longest, config),
+        return_tensors='pt'
+    )
+    
+    # Move to device
+    return {
+        'task_input_ids': task_encoding['input_ids'].to(device),
+        'task_attention_mask': task_encoding['attention_mask'].to(device),
+        'content_input_ids': content_encoding['input_ids'].to(device),
+        'content_attention_mask': content_encoding['attention_mask'].to(device),
+    }
+
+
+def prepare_input(task, page_summary, prev_actions, elements, tokenizer, config, device):
+    """Prepare input for the model"""
+    return encode_batch(
+        [format_task(task, page_summary, prev_actions)],
+        [format_content(elements, config)],
+        tokenizer, config, device
+    )
@@ -0,0 +1,47 @@
+# ============================================================================
+# Quantized CPU Model Export
+# ============================================================================
+# Writes an int8 CPU artifact of ElementFocusedModel next to the fp32
+# weights: every Linear layer (encoder, fusion FFNs, heads) is dynamically
+# quantized. Without --model-dir the artifact is added to the fine-tuned
+# weights in the model registry. Load it with
+# load_model_from_drive(quantized=True) or serve it with model_service.py --quantized.
+# Run: python export_model.py
+# Then python test.py compares it with the fp32 model on the test scenarios.
+# ============================================================================
+
+import argparse
+import os
+import tempfile
+
+import torch
+
+from element_model import MODEL_NAME, MODEL_WEIGHTS, QUANTIZED_WEIGHTS, load_model_from_drive, model_dir, quantize_model
+from model_registry import ModelRegistry
+
+
+def export_quantized(model, drive_path: str) -> str:
+    """Quantize model and save its state dict, returns the artifact path"""
+    path = os.path.join(drive_path, QUANTIZED_WEIGHTS)
+    torch.save(quantize_model(model).state_dict(), path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export an int8 CPU artifact of ElementFocusedModel')
+    parser.add_argument('--model-dir', help=f'Directory holding {MODEL_WEIGHTS} (default: the model registry)')
+    args = parser.parse_args()
+
+    model, _, _, _ = load_model_from_drive(args.model_dir, warm=False)
+    fp32_mb = os.path.getsize(os.path.join(model_dir(args.model_dir), MODEL_WEIGHTS)) / 2 ** 20
+    if args.model_dir:
+        path = export_quantized(model, args.model_dir)
+        int8_mb = os.path.getsize(path) / 2 ** 20
+    else:
+        # Registry snapshots are read-only, add the artifact as a new version of the entry
+        registry = ModelRegistry()
+        with tempfile.TemporaryDirectory() as tmp:
+            int8_mb = os.path.getsize(export_quantized(model, tmp)) / 2 ** 20
+            registry.add(MODEL_NAME, tmp, merge=True)
+        path = os.path.join(registry.path(MODEL_NAME), QUANTIZED_WEIGHTS)
+    print(f"✅ Wrote {path}: {int8_mb:.1f} MB (fp32 weights: {fp32_mb:.1f} MB)")
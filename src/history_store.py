@@ -0,0 +1,302 @@
+"""
+Shared Action History Store
+SQLite-backed append-only log of recorded actions per tab. Worker processes
+append every action here and replay the log in sequence order, so each
+worker's in-memory history for a tab converges to the same state.
+Registered page snapshots are stored here too, so any worker can resolve
+a snapshot_id another worker handed out. A patched snapshot is stored as
+its delta against the base snapshot and rebuilt on a miss, with a full page
+written every MAX_DELTA_CHAIN patches to bound the rebuild.
+
+A tab's log is not trimmed by dropping rows: once it grows past
+max_actions_per_tab a session stores its replayed state as the tab's
+checkpoint, and only the actions the checkpoint covers are deleted. Workers
+that are behind, or start fresh, load the checkpoint and replay the rest.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Marker row written when a tab's session is cleared or purged
+RESET_ACTION = '__reset__'
+# Seconds between activity updates of a tab that only predicts
+TOUCH_INTERVAL = 60
+# Deltas stored on top of a full page before the next one is stored in full
+MAX_DELTA_CHAIN = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tab_id TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    element TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS actions_tab_seq ON actions (tab_id, seq);
+CREATE TABLE IF NOT EXISTS pages (
+    snapshot_id TEXT PRIMARY KEY,
+    tab_id TEXT NOT NULL,
+    url TEXT,
+    elements TEXT,
+    base_id TEXT,
+    delta TEXT,
+    depth INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_tab ON pages (tab_id);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    tab_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tabs (
+    tab_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+"""
+
+
+class SQLiteHistoryStore:
+    """
+    Action log shared by worker processes through one SQLite file.
+    Connections are per thread (and so per process); WAL mode lets readers
+    run alongside the single writer.
+    """
+
+    def __init__(self, path: str, max_actions_per_tab: int = 5000, timeout: float = 10.0):
+        self.path = path
+        self.max_actions_per_tab = max_actions_per_tab
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _transaction(self) -> sqlite3.Connection:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _touch(self, conn: sqlite3.Connection, tab_id: str, now: float):
+        conn.execute(
+            'INSERT INTO tabs (tab_id, last_active) VALUES (?, ?) '
+            'ON CONFLICT (tab_id) DO UPDATE SET last_active = excluded.last_active',
+            (tab_id, now)
+        )
+
+    def touch(self, tab_id: str):
+        """Mark a tab active so purge_idle keeps it"""
+        self._touch(self._connect(), tab_id, time.time())
+
+    def append(self, tab_id: str, element: Dict, action_type: str) -> int:
+        """Append an action, returns its sequence number"""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO actions (tab_id, action_type, element, created) VALUES (?, ?, ?, ?)',
+                (tab_id, action_type, json.dumps(element), now)
+            )
+            self._touch(conn, tab_id, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.lastrowid
+
+    def fetch_since(self, tab_id: str, after_seq: int) -> List[Dict]:
+        """Actions for a tab with seq > after_seq, oldest first"""
+        rows = self._connect().execute(
+            'SELECT seq, action_type, element FROM actions WHERE tab_id = ? AND seq > ? ORDER BY seq',
+            (tab_id, after_seq)
+        ).fetchall()
+        return [
+            {'seq': seq, 'action_type': action_type, 'element': json.loads(element)}
+            for seq, action_type, element in rows
+        ]
+
+    def fetch_log(self, tab_id: str, after_seq: int) -> Tuple[Optional[Tuple[int, Dict]], List[Dict]]:
+        """
+        (checkpoint, actions) to bring a replica at after_seq up to date.
+        checkpoint is (seq, state) when the tab was compacted past after_seq,
+        then actions follow it; both are read from one consistent snapshot.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute(
+                'SELECT seq, state FROM checkpoints WHERE tab_id = ? AND seq > ?', (tab_id, after_seq)
+            ).fetchone()
+            checkpoint = (row[0], json.loads(row[1])) if row else None
+            actions = self.fetch_since(tab_id, checkpoint[0] if checkpoint else after_seq)
+        finally:
+            conn.execute('COMMIT')
+        return checkpoint, actions
+
+    def save_checkpoint(self, tab_id: str, seq: int, state: Dict):
+        """Store a tab's state replayed up to seq and drop the actions it covers"""
+        conn = self._transaction()
+        try:
+            # A concurrent compaction may already have stored a newer one
+            stored = conn.execute(
+                'INSERT INTO checkpoints (tab_id, seq, state) VALUES (?, ?, ?) '
+                'ON CONFLICT (tab_id) DO UPDATE SET seq = excluded.seq, state = excluded.state '
+                'WHERE excluded.seq > checkpoints.seq',
+                (tab_id, seq, json.dumps(state))
+            ).rowcount
+            if stored:
+                conn.execute('DELETE FROM actions WHERE tab_id = ? AND seq <= ?', (tab_id, seq))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def save_page(self, tab_id: str, snapshot_id: str, url: Optional[str], elements: List[Dict], keep: int):
+        """Store a full page snapshot, keeping the tab's newest `keep` snapshots"""
+        self._save_page(tab_id, snapshot_id, url, keep, elements=json.dumps(elements))
+
+    def save_delta(self, tab_id: str, snapshot_id: str, base_id: str, url: Optional[str],
+                   delta: Dict, keep: int) -> bool:
+        """
+        Store a snapshot as its delta against base_id, keeping the tab's
+        newest `keep` snapshots and what they are built on. Returns False,
+        storing nothing, when the base is gone or its chain is full; the
+        caller then stores the page with save_page.
+        """
+        return self._save_page(tab_id, snapshot_id, url, keep, base_id=base_id, delta=json.dumps(delta))
+
+    def _save_page(self, tab_id: str, snapshot_id: str, url: Optional[str], keep: int,
+                   elements: Optional[str] = None, base_id: Optional[str] = None,
+                   delta: Optional[str] = None) -> bool:
+        now = time.time()
+        conn = self._transaction()
+        try:
+            depth = 0
+            if base_id is not None:
+                row = conn.execute(
+                    'SELECT depth FROM pages WHERE snapshot_id = ? AND tab_id = ?', (base_id, tab_id)
+                ).fetchone()
+                if row is None or row[0] >= MAX_DELTA_CHAIN:
+                    conn.execute('ROLLBACK')
+                    return False
+                depth = row[0] + 1
+            conn.execute(
+                'INSERT INTO pages (snapshot_id, tab_id, url, elements, base_id, delta, depth, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (snapshot_id, tab_id, url, elements, base_id, delta, depth, now)
+            )
+            self._touch(conn, tab_id, now)
+            conn.execute(
+                'DELETE FROM pages WHERE tab_id = ? AND snapshot_id NOT IN ('
+                '  WITH RECURSIVE kept (snapshot_id, base_id) AS ('
+                '    SELECT * FROM (SELECT snapshot_id, base_id FROM pages WHERE tab_id = ? ORDER BY rowid DESC LIMIT ?)'
+                '    UNION SELECT pages.snapshot_id, pages.base_id FROM pages JOIN kept ON pages.snapshot_id = kept.base_id'
+                '  ) SELECT snapshot_id FROM kept'
+                ')',
+                (tab_id, tab_id, keep)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def fetch_page(self, tab_id: str, snapshot_id: str, known=()) -> Optional[List[Tuple]]:
+        """
+        Stored snapshots needed to rebuild snapshot_id, newest first, as
+        (snapshot_id, url, elements, delta). The chain ends at a full page
+        (delta None) or at a snapshot in known, which the caller already
+        holds (only its snapshot_id is set). None if unknown or dropped.
+        """
+        chain = []
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            while snapshot_id not in known:
+                row = conn.execute(
+                    'SELECT url, elements, base_id, delta FROM pages WHERE snapshot_id = ? AND tab_id = ?',
+                    (snapshot_id, tab_id)
+                ).fetchone()
+                if row is None:
+                    return None
+                url, elements, base_id, delta = row
+                if delta is None:
+                    chain.append((snapshot_id, url, json.loads(elements), None))
+                    return chain
+                chain.append((snapshot_id, url, None, json.loads(delta)))
+                snapshot_id = base_id
+            chain.append((snapshot_id, None, None, None))
+            return chain
+        finally:
+            conn.execute('COMMIT')
+
+    def reset(self, tab_id: str):
+        """Forget a tab's actions and pages; workers holding it reset on their next sync"""
+        conn = self._transaction()
+        try:
+            self._clear(conn, tab_id)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _clear(self, conn: sqlite3.Connection, tab_id: str) -> int:
+        """Delete a tab's rows and append a reset marker, returns rows deleted"""
+        deleted = 0
+        for table in ('pages', 'checkpoints', 'actions'):
+            deleted += conn.execute(f'DELETE FROM {table} WHERE tab_id = ?', (tab_id,)).rowcount
+        conn.execute(
+            'INSERT INTO actions (tab_id, action_type, element, created) VALUES (?, ?, ?, ?)',
+            (tab_id, RESET_ACTION, '{}', time.time())
+        )
+        return deleted
+
+    def purge_idle(self, idle_seconds: float) -> int:
+        """
+        Clear tabs inactive for idle_seconds, returns rows deleted. Called
+        periodically by serve.py with the session TTL.
+        A cleared tab keeps a reset marker so workers still holding it drop
+        their history too; the marker goes on the next purge after another
+        idle_seconds, when every such session has expired.
+        """
+        cutoff = time.time() - idle_seconds
+        conn = self._transaction()
+        try:
+            idle = [tab_id for tab_id, in conn.execute(
+                'SELECT tab_id FROM tabs WHERE last_active < ?', (cutoff,)
+            ).fetchall()]
+            deleted = 0
+            for tab_id in idle:
+                deleted += self._clear(conn, tab_id)
+            conn.executemany('DELETE FROM tabs WHERE tab_id = ?', [(tab_id,) for tab_id in idle])
+            deleted += conn.execute(
+                'DELETE FROM actions WHERE action_type = ? AND created < ? '
+                'AND tab_id NOT IN (SELECT tab_id FROM tabs)',
+                (RESET_ACTION, cutoff)
+            ).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return deleted
+
+
+def history_store_from_env() -> Optional[SQLiteHistoryStore]:
+    """Shared store at $PREDICTION_HISTORY_DB, or None for in-process history"""
+    path = os.environ.get('PREDICTION_HISTORY_DB')
+    return SQLiteHistoryStore(path) if path else None
@@ -4,58 +4,35 @@
 # High accuracy element selection for web automation using text matching
 # ============================================================================
 
-import re
+import heapq
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Optional
-from fuzzywuzzy import fuzz, process
+
+from fuzzywuzzy import fuzz
+from fuzzywuzzy.utils import full_process
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz
+except ImportError:
+    rapid_fuzz = None
+
+from ranking import top_k
+from text_processing import extract_keywords, normalize_text
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
 class Config:
-    max_elements = 50
+    max_elements = 50  # Shortlist size after inverted-index prefiltering
+    prefilter = True  # Only fuzzy-score the shortlist on indexed pages
     exact_match_threshold = 90  # Fuzzy match score for high confidence
     partial_match_threshold = 70  # Minimum score to consider
+    index_cache_bytes = 64 * 1024 * 1024  # Per-page element index cache budget
 
 config = Config()
 
 
-# ============================================================================
-# TEXT PROCESSING
-# ============================================================================
-
-def extract_keywords(instruction: str) -> List[str]:
-    """
-    Extract meaningful keywords from instruction.
-    Remove stop words and common verbs.
-    """
-    # Common action words to remove
-    stop_words = {
-        'click', 'press', 'tap', 'select', 'choose', 'open', 'close',
-        'the', 'a', 'an', 'on', 'to', 'of', 'in', 'for', 'at', 'by',
-        'navigate', 'go', 'view', 'see', 'show', 'display'
-    }
-    
-    # Convert to lowercase and split
-    words = instruction.lower().split()
-    
-    # Remove stop words and short words
-    keywords = [w for w in words if w not in stop_words and len(w) > 2]
-    
-    # Also keep original phrases
-    phrases = []
-    if len(keywords) >= 2:
-        phrases.append(' '.join(keywords[:2]))  # First two keywords as phrase
-    
-    return keywords + phrases
-
-def normalize_text(text: str) -> str:
-    """Normalize text for comparison"""
-    text = text.lower().strip()
-    text = re.sub(r'[^\w\s]', '', text)  # Remove punctuation
-    text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
-    return text
-
 # ============================================================================
 # RULE-BASED MATCHING
 # ============================================================================
@@ -94,13 +71,392 @@ def compute_text_match_score(instruction: str, element_text: str) -> float:
     # Return best score
     return max(scores) if scores else 0.0
 
+# ============================================================================
+# BATCH SCORING
+# ============================================================================
+
+# Score of elements that cannot rank among the best k (see _fuzzy_scores)
+PRUNED = -1.0
+
+# Longest needle rapidfuzz's partial_ratio aligns exhaustively
+RAPIDFUZZ_EXACT_NEEDLE = 64
+
+class InstructionQuery:
+    """Instruction preprocessed once for scoring many elements"""
+    def __init__(self, instruction: str):
+        self.instruction = instruction
+        self.normalized = normalize_text(instruction)
+        self.keywords = extract_keywords(instruction)
+        self.processed = full_process(self.normalized, force_ascii=True)
+
+def score_elements_batch(instruction: str, texts: List[str], k: Optional[int] = None) -> List[float]:
+    """
+    Score every element text against the instruction in one pass.
+    Returns the same scores as calling compute_text_match_score per element.
+    With k, only the best k elements are guaranteed their exact score;
+    elements that cannot rank among them may score PRUNED instead.
+    """
+    query = InstructionQuery(instruction)
+    scores = [0.0] * len(texts)
+    
+    # Group elements by normalized text so repeated labels are scored once
+    groups = {}
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        groups.setdefault(normalize_text(text), []).append(i)
+    
+    counts = {elem_norm: len(ids) for elem_norm, ids in groups.items()}
+    for elem_norm, score in zip(*_score_normalized(query, list(groups), k, counts)):
+        for i in groups[elem_norm]:
+            scores[i] = score
+    
+    return scores
+
+def _score_normalized(
+    query: InstructionQuery,
+    choices: List[str],
+    k: Optional[int] = None,
+    counts: Optional[Dict[str, int]] = None
+) -> Tuple[List[str], List[float]]:
+    """
+    Score already-normalized element texts, returns (choices, scores).
+    counts (elements per choice) is required with k, see _fuzzy_scores.
+    """
+    keywords = query.keywords
+    
+    # An exact keyword substring always wins with 100, no fuzzy work needed
+    exact, fuzzy = [], []
+    for choice in choices:
+        if any(kw in choice for kw in keywords):
+            exact.append(choice)
+        else:
+            fuzzy.append(choice)
+    
+    if k is None:
+        fuzzy_scores = _fuzzy_scores(query, fuzzy)
+    else:
+        known = sum(counts[choice] for choice in exact)
+        fuzzy_scores = _fuzzy_scores(query, fuzzy, k, [counts[choice] for choice in fuzzy], known)
+    return exact + fuzzy, [100] * len(exact) + fuzzy_scores
+
+def _fuzzy_score(query: InstructionQuery, choice: str) -> float:
+    """Best keyword partial_ratio / full token_set_ratio of one choice"""
+    return max([fuzz.partial_ratio(kw, choice) for kw in query.keywords]
+               + [fuzz.token_set_ratio(query.normalized, choice)])
+
+def _score_bounds(query: InstructionQuery, choices: List[str]) -> Optional[List[float]]:
+    """
+    Upper bounds of _fuzzy_score from rapidfuzz's C scorers, or None
+    without rapidfuzz. Its ratios count the longest common subsequence,
+    which difflib's matching blocks never exceed, so a bound is never
+    below the fuzzywuzzy score; the +1 covers fuzzywuzzy's rounding.
+    """
+    if rapid_fuzz is None:
+        return None
+    long_keywords = any(len(kw) > RAPIDFUZZ_EXACT_NEEDLE for kw in query.keywords)
+    bounds = []
+    for choice in choices:
+        # Long needles are aligned heuristically, their score is no bound
+        if long_keywords and len(choice) > RAPIDFUZZ_EXACT_NEEDLE:
+            bounds.append(101.0)
+            continue
+        bound = rapid_fuzz.token_set_ratio(query.processed, full_process(choice, force_ascii=True))
+        for kw in query.keywords:
+            bound = max(bound, rapid_fuzz.partial_ratio(kw, choice))
+        bounds.append(bound + 1)
+    return bounds
+
+def _fuzzy_scores(
+    query: InstructionQuery,
+    choices: List[str],
+    k: Optional[int] = None,
+    counts: Optional[List[int]] = None,
+    known_100: int = 0
+) -> List[float]:
+    """
+    fuzzywuzzy score of each choice.
+    With k, choices are confirmed in order of their rapidfuzz bound until
+    no remaining bound reaches the k-th best element score; counts holds
+    the elements per choice, known_100 the elements already scoring 100.
+    The rest score PRUNED, so the best k elements (ties included) are
+    exactly those of a full scoring.
+    """
+    bounds = _score_bounds(query, choices) if k is not None and len(choices) > 1 else None
+    if bounds is None:
+        return [_fuzzy_score(query, choice) for choice in choices]
+    
+    scores = [PRUNED] * len(choices)
+    best = [100] * min(known_100, k)  # min-heap of the best k element scores
+    for cid in sorted(range(len(choices)), key=bounds.__getitem__, reverse=True):
+        if len(best) >= k and bounds[cid] < best[0]:
+            break
+        score = scores[cid] = _fuzzy_score(query, choices[cid])
+        for _ in range(min(counts[cid], k)):
+            if len(best) < k:
+                heapq.heappush(best, score)
+            elif score > best[0]:
+                heapq.heapreplace(best, score)
+    return scores
+
+# ============================================================================
+# ELEMENT INDEX
+# ============================================================================
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """Character n-grams of text (the whole text if shorter than n)"""
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class ElementIndex:
+    """
+    Normalized view of one page's element texts, built once per DOM snapshot.
+    Identical labels share one entry ("choice") so they are scored once.
+    """
+    def __init__(self, texts: List[str]):
+        self.texts = tuple(texts)
+        self.choices = []          # unique normalized texts
+        self.tokens = []           # token set per choice
+        self.ngram_postings = {}   # trigram -> set of choice ids
+        self.token_postings = {}   # token -> set of choice ids
+        self.counts = []           # elements per choice
+        
+        # Choice id per element, -1 for empty text
+        choice_ids = {}
+        self.element_choice = []
+        for text in self.texts:
+            if not text or not text.strip():
+                self.element_choice.append(-1)
+                continue
+            elem_norm = normalize_text(text)
+            cid = choice_ids.get(elem_norm)
+            if cid is None:
+                cid = choice_ids[elem_norm] = len(self.choices)
+                self._add_choice(cid, elem_norm)
+                self.counts.append(0)
+            self.counts[cid] += 1
+            self.element_choice.append(cid)
+        
+        self.nbytes = self._estimate_bytes()
+    
+    def _add_choice(self, cid: int, elem_norm: str):
+        tokens = frozenset(elem_norm.split())
+        self.choices.append(elem_norm)
+        self.tokens.append(tokens)
+        for gram in char_ngrams(elem_norm):
+            self.ngram_postings.setdefault(gram, set()).add(cid)
+        for token in tokens:
+            self.token_postings.setdefault(token, set()).add(cid)
+    
+    def _estimate_bytes(self) -> int:
+        """Rough memory footprint used for cache eviction"""
+        text_bytes = sum(len(t) for t in self.texts if t) + sum(len(c) for c in self.choices)
+        postings = sum(len(ids) for ids in self.ngram_postings.values())
+        postings += sum(len(ids) for ids in self.token_postings.values())
+        keys = len(self.ngram_postings) + len(self.token_postings)
+        return 2 * text_bytes + 8 * len(self.texts) + 40 * postings + 120 * keys
+    
+    def substring_matches(self, keyword: str) -> set:
+        """Choice ids whose text contains keyword, via trigram postings"""
+        candidates = None
+        for gram in char_ngrams(keyword):
+            ids = self.ngram_postings.get(gram)
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+        return {cid for cid in candidates if keyword in self.choices[cid]}
+    
+    def exact_matches(self, query: InstructionQuery) -> set:
+        """Choice ids containing any instruction keyword (score 100)"""
+        exact = set()
+        for kw in query.keywords:
+            exact |= self.substring_matches(kw)
+        return exact
+    
+    def shortlist(self, query: InstructionQuery, limit: int) -> List[int]:
+        """
+        Choice ids worth fuzzy scoring: every exact keyword match plus the
+        `limit` choices sharing the most trigrams with the instruction.
+        Only choices that share at least one trigram are ever touched.
+        """
+        grams = char_ngrams(query.normalized)
+        for kw in query.keywords:
+            grams |= char_ngrams(kw)
+        
+        overlap = {}
+        for gram in grams:
+            for cid in self.ngram_postings.get(gram, ()):
+                overlap[cid] = overlap.get(cid, 0) + 1
+        
+        exact = self.exact_matches(query)
+        best = top_k(overlap, limit, key=lambda cid: (overlap[cid], -cid))
+        return sorted(exact.union(best))
+    
+    def score(
+        self,
+        query: InstructionQuery,
+        candidates: Optional[List[int]] = None,
+        k: Optional[int] = None
+    ) -> List[float]:
+        """
+        Per-element scores, identical to score_elements_batch (with the same k).
+        If candidate choice ids are given, only those are scored and every
+        other element scores 0.
+        """
+        if candidates is None:
+            candidates = range(len(self.choices))
+        exact = self.exact_matches(query)
+        
+        fuzzy_ids = [cid for cid in candidates if cid not in exact]
+        choice_scores = [0.0] * len(self.choices)
+        for cid in exact:
+            choice_scores[cid] = 100
+        fuzzy_scores = _fuzzy_scores(
+            query, [self.choices[cid] for cid in fuzzy_ids], k,
+            [self.counts[cid] for cid in fuzzy_ids], sum(self.counts[cid] for cid in exact)
+        )
+        for cid, score in zip(fuzzy_ids, fuzzy_scores):
+            choice_scores[cid] = score
+        
+        # Trailing 0.0 is picked up by empty elements (choice id -1)
+        choice_scores.append(0.0)
+        return [choice_scores[cid] for cid in self.element_choice]
+    
+    def score_pruned(
+        self,
+        query: InstructionQuery,
+        limit: int,
+        stats: 'PrefilterStats',
+        k: Optional[int] = None
+    ) -> List[float]:
+        """
+        Score only the prefilter shortlist, falling back to a full scan when
+        no shortlisted element reaches the partial match threshold.
+        """
+        total = len(self.choices)
+        stats.queries += 1
+        stats.choices_total += total
+        
+        if total > limit:
+            candidates = self.shortlist(query, limit)
+            scores = self.score(query, candidates, k)
+            stats.choices_scored += len(candidates)
+            if scores and max(scores) >= config.partial_match_threshold:
+                return scores
+            stats.fallbacks += 1
+        
+        stats.choices_scored += total
+        return self.score(query, k=k)
+
+class PrefilterStats:
+    """Counters for tuning the prefilter shortlist size (Config.max_elements)"""
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.queries = 0
+        self.choices_total = 0    # unique element texts seen
+        self.choices_scored = 0   # unique element texts fuzzy scored
+        self.fallbacks = 0        # shortlists that fell back to a full scan
+    
+    @property
+    def pruning_ratio(self) -> float:
+        """Fraction of element texts skipped by the prefilter"""
+        if not self.choices_total:
+            return 0.0
+        return max(0.0, 1 - self.choices_scored / self.choices_total)
+    
+    def to_dict(self) -> Dict:
+        return {
+            'queries': self.queries,
+            'choices_total': self.choices_total,
+            'choices_scored': self.choices_scored,
+            'fallbacks': self.fallbacks,
+            'pruning_ratio': round(self.pruning_ratio, 3),
+        }
+
+prefilter_stats = PrefilterStats()
+
+class ElementIndexCache:
+    """LRU cache of ElementIndex keyed by element-text content hash, bounded in bytes"""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+    
+    def get(self, elements: List[Dict]) -> ElementIndex:
+        """Return the index for this element list, building it on first use"""
+        texts = tuple(elem.get('text', '') for elem in elements)
+        key = hash(texts)
+        
+        index = self._entries.get(key)
+        if index is not None and index.texts == texts:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return index
+        
+        self.misses += 1
+        self._discard(key)  # hash collision with a different page
+        index = ElementIndex(texts)
+        self._entries[key] = index
+        self.total_bytes += index.nbytes
+        
+        # Evict least recently used pages, always keeping the newest one
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+        
+        return index
+    
+    def _discard(self, key):
+        index = self._entries.pop(key, None)
+        if index is not None:
+            self.total_bytes -= index.nbytes
+    
+    def stats(self) -> Dict:
+        return {
+            'pages': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+def _score_elements(
+    instruction: str,
+    elements: List[Dict],
+    index: Optional[ElementIndex] = None,
+    k: Optional[int] = None
+) -> Tuple[List[str], List[float]]:
+    """
+    Element texts and their match scores, via the page index if given.
+    Only the best k elements are scored exactly when k is given.
+    """
+    if index is not None:
+        query = InstructionQuery(instruction)
+        if config.prefilter:
+            return index.texts, index.score_pruned(query, config.max_elements, prefilter_stats, k)
+        return index.texts, index.score(query, k=k)
+    
+    texts = [elem.get('text', '') for elem in elements]
+    return texts, score_elements_batch(instruction, texts, k)
+
+def _match_reason(text: str, score: float, confidence_threshold: float) -> str:
+    if score >= confidence_threshold:
+        return f"High confidence text match: '{text}' (score={score:.1f})"
+    return f"Partial text match: '{text}' (score={score:.1f})"
+
 def rule_based_selection(
     instruction: str,
     elements: List[Dict],
-    confidence_threshold: float = 90
+    confidence_threshold: float = 90,
+    index: Optional[ElementIndex] = None
 ) -> Tuple[Optional[int], float, str]:
     """
     Select element using rule-based text matching.
+    Pass a prebuilt ElementIndex for the page to skip re-normalizing texts;
+    with Config.prefilter only its inverted-index shortlist is fuzzy scored.
     
     Returns:
         (element_index, confidence_score, reason)
@@ -109,26 +465,46 @@ def rule_based_selection(
     if not elements:
         return None, 0.0, "No elements provided"
     
-    # Score each element
-    scores = []
-    for i, elem in enumerate(elements):
-        text = elem.get('text', '')
-        score = compute_text_match_score(instruction, text)
-        scores.append((i, score, text))
-    
-    # Sort by score
-    scores.sort(key=lambda x: x[1], reverse=True)
+    # Score all elements in one batch, only the best one exactly
+    texts, scores = _score_elements(instruction, elements, index, k=1)
     
-    best_idx, best_score, best_text = scores[0]
+    # First element with the highest score wins ties
+    best_idx = max(range(len(scores)), key=scores.__getitem__)
+    best_score, best_text = scores[best_idx], texts[best_idx]
     
     # Check if confident enough
-    if best_score >= confidence_threshold:
-        return best_idx, best_score, f"High confidence text match: '{best_text}' (score={best_score:.1f})"
-    elif best_score >= config.partial_match_threshold:
-        return best_idx, best_score, f"Partial text match: '{best_text}' (score={best_score:.1f})"
+    if best_score >= confidence_threshold or best_score >= config.partial_match_threshold:
+        return best_idx, best_score, _match_reason(best_text, best_score, confidence_threshold)
     else:
         return None, best_score, f"No confident match (best score={best_score:.1f})"
 
+def rule_based_top_k(
+    instruction: str,
+    elements: List[Dict],
+    k: int = 3,
+    confidence_threshold: float = 90,
+    index: Optional[ElementIndex] = None
+) -> List[Tuple[int, float, str]]:
+    """
+    Ranked alternatives for rule_based_selection, best first.
+    Only elements reaching the partial match threshold are returned;
+    the first entry is always the element rule_based_selection picks.
+    
+    Returns:
+        [(element_index, confidence_score, reason), ...]
+    """
+    if not elements:
+        return []
+    
+    texts, scores = _score_elements(instruction, elements, index, k)
+    ranked = top_k(range(len(scores)), k, key=scores.__getitem__)
+    
+    return [
+        (i, scores[i], _match_reason(texts[i], scores[i], confidence_threshold))
+        for i in ranked
+        if scores[i] >= confidence_threshold or scores[i] >= config.partial_match_threshold
+    ]
+
 # ============================================================================
 # HYBRID SELECTOR - RULE-BASED ONLY
 # ============================================================================
@@ -136,6 +512,7 @@ def rule_based_selection(
 class HybridElementSelector:
     def __init__(self, config):
         self.config = config
+        self.index_cache = ElementIndexCache(config.index_cache_bytes)
         print("✓ Rule-based element selector initialized")
     
     def select(
@@ -162,9 +539,10 @@ class HybridElementSelector:
             print(f"Instruction: {instruction}")
             print(f"Elements: {len(elements)}")
         
-        # Rule-based selection
+        # Rule-based selection, reusing the page index across instructions
+        index = self.index_cache.get(elements) if elements else None
         rule_idx, rule_score, rule_reason = rule_based_selection(
-            instruction, elements, config.exact_match_threshold
+            instruction, elements, config.exact_match_threshold, index=index
         )
         
         if rule_idx is not None:
@@ -196,6 +574,39 @@ class HybridElementSelector:
             'confidence': 0.0,
             'reason': 'No matching element found'
         }
+    
+    def select_top_k(
+        self,
+        instruction: str,
+        elements: List[Dict],
+        k: int = 3
+    ) -> List[Dict]:
+        """
+        Ranked alternatives for select(), best first, so callers can retry
+        the next candidate without re-scoring the page.
+        
+        Returns:
+            [{'rank': int, 'element_idx': int, ..., 'confidence': float, 'reason': str}, ...]
+            Empty list if no element matches.
+        """
+        index = self.index_cache.get(elements) if elements else None
+        ranked = rule_based_top_k(
+            instruction, elements, k, config.exact_match_threshold, index=index
+        )
+        
+        return [
+            {
+                'rank': rank,
+                'element_idx': idx,
+                'element': elements[idx],
+                'bbox': elements[idx]['bbox'],
+                'text': elements[idx]['text'],
+                'method': 'rule_based',
+                'confidence': score,
+                'reason': reason
+            }
+            for rank, (idx, score, reason) in enumerate(ranked, 1)
+        ]
 
 # ============================================================================
 # USAGE EXAMPLE
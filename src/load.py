@@ -1,11 +1,22 @@
 # run_once_download.py
+# Downloads DistilBERT once into the local model registry (model_registry.py),
+# the only step that needs network access. Copy the registry directory to
+# air-gapped nodes, then register the fine-tuned weights there with:
+#   python model_registry.py add element-focused <dir with element_focused_model.pt>
+import tempfile
+
 from transformers import AutoTokenizer, AutoModel
 
+from element_model import ENCODER_NAME
+from model_registry import ModelRegistry
+
 print("Downloading DistilBERT...")
-tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased", token=False)
-model = AutoModel.from_pretrained("distilbert-base-uncased", token=False)
+tokenizer = AutoTokenizer.from_pretrained(ENCODER_NAME, token=False)
+model = AutoModel.from_pretrained(ENCODER_NAME, token=False)
 
-save_path = r"D:\Neuro Final\WebAgent\distilbert-base-uncased"
-tokenizer.save_pretrained(save_path)
-model.save_pretrained(save_path)
-print(f"Saved to {save_path}")
\ No newline at end of file
+registry = ModelRegistry()
+with tempfile.TemporaryDirectory() as save_path:
+    tokenizer.save_pretrained(save_path)
+    model.save_pretrained(save_path)
+    registry.add(ENCODER_NAME, save_path)
+print(f"Registered {ENCODER_NAME} in {registry.root}")
@@ -0,0 +1,196 @@
+"""
+Local Model Registry
+Offline, content-addressed store for the tokenizer, encoder and fine-tuned
+weights. Files are kept once under objects/ by SHA-256; each registered
+name has a JSON manifest of its files and checksums. A manifest is served
+as a read-only snapshot directory of hard links named after its content,
+so every worker process on a node maps the same files and identical
+manifests resolve to the same path everywhere.
+
+Layout of the registry root:
+    objects/ab/abcd...      file contents, named by SHA-256
+    manifests/<name>.json   {'name', 'created', 'files': {relpath: {'sha256', 'size'}}}
+    snapshots/<digest>/     read-only checkout of one manifest
+
+Run: python model_registry.py add distilbert-base-uncased <saved encoder dir>
+     python model_registry.py add element-focused "D:\\Neuro Final\\WebAgent\\ElementFocused"
+     python model_registry.py list | verify [name]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Registry root, overridable per process
+REGISTRY_ENV = 'ELEMENT_MODEL_REGISTRY'
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'neuroseda', 'models')
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class RegistryError(RuntimeError):
+    """Missing registry entry or file that fails its checksum"""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, data: Dict):
+    """Atomic write, readers see the old or the new file"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class ModelRegistry:
+    """Content-addressed model files with per-name manifests"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.environ.get(REGISTRY_ENV) or DEFAULT_ROOT
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def _manifest_path(self, name: str) -> str:
+        return os.path.join(self.root, 'manifests', f'{name}.json')
+
+    def names(self) -> List[str]:
+        try:
+            entries = os.listdir(os.path.join(self.root, 'manifests'))
+        except FileNotFoundError:
+            return []
+        return sorted(entry[:-len('.json')] for entry in entries if entry.endswith('.json'))
+
+    def manifest(self, name: str) -> Dict:
+        try:
+            with open(self._manifest_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise RegistryError(
+                f"'{name}' is not in the model registry at {self.root}; "
+                f"add it with: python model_registry.py add {name} <dir>"
+            ) from None
+
+    def add(self, name: str, source_dir: str, merge: bool = False) -> Dict:
+        """
+        Register every file under source_dir as name, returns the manifest.
+        merge=True keeps the files of the current manifest that source_dir
+        does not replace.
+        """
+        files = dict(self.manifest(name)['files']) if merge and name in self.names() else {}
+        for folder, _, filenames in os.walk(source_dir):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                relpath = os.path.relpath(path, source_dir).replace(os.sep, '/')
+                files[relpath] = self._store(path)
+
+        manifest = {'name': name, 'created': time.time(), 'files': files}
+        os.makedirs(os.path.dirname(self._manifest_path(name)), exist_ok=True)
+        _write_json(self._manifest_path(name), manifest)
+        return manifest
+
+    def _store(self, path: str) -> Dict:
+        """Copy a file into objects/ unless its content is there already"""
+        sha256 = _sha256(path)
+        target = self._object_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, target)
+        return {'sha256': sha256, 'size': os.path.getsize(target)}
+
+    def path(self, name: str, verify: bool = False) -> str:
+        """
+        Snapshot directory holding name's files, created on first use.
+        File sizes are always checked; verify=True also checks every SHA-256.
+        """
+        files = self.manifest(name)['files']
+        if verify:
+            self._check(name, files, full=True)
+        digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()
+        snapshot = os.path.join(self.root, 'snapshots', digest[:16])
+        if not os.path.isdir(snapshot):
+            self._check(name, files, full=False)
+            self._checkout(files, snapshot)
+        return snapshot
+
+    def _checkout(self, files: Dict, snapshot: str):
+        """Build the snapshot aside and move it in place, racing workers keep the first"""
+        os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(snapshot), prefix='.staging-')
+        for relpath, entry in files.items():
+            target = os.path.join(staging, *relpath.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(self._object_path(entry['sha256']), target)
+            except OSError:  # No hard links on this filesystem
+                shutil.copyfile(self._object_path(entry['sha256']), target)
+                os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            os.rename(staging, snapshot)
+        except OSError:
+            if not os.path.isdir(snapshot):
+                raise
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _check(self, name: str, files: Dict, full: bool):
+        bad = self.verify(name, files, full)
+        if bad:
+            raise RegistryError(f"'{name}' has missing or corrupt files in {self.root}: {', '.join(bad)}")
+
+    def verify(self, name: str, files: Optional[Dict] = None, full: bool = True) -> List[str]:
+        """Files of name whose object is missing, or differs from its size / SHA-256"""
+        files = files if files is not None else self.manifest(name)['files']
+        bad = []
+        for relpath, entry in sorted(files.items()):
+            path = self._object_path(entry['sha256'])
+            if not os.path.exists(path) or os.path.getsize(path) != entry['size'] or (
+                    full and _sha256(path) != entry['sha256']):
+                bad.append(relpath)
+        return bad
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline model registry')
+    parser.add_argument('--root', help=f'Registry root (default: ${REGISTRY_ENV} or {DEFAULT_ROOT})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='Register the files of a directory under a name')
+    add.add_argument('name')
+    add.add_argument('source_dir')
+    add.add_argument('--merge', action='store_true', help='Keep registered files the directory lacks')
+    commands.add_parser('list', help='Registered names and their files')
+    verify = commands.add_parser('verify', help='Check the SHA-256 of registered files')
+    verify.add_argument('name', nargs='?')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == 'add':
+        manifest = registry.add(args.name, args.source_dir, merge=args.merge)
+        print(f"✅ Registered {args.name}: {len(manifest['files'])} files in {registry.root}")
+    elif args.command == 'list':
+        for name in registry.names():
+            files = registry.manifest(name)['files']
+            size_mb = sum(entry['size'] for entry in files.values()) / 2 ** 20
+            print(f"{name}: {len(files)} files, {size_mb:.1f} MB")
+    else:
+        failures = 0
+        for name in [args.name] if args.name else registry.names():
+            bad = registry.verify(name)
+            failures += len(bad)
+            print(f"{name}: {'✅ OK' if not bad else '❌ ' + ', '.join(bad)}")
+        raise SystemExit(1 if failures else 0)
@@ -0,0 +1,226 @@
+"""
+Batched Model Inference
+Serves ElementFocusedModel to concurrent request threads. Requests are
+queued and a single worker thread runs them in micro-batches of up to
+max_batch_size, waiting at most max_wait_ms for a batch to fill. A batch
+encodes its unique task and content sequences together, then runs the
+fusion layers once per content length bucket, so short pages are not
+padded to the longest page in the batch. Only the element head runs for
+every example; the value head decodes a value just for examples whose best
+element takes text input. Results are cached by model input, and identical
+requests in flight share one slot in a batch.
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from element_model import bucket_by_length, encode_batch, format_content, format_task
+from page_index import DEFAULT_BBOX, infer_action
+from ranking import top_k
+
+
+class ModelServer:
+    """Micro-batching, caching front end for one loaded model"""
+
+    def __init__(self, model, tokenizer, device, config, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, cache_size: int = 4096):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.config = config
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        self.lock = threading.Lock()
+        self._cache = OrderedDict()  # (task_text, content_text, text_inputs) -> (element probabilities, value)
+        self._inflight = {}  # (task_text, content_text, text_inputs) -> Future
+        self._queue = queue.Queue()
+        self.counters = {
+            'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'batches': 0, 'buckets': 0, 'batched_inputs': 0,
+            'values_decoded': 0
+        }
+
+        self.model.eval()
+        self._worker = threading.Thread(target=self._run, name='model-server', daemon=True)
+        self._worker.start()
+
+    def submit(self, task: str, page_summary: str, prev_actions: str, elements: List[Dict]) -> Future:
+        """
+        Queue one example. The future resolves to (element probabilities, value),
+        value being the decoded value if the best element takes text input, else None.
+        """
+        candidates = elements[:self.config.num_element_candidates]
+        key = (format_task(task, page_summary, prev_actions), format_content(elements, self.config),
+               tuple(infer_action(elem) == 'input' for elem in candidates))
+        with self.lock:
+            self.counters['requests'] += 1
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.counters['cache_hits'] += 1
+                future = Future()
+                future.set_result(result)
+                return future
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future
+
+            future = self._inflight[key] = Future()
+        self._queue.put((key, future))
+        return future
+
+    def predict(
+        self,
+        task: str,
+        page_summary: str,
+        prev_actions: str,
+        elements: List[Dict],
+        top_k: int = 3,
+        timeout: Optional[float] = None
+    ) -> List[Dict]:
+        """Top-k element predictions, blocks until the batch holding this example ran"""
+        probs, value = self.submit(task, page_summary, prev_actions, elements).result(timeout)
+        return format_predictions(elements[:self.config.num_element_candidates], probs, top_k, value)
+
+    def _run(self):
+        """Worker loop: collect a batch, run it, resolve its futures"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[Tuple[str, str, Tuple[bool, ...]], Future]]):
+        keys = [key for key, _ in batch]
+        rows = [None] * len(batch)
+        values = 0
+        try:
+            buckets = list(bucket_by_length([key[1] for key in keys], self.tokenizer, self.config).values())
+            inputs = [
+                encode_batch([keys[pos][0] for pos in positions], [keys[pos][1] for pos in positions],
+                             self.tokenizer, self.config, self.device)
+                for positions in buckets
+            ]
+            with torch.inference_mode():
+                # Unique task and content sequences of every bucket are encoded
+                # together, then fusion runs per bucket
+                states = self._encode(inputs)
+                for positions, bucket, (task_states, content_states) in zip(buckets, inputs, states):
+                    outputs = self.model.fuse(task_states, bucket['task_attention_mask'],
+                                              content_states, bucket['content_attention_mask'], heads=('element',))
+                    probs = F.softmax(outputs['element_logits'], dim=-1).cpu().tolist()
+                    # Value head only for examples about to type into their best element
+                    typing = [i for i, pos in enumerate(positions) if _best_takes_text(probs[i], keys[pos][2])]
+                    decoded = {}
+                    if typing:
+                        token_ids = self.model.value_logits(outputs['pooled'], typing).argmax(-1).tolist()
+                        decoded = {i: self.tokenizer.decode([token_id], skip_special_tokens=True)
+                                   for i, token_id in zip(typing, token_ids)}
+                        values += len(typing)
+                    for i, pos in enumerate(positions):
+                        rows[pos] = (probs[i], decoded.get(i))
+        except Exception as e:
+            with self.lock:
+                for key, _ in batch:
+                    self._inflight.pop(key, None)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.lock:
+            self.counters['batches'] += 1
+            self.counters['buckets'] += len(buckets)
+            self.counters['batched_inputs'] += len(batch)
+            self.counters['values_decoded'] += values
+            for key, result in zip(keys, rows):
+                self._inflight.pop(key, None)
+                self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for (_, future), result in zip(batch, rows):
+            future.set_result(result)
+
+    def _encode(self, inputs: List[Dict]) -> List[Tuple]:
+        """(task_states, content_states) per bucket"""
+        if not self.config.freeze_encoders:
+            return [
+                (self.model.encoder(batch['task_input_ids'], batch['task_attention_mask']).last_hidden_state,
+                 self.model.encoder(batch['content_input_ids'], batch['content_attention_mask']).last_hidden_state)
+                for batch in inputs
+            ]
+        states = self.model.encode_batches([
+            pair for batch in inputs for pair in (
+                (batch['task_input_ids'], batch['task_attention_mask']),
+                (batch['content_input_ids'], batch['content_attention_mask'])
+            )
+        ])
+        return list(zip(states[::2], states[1::2]))
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats['cached'] = len(self._cache)
+        stats['queued'] = self._queue.qsize()
+        stats['mean_batch_size'] = round(stats['batched_inputs'] / max(stats['batches'], 1), 2)
+        if getattr(self.model, 'encoder_cache', None) is not None:
+            stats['encoder_cache'] = self.model.encoder_cache.stats()
+        return stats
+
+    def close(self):
+        """Stop the worker once the queued requests have run"""
+        self._queue.put(None)
+        self._worker.join()
+
+
+def _best_takes_text(probs: List[float], text_inputs: Tuple[bool, ...]) -> bool:
+    """Whether the top-ranked element is a text input"""
+    best = top_k(range(len(text_inputs)), 1, key=lambda pos: probs[pos])
+    return bool(best) and text_inputs[best[0]]
+
+
+def format_predictions(elements: List[Dict], probs: List[float], k: int = 3,
+                       value: Optional[str] = None) -> List[Dict]:
+    """
+    Top-k candidates in the shape of the next-element predictions.
+    Only positions holding an element compete; probabilities stay those of
+    the softmax over all candidate slots. A decoded value is attached to the
+    top prediction.
+    """
+    best = top_k(range(len(elements)), k, key=lambda pos: probs[pos])
+    predictions = []
+    for pos in best:
+        elem = elements[pos]
+        prediction = {
+            'rank': len(predictions) + 1,
+            'element_idx': elem.get('idx'),
+            'text': elem.get('text', ''),
+            'action': infer_action(elem),
+            'confidence': round(probs[pos] * 100, 1),
+            'reason': f"Model: {probs[pos] * 100:.0f}%",
+            'bbox': elem.get('bbox', DEFAULT_BBOX)
+        }
+        if value is not None and not predictions:
+            prediction['value'] = value
+        predictions.append(prediction)
+    return predictions
@@ -0,0 +1,122 @@
+# ============================================================================
+# Model Prediction Service API
+# ============================================================================
+# Flask service answering element predictions from ElementFocusedModel.
+# Request threads share one warm model through a micro-batching ModelServer,
+# so concurrent requests run as one forward pass. Predictions have the
+# same shape as /predict/next-element.
+# Model files come from the local model registry (model_registry.py).
+# Run: python model_service.py
+# ============================================================================
+
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+from flask import Flask, Response, request
+from flask_cors import CORS
+
+from service_http import parse_body, require, responders
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for Chrome extension
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 400 for invalid requests, 500 for anything else
+respond, error_response = responders(Response, request, logger)
+
+# Batching limits
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5.0
+REQUEST_TIMEOUT = 30  # Seconds a request waits for its batch
+
+# Directory holding element_focused_model.pt, None uses the model registry
+MODEL_DIR = os.environ.get('ELEMENT_MODEL_DIR')
+# Serve the int8 artifact written by export_model.py
+QUANTIZED = os.environ.get('ELEMENT_MODEL_QUANTIZED', '') not in ('', '0')
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_server():
+    """The process-wide ModelServer, loading the model on first use"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            start = time.perf_counter()
+            from element_model import load_model_from_drive
+            from model_server import ModelServer
+            model, tokenizer, device, config = load_model_from_drive(MODEL_DIR, quantized=QUANTIZED)
+            _server = ModelServer(model, tokenizer, device, config,
+                                  max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
+            logger.info(f"Model ready in {time.perf_counter() - start:.1f}s")
+        return _server
+
+
+def predict_elements(data: Dict) -> Dict:
+    """Rank a page's candidate elements for a task"""
+    require(data, ['task', 'elements'])
+    predictions = get_server().predict(
+        data['task'],
+        data.get('page_summary', ''),
+        data.get('prev_actions', 'None'),
+        data['elements'],
+        top_k=data.get('top_k', 3),
+        timeout=REQUEST_TIMEOUT
+    )
+    return {
+        'success': True,
+        'predictions': predictions
+    }
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Health check endpoint"""
+    return respond({'status': 'ok', 'version': '1.0.0', 'model_loaded': _server is not None})
+
+
+@app.route('/predict/model', methods=['POST'])
+def predict_model():
+    """Predict the element a task needs next"""
+    try:
+        data = parse_body(request.get_data(), request.headers.get('Content-Type'))
+        return respond(predict_elements(data))
+    except Exception as e:
+        return error_response(e, 'Model prediction')
+
+
+@app.route('/predict/model/stats', methods=['GET'])
+def model_stats():
+    """Batching and cache statistics"""
+    try:
+        return respond({'success': True, 'server': get_server().stats()})
+    except Exception as e:
+        return error_response(e, 'Stats')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve ElementFocusedModel predictions')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--model-dir', default=MODEL_DIR,
+                        help='Directory holding element_focused_model.pt (default: the model registry)')
+    parser.add_argument('--quantized', action='store_true', default=QUANTIZED,
+                        help='Serve the int8 artifact written by export_model.py')
+    args = parser.parse_args()
+    MODEL_DIR = args.model_dir
+    QUANTIZED = args.quantized
+
+    # Load before accepting requests so the first ones find a warm model
+    get_server()
+    logger.info(f"🚀 Model service available at http://{args.host}:{args.port}")
+    logger.info("  POST /predict/model - Element predictions for a task")
+    logger.info("  GET /predict/model/stats - Batching statistics")
+    app.run(host=args.host, port=args.port, debug=False, threaded=True)
@@ -0,0 +1,465 @@
+"""
+Per-Page Element Index
+Built once when a page is set on a PredictionSession and reused by every
+prediction against that page. Element dicts are kept for the public API;
+queries run over columnar arrays (NumPy when installed).
+"""
+
+import math
+import sys
+from itertools import chain
+from typing import List, Dict, Tuple
+
+from ranking import bottom_k
+from text_processing import normalize_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_BBOX = [0, 0, 1, 1]
+
+# Vectorized distances use sqrt while compute_spatial_proximity uses ** (C pow),
+# which can differ in the last bit. Candidates within this margin of a cutoff
+# are re-checked with the exact scalar formula.
+DISTANCE_TOLERANCE = 1e-9
+
+# Reference rows per pairwise distance block in batched queries; small
+# blocks stay in cache, which beats one large matrix
+BATCH_ROWS = 16
+
+ACTIONS = ('click', 'input', 'select', 'toggle')
+INPUT_TAGS = ('input', 'textarea')
+INPUT_TYPES = ('text', 'password', 'email')
+CLICK_TAGS = ('button', 'a')
+TOGGLE_TYPES = ('checkbox', 'radio')
+
+
+def _lower(element: Dict, key: str) -> str:
+    return (element.get(key) or '').lower()
+
+
+def infer_action(element: Dict) -> str:
+    """Infer appropriate action for element"""
+    tag = _lower(element, 'tag')
+    elem_type = _lower(element, 'type')
+    text = _lower(element, 'text')
+
+    if tag in INPUT_TAGS or elem_type in INPUT_TYPES:
+        return 'input'
+
+    if tag in CLICK_TAGS or 'button' in text:
+        return 'click'
+
+    if tag == 'select' or 'select' in text or 'dropdown' in text:
+        return 'select'
+
+    if elem_type in TOGGLE_TYPES:
+        return 'toggle'
+
+    return 'click'
+
+
+def _element_text(element: Dict) -> str:
+    text = element.get('text', '')
+    return sys.intern(text) if isinstance(text, str) else ''
+
+
+def bbox_center(bbox: List) -> Tuple[float, float]:
+    """Center of a bounding box, computed exactly like compute_spatial_proximity"""
+    x1, y1, x2, y2 = bbox
+    return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+class SpatialGrid:
+    """Uniform grid of element positions bucketed by bbox center"""
+
+    def __init__(self, centers: List[Tuple[float, float]], cell_size: float = 0.05):
+        self.cell_size = cell_size
+        self.cells = {}  # (col, row) -> [position, ...] in page order
+        for pos, (cx, cy) in enumerate(centers):
+            # Non-finite centers can never be within any radius
+            if math.isfinite(cx) and math.isfinite(cy):
+                self.cells.setdefault(self._cell(cx, cy), []).append(pos)
+
+        cols = [c for c, _ in self.cells] or [0]
+        rows = [r for _, r in self.cells] or [0]
+        self.bounds = (min(cols), min(rows), max(cols), max(rows))
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def ring(self, x: float, y: float, r: int) -> List[int]:
+        """Positions in the cells at Chebyshev distance r from (x, y)'s cell"""
+        col, row = self._cell(x, y)
+        if r == 0:
+            return list(self.cells.get((col, row), ()))
+
+        keys = [(c, row - r) for c in range(col - r, col + r + 1)]
+        keys += [(c, row + r) for c in range(col - r, col + r + 1)]
+        keys += [(col - r, rw) for rw in range(row - r + 1, row + r)]
+        keys += [(col + r, rw) for rw in range(row - r + 1, row + r)]
+
+        positions = []
+        for key in keys:
+            positions.extend(self.cells.get(key, ()))
+        return positions
+
+    def max_ring(self, x: float, y: float) -> int:
+        """Ring number beyond which no populated cell exists"""
+        col, row = self._cell(x, y)
+        min_col, min_row, max_col, max_row = self.bounds
+        return max(col - min_col, max_col - col, row - min_row, max_row - row, 0)
+
+    def within(self, x: float, y: float, radius: float) -> List[int]:
+        """Candidate positions in cells that intersect the circle around (x, y)"""
+        # Slightly inflated so float rounding at cell edges never drops a hit
+        reach = radius * (1 + 1e-9)
+        size = self.cell_size
+        col_lo, row_lo = self._cell(x - reach, y - reach)
+        col_hi, row_hi = self._cell(x + reach, y + reach)
+
+        positions = []
+        for c in range(col_lo, col_hi + 1):
+            dx = max(c * size - x, 0.0, x - (c + 1) * size)
+            for rw in range(row_lo, row_hi + 1):
+                cell = self.cells.get((c, rw))
+                if cell is None:
+                    continue
+                dy = max(rw * size - y, 0.0, y - (rw + 1) * size)
+                if dx * dx + dy * dy <= reach * reach:
+                    positions.extend(cell)
+        return positions
+
+
+class PageIndex:
+    """
+    Columnar view of one page's elements answering proximity and action
+    queries. With NumPy, bbox centers live in float64 arrays and distances
+    are computed vectorized; without it, a SpatialGrid prunes candidates.
+    """
+
+    def __init__(self, elements: List[Dict], cell_size: float = 0.05):
+        self.elements = elements
+        self.cell_size = cell_size
+        self.centers = [bbox_center(elem.get('bbox', DEFAULT_BBOX)) for elem in elements]
+        self.texts = tuple(_element_text(elem) for elem in elements)
+        self.normalized = tuple(normalize_text(text) for text in self.texts)
+        self._index_rows()
+
+        if np is not None:
+            self._build_columns()
+        else:
+            self.action_codes = [ACTIONS.index(infer_action(elem)) for elem in elements]
+
+        self.nbytes = self._estimate_bytes()
+
+    def _index_rows(self):
+        """Lookups by element identity and normalized text"""
+        self.positions = {id(elem): pos for pos, elem in enumerate(self.elements)}
+        self._grid = None
+
+        # Normalized text -> elements in page order, for O(1) history hits
+        self.elements_by_text = {}
+        for elem, text in zip(self.elements, self.normalized):
+            self.elements_by_text.setdefault(text, []).append(elem)
+
+    def apply_delta(
+        self,
+        added: List[Dict] = (),
+        removed: List = (),
+        changed: List[Dict] = ()
+    ) -> 'PageIndex':
+        """
+        New index with elements removed or replaced by idx and new ones
+        appended, equal to PageIndex(resulting elements). Derived data is
+        recomputed only for added and changed elements; this index is left
+        untouched for predictions still using it.
+        """
+        removed = set(removed)
+        changed = {elem.get('idx'): elem for elem in changed}
+
+        kept, elements, fresh = [], [], []
+        for pos, elem in enumerate(self.elements):
+            idx = elem.get('idx')
+            if idx in removed:
+                continue
+            if idx in changed:
+                elem = changed[idx]
+                fresh.append(len(elements))
+            kept.append(pos)
+            elements.append(elem)
+        fresh.extend(range(len(elements), len(elements) + len(added)))
+        elements.extend(added)
+
+        page = PageIndex.__new__(PageIndex)
+        page.elements = elements
+        page.cell_size = self.cell_size
+        page.centers = [self.centers[pos] for pos in kept] + [None] * len(added)
+        texts = [self.texts[pos] for pos in kept] + [None] * len(added)
+        normalized = [self.normalized[pos] for pos in kept] + [None] * len(added)
+        for pos in fresh:
+            elem = elements[pos]
+            page.centers[pos] = bbox_center(elem.get('bbox', DEFAULT_BBOX))
+            texts[pos] = _element_text(elem)
+            normalized[pos] = normalize_text(texts[pos])
+        page.texts = tuple(texts)
+        page.normalized = tuple(normalized)
+        page._index_rows()
+
+        if np is not None:
+            page._update_columns(self, kept, fresh)
+        else:
+            page.action_codes = [self.action_codes[pos] for pos in kept] + [0] * len(added)
+            for pos in fresh:
+                page.action_codes[pos] = ACTIONS.index(infer_action(elements[pos]))
+
+        page.nbytes = page._estimate_bytes()
+        return page
+
+    def _estimate_bytes(self) -> int:
+        """Rough memory footprint of the page (element dicts included)"""
+        text_bytes = sum(len(text) for text in self.texts)
+        array_bytes = 0
+        if np is not None:
+            array_bytes = self.bboxes.nbytes + 2 * self.cx.nbytes + self.ids.nbytes
+            array_bytes += self.tag_codes.nbytes + self.type_codes.nbytes + self.action_codes.nbytes
+        return 800 * len(self.elements) + 2 * text_bytes + array_bytes
+
+    def _build_columns(self):
+        """Float64 bbox matrix, categorical codes and precomputed actions"""
+        n = len(self.elements)
+        # float64 keeps the 0.3 cutoff and distance ties identical to the
+        # scalar path, which float32 rounding would not
+        self.bboxes = np.array(
+            [elem.get('bbox', DEFAULT_BBOX) for elem in self.elements], dtype=np.float64
+        ).reshape(n, 4)
+        self.cx = (self.bboxes[:, 0] + self.bboxes[:, 2]) / 2
+        self.cy = (self.bboxes[:, 1] + self.bboxes[:, 3]) / 2
+        self.ids = np.fromiter((elem.get('idx') for elem in self.elements), dtype=object, count=n)
+
+        self.tag_vocab, self.tag_codes = self._encode([_lower(e, 'tag') for e in self.elements])
+        self.type_vocab, self.type_codes = self._encode([_lower(e, 'type') for e in self.elements])
+        lowered = [text.lower() for text in self.texts]
+        has_button = np.array(['button' in t for t in lowered], dtype=bool)
+        has_select = np.array(['select' in t or 'dropdown' in t for t in lowered], dtype=bool)
+
+        is_input = self._tag_in(INPUT_TAGS) | self._type_in(INPUT_TYPES)
+        is_click = self._tag_in(CLICK_TAGS) | has_button
+        is_select = self._tag_in(('select',)) | has_select
+        is_toggle = self._type_in(TOGGLE_TYPES)
+        # Same precedence as infer_action
+        self.action_codes = np.select(
+            [is_input, is_click, is_select, is_toggle],
+            [ACTIONS.index(a) for a in ('input', 'click', 'select', 'toggle')],
+            default=ACTIONS.index('click')
+        ).astype(np.int8)
+
+    def _update_columns(self, base: 'PageIndex', kept: List[int], fresh: List[int]):
+        """Columns copied from base rows and recomputed at fresh positions"""
+        n = len(self.elements)
+        take = np.array(kept, dtype=np.intp)
+        rows = np.array(fresh, dtype=np.intp)
+        fresh_elements = [self.elements[pos] for pos in fresh]
+
+        self.bboxes = np.empty((n, 4), dtype=np.float64)
+        self.bboxes[:len(kept)] = base.bboxes[take]
+        self.bboxes[rows] = np.array(
+            [elem.get('bbox', DEFAULT_BBOX) for elem in fresh_elements], dtype=np.float64
+        ).reshape(len(fresh), 4)
+        self.cx = (self.bboxes[:, 0] + self.bboxes[:, 2]) / 2
+        self.cy = (self.bboxes[:, 1] + self.bboxes[:, 3]) / 2
+
+        self.ids = np.empty(n, dtype=object)
+        self.ids[:len(kept)] = base.ids[take]
+        self.ids[rows] = np.fromiter((elem.get('idx') for elem in fresh_elements), dtype=object, count=len(fresh))
+
+        self.tag_vocab, self.tag_codes = self._extend_codes(
+            base.tag_vocab, base.tag_codes, take, rows, [_lower(e, 'tag') for e in fresh_elements])
+        self.type_vocab, self.type_codes = self._extend_codes(
+            base.type_vocab, base.type_codes, take, rows, [_lower(e, 'type') for e in fresh_elements])
+
+        self.action_codes = np.empty(n, dtype=np.int8)
+        self.action_codes[:len(kept)] = base.action_codes[take]
+        self.action_codes[rows] = [ACTIONS.index(infer_action(elem)) for elem in fresh_elements]
+
+    def _extend_codes(self, vocab: Dict, codes, take, rows, values: List[str]):
+        vocab = dict(vocab)
+        extended = np.empty(len(self.elements), dtype=np.int32)
+        extended[:len(take)] = codes[take]
+        extended[rows] = [vocab.setdefault(v, len(vocab)) for v in values]
+        return vocab, extended
+
+    @staticmethod
+    def _encode(values: List[str]):
+        vocab = {}
+        codes = np.array([vocab.setdefault(v, len(vocab)) for v in values], dtype=np.int32)
+        return vocab, codes
+
+    def _tag_in(self, tags) -> 'np.ndarray':
+        codes = [self.tag_vocab[t] for t in tags if t in self.tag_vocab]
+        return np.isin(self.tag_codes, codes)
+
+    def _type_in(self, types) -> 'np.ndarray':
+        codes = [self.type_vocab[t] for t in types if t in self.type_vocab]
+        return np.isin(self.type_codes, codes)
+
+    @property
+    def grid(self) -> SpatialGrid:
+        if self._grid is None:
+            self._grid = SpatialGrid(self.centers, self.cell_size)
+        return self._grid
+
+    def action_of(self, element: Dict) -> str:
+        """Precomputed action for an element of this page"""
+        pos = self.positions.get(id(element))
+        if pos is None:
+            return infer_action(element)
+        return ACTIONS[self.action_codes[pos]]
+
+    def _distance(self, center: Tuple[float, float], pos: int) -> float:
+        cx1, cy1 = center
+        cx2, cy2 = self.centers[pos]
+        return ((cx1 - cx2) ** 2 + (cy1 - cy2) ** 2) ** 0.5
+
+    def _closest(self, reference_element: Dict, k: int, radius: float) -> List[Tuple[float, int]]:
+        """
+        Up to k (distance, position) pairs closer than radius, nearest first.
+        Page position breaks distance ties, matching a stable sort.
+        """
+        center = bbox_center(reference_element.get('bbox', DEFAULT_BBOX))
+        ref_idx = reference_element.get('idx')
+        if k <= 0 or not (math.isfinite(center[0]) and math.isfinite(center[1])):
+            return []
+
+        if np is not None:
+            candidates = self._vector_candidates(center, ref_idx, k, radius)
+        elif math.isinf(radius):
+            candidates = self._ring_candidates(center, ref_idx, k)
+        else:
+            candidates = self.grid.within(center[0], center[1], radius)
+
+        closest = []
+        for pos in candidates:
+            if self.elements[pos].get('idx') == ref_idx:
+                continue
+            distance = self._distance(center, pos)
+            if distance < radius:
+                closest.append((distance, pos))
+        return bottom_k(closest, k)
+
+    def _vector_candidates(self, center, ref_idx, k: int, radius: float) -> List[int]:
+        """Positions that can be among the k closest, found with array ops"""
+        dx = self.cx - center[0]
+        dy = self.cy - center[1]
+        approx = np.sqrt(dx * dx + dy * dy)
+
+        keep = (approx < radius + DISTANCE_TOLERANCE) & (self.ids != ref_idx)
+        candidates = np.flatnonzero(keep)
+        if len(candidates) > k:
+            near = approx[candidates]
+            surely_inside = near[near < radius - DISTANCE_TOLERANCE]
+            if len(surely_inside) >= k:
+                # Nothing farther than the k-th approximate distance (plus
+                # rounding slack) can make the exact top k
+                kth = np.partition(surely_inside, k - 1)[k - 1]
+                candidates = candidates[near <= kth + 2 * DISTANCE_TOLERANCE]
+        return candidates.tolist()
+
+    def _closest_many(self, references: List[Dict], k: int, radius: float) -> List[List[Tuple[float, int]]]:
+        """
+        _closest for every reference. Approximate distances come from one
+        pairwise matrix per block of references, the few candidates left
+        per row are re-checked with the exact scalar formula.
+        """
+        if np is None or k <= 0 or not references or not self.elements:
+            return [self._closest(ref, k, radius) for ref in references]
+
+        centers = [bbox_center(ref.get('bbox', DEFAULT_BBOX)) for ref in references]
+        # Positions sharing each reference's idx, excluded like the reference itself
+        by_id = {}
+        for pos, idx in enumerate(self.ids.tolist()):
+            by_id.setdefault(idx, []).append(pos)
+        own = [by_id.get(ref.get('idx'), ()) for ref in references]
+        centers_x = np.array([c[0] for c in centers], dtype=np.float64)
+        centers_y = np.array([c[1] for c in centers], dtype=np.float64)
+
+        results = []
+        for start in range(0, len(references), BATCH_ROWS):
+            rows = slice(start, start + BATCH_ROWS)
+            # Squared distances, in place; the exact re-check below makes the
+            # skipped sqrt irrelevant beyond DISTANCE_TOLERANCE
+            approx = np.subtract.outer(centers_x[rows], self.cx)
+            approx *= approx
+            dy = np.subtract.outer(centers_y[rows], self.cy)
+            dy *= dy
+            approx += dy
+            block_own = own[rows]
+            own_rows = np.repeat(np.arange(len(block_own)), [len(p) for p in block_own])
+            approx[own_rows, np.fromiter(chain.from_iterable(block_own), dtype=np.intp, count=len(own_rows))] = np.inf
+
+            # Same cutoff as _vector_candidates: the k-th distance surely
+            # inside the radius, when there are at least k of those
+            keep = approx < (radius + DISTANCE_TOLERANCE) ** 2
+            if approx.shape[1] >= k:
+                surely_inside = np.where(approx < max(radius - DISTANCE_TOLERANCE, 0) ** 2, approx, np.inf)
+                kth = np.sqrt(np.partition(surely_inside, k - 1, axis=1)[:, k - 1])
+                keep &= approx <= ((kth + 2 * DISTANCE_TOLERANCE) ** 2)[:, None]
+
+            for center, row in zip(centers[rows], keep):
+                if not (math.isfinite(center[0]) and math.isfinite(center[1])):
+                    results.append([])
+                    continue
+                closest = []
+                for pos in np.flatnonzero(row).tolist():
+                    distance = self._distance(center, pos)
+                    if distance < radius:
+                        closest.append((distance, pos))
+                results.append(bottom_k(closest, k))
+        return results
+
+    def _ring_candidates(self, center, ref_idx, k: int) -> List[int]:
+        """Expand grid rings until the k-th closest is nearer than the next ring"""
+        grid = self.grid
+        if not grid.cells:
+            return []
+
+        found = []
+        for r in range(grid.max_ring(*center) + 1):
+            for pos in grid.ring(center[0], center[1], r):
+                if self.elements[pos].get('idx') != ref_idx:
+                    found.append((self._distance(center, pos), pos))
+            # Anything in ring r + 1 or beyond is at least r * cell_size away
+            best = bottom_k(found, k)
+            if len(best) == k and best[-1][0] < r * grid.cell_size:
+                break
+        return [pos for _, pos in found]
+
+    def find_related(
+        self,
+        reference_element: Dict,
+        max_related: int = 3,
+        radius: float = 0.3
+    ) -> List[Dict]:
+        """
+        Elements within radius of the reference, nearest first.
+        Same result as ElementRelationshipAnalyzer.find_related_elements.
+        """
+        return [self.elements[pos] for _, pos in self._closest(reference_element, max_related, radius)]
+
+    def find_related_many(
+        self,
+        references: List[Dict],
+        max_related: int = 3,
+        radius: float = 0.3
+    ) -> List[List[Dict]]:
+        """find_related for several reference elements in one batched query"""
+        return [
+            [self.elements[pos] for _, pos in closest]
+            for closest in self._closest_many(references, max_related, radius)
+        ]
+
+    def nearest(self, reference_element: Dict, k: int = 3) -> List[Tuple[Dict, float]]:
+        """The k nearest elements to the reference with their distances"""
+        return [(self.elements[pos], d) for d, pos in self._closest(reference_element, k, math.inf)]
@@ -0,0 +1,221 @@
+"""
+Prediction API Handlers
+Framework-independent request handling shared by the Flask service
+(predictor_service.py) and the ASGI service (predictor_service_async.py).
+Handlers take the parsed request body and return the response payload.
+"""
+
+import logging
+from typing import Callable, Dict, Optional
+
+from predictor_simplified import PredictionSession
+from page_index import PageIndex
+from session_store import SessionStore
+from history_store import history_store_from_env
+from service_http import RequestError, require
+
+logger = logging.getLogger('predictor_service')
+
+# Session limits
+SESSION_IDLE_TTL = 30 * 60  # Seconds before an idle tab's session is dropped
+MAX_SESSIONS = 5000
+MAX_SESSION_BYTES = 512 * 1024 * 1024  # Approximate memory budget for all sessions
+
+# Elements predicted per batch in bulk requests, superseded() is checked between batches
+BULK_BATCH_SIZE = 64
+
+# Action history shared by worker processes (serve.py), set through
+# PREDICTION_HISTORY_DB; None keeps history in this process only
+history_store = history_store_from_env()
+
+# Global prediction sessions, maps tab_id -> PredictionSession
+prediction_sessions = SessionStore(
+    factory=lambda tab_id: PredictionSession(tab_id, history_store),
+    max_sessions=MAX_SESSIONS,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_bytes=MAX_SESSION_BYTES
+)
+
+
+class UnknownSnapshot(RequestError):
+    """Page snapshot expired; the client should register the page again"""
+    status = 409
+
+
+def get_session(tab_id: str) -> PredictionSession:
+    """Get or create prediction session for tab"""
+    return prediction_sessions.get(tab_id)
+
+
+def _never_superseded() -> bool:
+    return False
+
+
+def resolve_page(session: PredictionSession, data: Dict) -> PageIndex:
+    """The page a prediction request refers to, by snapshot_id or inline all_elements"""
+    if 'snapshot_id' in data:
+        try:
+            return session.page_snapshot(data['snapshot_id'])[1]
+        except KeyError:
+            raise UnknownSnapshot(f"Unknown snapshot_id: {data['snapshot_id']}") from None
+    require(data, ['all_elements', 'page_url'])
+    return session.update_page(data['page_url'], data['all_elements'])
+
+
+def format_prediction(pred: Dict, include_idx: bool = True) -> Dict:
+    """
+    Trim a predictor result to its response fields in place.
+    Predictions are built fresh per call, so no copy is needed.
+    """
+    del pred['element'], pred['reasons']
+    pred['confidence'] = round(pred['confidence'], 1)
+    if not include_idx:
+        del pred['element_idx']
+    return pred
+
+
+def next_element(data: Dict, superseded: Callable[[], bool] = _never_superseded) -> Optional[Dict]:
+    """
+    Predict next element to interact with.
+    Returns None if superseded() turns true before the work is done.
+    """
+    require(data, ['tab_id', 'current_element'])
+    tab_id = data['tab_id']
+
+    # Get or create session
+    session = get_session(tab_id)
+    page = resolve_page(session, data)
+    if superseded():
+        return None
+
+    # Get predictions
+    predictions = session.predict(
+        data['current_element'],
+        instruction=data.get('instruction'),
+        top_k=data.get('top_k', 3),
+        page=page
+    )
+
+    for pred in predictions:
+        format_prediction(pred)
+
+    logger.info(f"Predicted {len(predictions)} next elements for tab {tab_id}")
+    return {
+        'success': True,
+        'predictions': predictions
+    }
+
+
+def register_page(data: Dict) -> Dict:
+    """Store a tab's full page, returns the snapshot id later requests refer to"""
+    require(data, ['tab_id', 'all_elements', 'page_url'])
+    snapshot_id, page = get_session(data['tab_id']).register_page(data['page_url'], data['all_elements'])
+    return {
+        'success': True,
+        'snapshot_id': snapshot_id,
+        'element_count': len(page.elements)
+    }
+
+
+def patch_page(data: Dict) -> Dict:
+    """
+    Apply added / removed (idx list) / changed elements to a snapshot,
+    returns the new snapshot id
+    """
+    require(data, ['tab_id', 'snapshot_id'])
+    session = get_session(data['tab_id'])
+    try:
+        snapshot_id, page = session.patch_page(
+            data['snapshot_id'],
+            added=data.get('added', ()),
+            removed=data.get('removed', ()),
+            changed=data.get('changed', ()),
+            url=data.get('page_url')
+        )
+    except KeyError:
+        raise UnknownSnapshot(f"Unknown snapshot_id: {data['snapshot_id']}") from None
+    return {
+        'success': True,
+        'snapshot_id': snapshot_id,
+        'element_count': len(page.elements)
+    }
+
+
+def record_action(data: Dict) -> Dict:
+    """Record user action for learning"""
+    require(data, ['tab_id', 'element'])
+    tab_id = data['tab_id']
+    element = data['element']
+    action_type = data.get('action_type', 'click')
+
+    get_session(tab_id).record_action(element, action_type)
+
+    logger.info(f"Recorded {action_type} action on '{element.get('text', 'unknown')}' for tab {tab_id}")
+    return {
+        'success': True,
+        'message': f'Action recorded: {action_type}'
+    }
+
+
+def history(tab_id: str) -> Dict:
+    """Get action history for a tab"""
+    summary = get_session(tab_id).get_history_summary()
+    return {
+        'success': True,
+        'history': summary,
+        'actions_count': len(summary.get('actions', [])),
+        'sequences_count': len(summary.get('sequences', {}))
+    }
+
+
+def clear_session(tab_id: str) -> Dict:
+    """Clear prediction session for a tab"""
+    if history_store is not None:
+        # Other workers drop their copy of the history on their next sync
+        history_store.reset(tab_id)
+    if prediction_sessions.remove(tab_id):
+        logger.info(f"Cleared prediction session for tab {tab_id}")
+
+    return {
+        'success': True,
+        'message': f'Session cleared for tab {tab_id}'
+    }
+
+
+def session_stats() -> Dict:
+    """Session store statistics"""
+    return {
+        'success': True,
+        'sessions': prediction_sessions.stats()
+    }
+
+
+def bulk_predict(data: Dict, superseded: Callable[[], bool] = _never_superseded) -> Optional[Dict]:
+    """
+    Get predictions for multiple elements at once.
+    Returns None if superseded() turns true before the work is done.
+    """
+    require(data, ['tab_id', 'elements'])
+    tab_id = data['tab_id']
+    elements = data['elements']
+
+    # Get or create session
+    session = get_session(tab_id)
+    page = resolve_page(session, data)
+
+    # Predict elements in batches, one batched proximity query per batch
+    bulk_predictions = {}
+    for start in range(0, len(elements), BULK_BATCH_SIZE):
+        if superseded():
+            return None
+        batch = elements[start:start + BULK_BATCH_SIZE]
+        for elem, predictions in zip(batch, session.predict_many(batch, top_k=3, page=page)):
+            for pred in predictions:
+                format_prediction(pred, include_idx=False)
+            bulk_predictions[str(elem.get('idx', 'unknown'))] = predictions
+
+    logger.info(f"Generated bulk predictions for {len(elements)} elements in tab {tab_id}")
+    return {
+        'success': True,
+        'predictions': bulk_predictions
+    }
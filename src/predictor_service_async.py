@@ -0,0 +1,177 @@
+# ============================================================================
+# Async Prediction Service API
+# ============================================================================
+# ASGI (Quart) version of predictor_service.py with the same routes.
+# Prediction work runs on a thread pool through a RequestScheduler:
+#   - identical in-flight requests for a tab share one prediction
+#   - a newer prediction request for a tab supersedes older ones (410)
+#   - requests beyond the concurrency and queue limits get 503
+# Bodies are JSON or MessagePack, negotiated as in predictor_service.py.
+# Run: python predictor_service_async.py
+#  or: hypercorn -b localhost:5000 predictor_service_async:app
+# With PREDICTION_HISTORY_DB set, hypercorn -w N runs several processes
+# sharing history, as serve.py does for the Flask service.
+# ============================================================================
+
+from quart import Quart, Response, request
+from quart_cors import cors
+import logging
+
+import prediction_api
+from request_scheduler import RequestScheduler, Superseded, Overloaded
+from service_http import parse_body, require, responders
+
+app = cors(Quart(__name__))  # Enable CORS for Chrome extension
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Concurrency limits
+MAX_CONCURRENT_PREDICTIONS = None  # Defaults to one per core
+MAX_PENDING_REQUESTS = 256  # Queued beyond this, requests get 503
+RETRY_AFTER_SECONDS = 1
+# Superseded requests: a newer one for the tab replaced them, clients must not
+# retry. Distinct from 409, which means the snapshot_id is unknown.
+SUPERSEDED_STATUS = 410
+
+scheduler = RequestScheduler(
+    max_concurrent=MAX_CONCURRENT_PREDICTIONS,
+    max_pending=MAX_PENDING_REQUESTS
+)
+
+
+respond, request_error_response = responders(Response, request, logger)
+
+
+async def request_data():
+    """Decoded request body"""
+    return parse_body(await request.get_data(), request.headers.get('Content-Type'))
+
+
+def error_response(error: Exception, context: str):
+    """Map handler and scheduling errors to responses"""
+    if isinstance(error, Superseded):
+        return respond({'success': False, 'error': 'Superseded by a newer request', 'superseded': True},
+                       SUPERSEDED_STATUS)
+    if isinstance(error, Overloaded):
+        return respond({'success': False, 'error': 'Service overloaded, retry later'}, 503,
+                       {'Retry-After': str(RETRY_AFTER_SECONDS)})
+    return request_error_response(error, context)
+
+
+async def schedule_prediction(route: str, handler):
+    """Coalesce identical bodies and supersede older requests of the tab"""
+    body = await request.get_data()
+    data = parse_body(body, request.headers.get('Content-Type'))
+    require(data, ['tab_id'])
+    return await scheduler.run(
+        data['tab_id'], route, lambda superseded: handler(data, superseded), key=body
+    )
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return respond({'status': 'ok', 'version': '1.0.0'})
+
+
+@app.route('/predict/next-element', methods=['POST'])
+async def predict_next_element():
+    """Predict next element to interact with"""
+    try:
+        return respond(await schedule_prediction('next-element', prediction_api.next_element))
+    except Exception as e:
+        return error_response(e, 'Prediction')
+
+
+@app.route('/predict/page', methods=['POST'])
+async def register_page():
+    """Register a tab's full page, returns a snapshot id"""
+    try:
+        data = await request_data()
+        require(data, ['tab_id'])
+        result = await scheduler.run(
+            data['tab_id'], 'page', lambda _: prediction_api.register_page(data), supersede=False
+        )
+        return respond(result)
+    except Exception as e:
+        return error_response(e, 'Page registration')
+
+
+@app.route('/predict/page', methods=['PATCH'])
+async def patch_page():
+    """Apply an element delta to a page snapshot, returns the new snapshot id"""
+    try:
+        data = await request_data()
+        require(data, ['tab_id'])
+        result = await scheduler.run(
+            data['tab_id'], 'page', lambda _: prediction_api.patch_page(data), supersede=False
+        )
+        return respond(result)
+    except Exception as e:
+        return error_response(e, 'Page update')
+
+
+@app.route('/predict/action', methods=['POST'])
+async def record_action():
+    """Record user action for learning"""
+    try:
+        data = await request_data()
+        require(data, ['tab_id'])
+        result = await scheduler.run(
+            data['tab_id'], 'action', lambda _: prediction_api.record_action(data), supersede=False
+        )
+        return respond(result)
+    except Exception as e:
+        return error_response(e, 'Action recording')
+
+
+@app.route('/predict/history/<tab_id>', methods=['GET'])
+async def get_history(tab_id: str):
+    """Get action history for a tab"""
+    try:
+        result = await scheduler.run(
+            tab_id, 'history', lambda _: prediction_api.history(tab_id), key=tab_id, supersede=False
+        )
+        return respond(result)
+    except Exception as e:
+        return error_response(e, 'History retrieval')
+
+
+@app.route('/predict/session/<tab_id>', methods=['DELETE'])
+async def clear_session(tab_id: str):
+    """Clear prediction session for a tab"""
+    try:
+        result = await scheduler.run(
+            tab_id, 'clear', lambda _: prediction_api.clear_session(tab_id), supersede=False
+        )
+        return respond(result)
+    except Exception as e:
+        return error_response(e, 'Session clearing')
+
+
+@app.route('/predict/stats', methods=['GET'])
+async def session_stats():
+    """Session store and scheduler statistics"""
+    try:
+        stats = prediction_api.session_stats()
+        stats['scheduler'] = scheduler.stats()
+        return respond(stats)
+    except Exception as e:
+        return error_response(e, 'Stats')
+
+
+@app.route('/predict/bulk-predict', methods=['POST'])
+async def bulk_predict():
+    """Get predictions for multiple elements at once"""
+    try:
+        return respond(await schedule_prediction('bulk-predict', prediction_api.bulk_predict))
+    except Exception as e:
+        return error_response(e, 'Bulk prediction')
+
+
+if __name__ == '__main__':
+    logger.info("🚀 Starting Async Prediction Service...")
+    logger.info("Service will be available at http://localhost:5000")
+    app.run(host='localhost', port=5000, debug=False)
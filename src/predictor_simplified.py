@@ -4,25 +4,150 @@ Predicts next element based on history, proximity, and context
 """
 
 from typing import List, Dict, Optional, Tuple
-from collections import defaultdict, Counter
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime
-import re
+import sys
+import threading
+import time
+import uuid
 
+from ranking import top_k, bottom_k
+from page_index import PageIndex, infer_action
+from text_processing import normalize_text
+from history_store import RESET_ACTION, TOUCH_INTERVAL
 
-def normalize_text(text: str) -> str:
-    """Normalize text for comparison"""
-    text = text.lower().strip()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text
+
+# Ranked successors published per context for lock-free reads
+SNAPSHOT_SIZE = 5
+
+# Page snapshots kept per session for requests and deltas referencing them
+MAX_PAGE_SNAPSHOTS = 4
+
+
+class TransitionRow:
+    """
+    Successor counts for one state, kept ranked as counts change.
+    Writers must be serialized; after each change the top SNAPSHOT_SIZE
+    successors are published as an immutable tuple that readers can use
+    without locking.
+    
+    A full row replaces its lowest ranked successor Space-Saving style: the
+    newcomer inherits the evicted count, so it can climb on later hits and
+    total stays the sum of the counts held.
+    """
+    __slots__ = ('counts', 'first_seen', 'seen', 'ranked', 'positions', 'total', 'observations', 'snapshot')
+    
+    def __init__(self):
+        self.counts = {}      # successor -> count
+        self.first_seen = {}  # successor -> insertion order, breaks count ties
+        self.seen = 0         # next insertion order, never reused
+        self.ranked = []      # successors by count desc, then first seen
+        self.positions = {}   # successor -> index in ranked
+        self.total = 0
+        self.observations = 0
+        self.snapshot = (0, ())  # (total, ((successor, count), ...))
+    
+    def _publish(self):
+        top = tuple((s, self.counts[s]) for s in self.ranked[:SNAPSHOT_SIZE])
+        self.snapshot = (self.total, top)
+    
+    def _before(self, a: str, b: str) -> bool:
+        """Whether successor a ranks ahead of b"""
+        ca, cb = self.counts[a], self.counts[b]
+        return ca > cb or (ca == cb and self.first_seen[a] < self.first_seen[b])
+    
+    def add(self, successor: str, weight, max_successors: Optional[int] = None):
+        """
+        Count one transition and restore rank order by bubbling up.
+        A new successor in a row holding max_successors replaces the last one.
+        """
+        self.total += weight
+        self.observations += 1
+        if successor not in self.counts:
+            if max_successors is not None and len(self.ranked) >= max_successors:
+                evicted = self.ranked.pop()
+                self.counts[successor] = self.counts.pop(evicted)
+                del self.first_seen[evicted], self.positions[evicted]
+            else:
+                self.counts[successor] = 0
+            self.first_seen[successor] = self.seen
+            self.seen += 1
+            self.positions[successor] = len(self.ranked)
+            self.ranked.append(successor)
+        self.counts[successor] += weight
+        
+        i = self.positions[successor]
+        while i > 0 and self._before(successor, self.ranked[i - 1]):
+            prev = self.ranked[i - 1]
+            self.ranked[i], self.positions[prev] = prev, i
+            i -= 1
+        self.ranked[i], self.positions[successor] = successor, i
+        self._publish()
+    
+    def scale(self, factor: float):
+        for successor in self.counts:
+            self.counts[successor] *= factor
+        self.total *= factor
+        self._publish()
+    
+    def read(self, k: int) -> Tuple[float, List[Tuple[str, float]]]:
+        """Total and top k (successor, count), lock-free for k <= SNAPSHOT_SIZE"""
+        if k <= SNAPSHOT_SIZE:
+            total, top = self.snapshot
+            return total, list(top[:k])
+        return self.total, [(s, self.counts[s]) for s in self.ranked[:k]]
+    
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return self.read(k)[1]
+    
+    def state(self) -> List:
+        """JSON-serializable [seen, total, observations, [[successor, count, first_seen], ...]]"""
+        return [self.seen, self.total, self.observations,
+                [[s, self.counts[s], self.first_seen[s]] for s in self.ranked]]
+    
+    @classmethod
+    def from_state(cls, state: List) -> 'TransitionRow':
+        row = cls()
+        row.seen, row.total, row.observations, successors = state
+        for position, (successor, count, first_seen) in enumerate(successors):
+            successor = sys.intern(successor)
+            row.counts[successor] = count
+            row.first_seen[successor] = first_seen
+            row.positions[successor] = position
+            row.ranked.append(successor)
+        row._publish()
+        return row
 
 
 class ActionHistory:
-    """Track user action sequences"""
-    def __init__(self, max_history=50):
-        self.actions = []
+    """
+    Track user action sequences.
+    Recent actions live in a ring buffer. Transitions are counted
+    incrementally for every context of the last 1..max_order normalized
+    element texts (a variable-order Markov model), each context keeping its
+    successors ranked, so the most likely next actions are a prefix read.
+    
+    Lookups back off from the longest context seen at least
+    min_context_count times to shorter ones.
+    decay < 1 weights recent transitions exponentially more than old ones.
+    max_contexts / max_successors bound memory by pruning the least observed
+    contexts (longer, rarer ones go first) and replacing the lowest ranked
+    successor of a full context (see TransitionRow).
+    """
+    def __init__(self, max_history=50, max_order: int = 3, min_context_count: int = 2,
+                 decay: float = 1.0, max_contexts: int = 20000, max_successors: int = 50):
+        self.actions = deque(maxlen=max_history)
         self.max_history = max_history
-        self.action_sequences = defaultdict(list)
+        self.max_order = max_order
+        self.min_context_count = min_context_count
+        self.decay = decay
+        self.max_contexts = max_contexts
+        self.max_successors = max_successors
+        self.transitions = {}  # (state, ...) context -> TransitionRow
+        self.successor_entries = 0  # successors held across all contexts
+        self._recent = deque(maxlen=max_order)  # last normalized states
+        # Weights grow by 1/decay per action instead of decaying every count
+        self._weight = 1
     
     def add_action(self, element_text: str, element_idx: int, bbox: List, action_type: str = 'click'):
         """Record a user action"""
@@ -35,37 +160,107 @@ class ActionHistory:
         }
         self.actions.append(action)
         
-        if len(self.actions) > self.max_history:
-            self.actions.pop(0)
+        state = sys.intern(normalize_text(element_text))
+        recent = tuple(self._recent)
+        for order in range(1, len(recent) + 1):
+            self._add_transition(recent[-order:], state)
+        self._recent.append(state)
+        
+        if self.decay < 1 and recent:
+            self._weight /= self.decay
+            if self._weight > 1e12:
+                self._rescale()
+    
+    def _add_transition(self, context: Tuple[str, ...], successor: str):
+        row = self.transitions.get(context)
+        if row is None:
+            if len(self.transitions) >= self.max_contexts:
+                self._prune_contexts()
+            row = self.transitions[context] = TransitionRow()
         
-        if len(self.actions) >= 2:
-            prev_action = self.actions[-2]
-            norm_prev = normalize_text(prev_action['text'])
-            self.action_sequences[norm_prev].append(normalize_text(element_text))
+        before = len(row.ranked)
+        row.add(successor, self._weight, self.max_successors)
+        self.successor_entries += len(row.ranked) - before
+    
+    def _prune_contexts(self):
+        """Drop the least observed ~10% of contexts (amortized O(log n) per insert)"""
+        keep = int(self.max_contexts * 0.9)
+        by_count = sorted(
+            self.transitions,
+            key=lambda c: (self.transitions[c].observations, -len(c))
+        )
+        for context in by_count[:len(self.transitions) - keep]:
+            self.successor_entries -= len(self.transitions.pop(context).ranked)
+    
+    def _rescale(self):
+        """Bring decayed weights back into float range, ranks are unchanged"""
+        factor = 1 / self._weight
+        for row in self.transitions.values():
+            row.scale(factor)
+        self._weight = 1.0
+    
+    def _contexts(self, state: str) -> List[Tuple[str, ...]]:
+        """Contexts ending in state, longest first"""
+        recent = tuple(self._recent)
+        # Longer contexts only apply when state is the latest recorded action
+        if not recent or recent[-1] != state:
+            return [(state,)]
+        return [recent[-order:] for order in range(len(recent), 0, -1)]
     
     def get_likely_next_actions(self, current_element_text: str, top_k: int = 3) -> List[Tuple[str, float]]:
         """Get likely next actions based on history"""
-        norm_text = normalize_text(current_element_text)
-        
-        if norm_text not in self.action_sequences:
-            return []
-        
-        next_actions = self.action_sequences[norm_text]
-        counter = Counter(next_actions)
-        total = len(next_actions)
-        
         results = []
-        for action, count in counter.most_common(top_k):
-            confidence = (count / total) * 100
-            results.append((action, confidence))
+        seen = set()
+        for context in self._contexts(normalize_text(current_element_text)):
+            row = self.transitions.get(context)
+            if row is None:
+                continue
+            # First-order context is always trusted, longer ones need evidence
+            if len(context) > 1 and row.observations < self.min_context_count:
+                continue
+            
+            total, top = row.read(top_k)
+            for action, count in top:
+                if action not in seen:
+                    seen.add(action)
+                    results.append((action, (count / total) * 100))
+            if len(results) >= top_k:
+                break
         
-        return results
+        return results[:top_k]
+    
+    def approx_bytes(self) -> int:
+        """Rough memory footprint, O(1)"""
+        return 500 * len(self.actions) + 400 * len(self.transitions) + 250 * self.successor_entries
+    
+    def to_state(self) -> Dict:
+        """JSON-serializable copy of everything recorded, see load_state"""
+        return {
+            'actions': list(self.actions),
+            'recent': list(self._recent),
+            'weight': self._weight,
+            'transitions': [[list(context), row.state()] for context, row in self.transitions.items()]
+        }
+    
+    def load_state(self, state: Dict):
+        """Replace the recorded history with a to_state() copy"""
+        self.actions = deque(state['actions'], maxlen=self.max_history)
+        self._recent = deque((sys.intern(s) for s in state['recent']), maxlen=self.max_order)
+        self._weight = state['weight']
+        self.transitions = {
+            tuple(sys.intern(s) for s in context): TransitionRow.from_state(row)
+            for context, row in state['transitions']
+        }
+        self.successor_entries = sum(len(row.ranked) for row in self.transitions.values())
     
     def to_dict(self) -> Dict:
         """Serialize for storage"""
         return {
-            'actions': self.actions[-10:],
-            'sequences': {k: list(Counter(v).most_common(5)) for k, v in self.action_sequences.items()}
+            'actions': list(self.actions)[-10:],
+            'sequences': {
+                context[0]: row.top(5)
+                for context, row in self.transitions.items() if len(context) == 1
+            }
         }
 
 
@@ -101,8 +296,8 @@ class ElementRelationshipAnalyzer:
             if distance < 0.3:
                 related.append((elem, distance))
         
-        related.sort(key=lambda x: x[1])
-        return [elem for elem, _ in related[:max_related]]
+        nearest = bottom_k(related, max_related, key=lambda x: x[1])
+        return [elem for elem, _ in nearest]
 
 
 class NextElementPredictor:
@@ -118,54 +313,107 @@ class NextElementPredictor:
         all_elements: List[Dict],
         context_instruction: Optional[str] = None,
         use_history: bool = True,
-        use_proximity: bool = True
+        use_proximity: bool = True,
+        page: Optional[PageIndex] = None
     ) -> List[Dict]:
-        """Predict next element(s) to interact with"""
-        
-        predictions = []
-        scores = defaultdict(lambda: {'confidence': 0, 'reasons': []})
+        """
+        Predict next element(s) to interact with.
+        Pass the PageIndex built for all_elements to resolve history hits
+        and proximity queries from its indexes instead of scanning every element.
+        """
         
         # 1. History-based prediction
+        history_predictions = []
         if use_history and current_element.get('text'):
             history_predictions = self.history.get_likely_next_actions(
                 current_element['text'], top_k=3
             )
-            
-            for next_text, confidence in history_predictions:
-                for elem in all_elements:
-                    if normalize_text(elem.get('text', '')) == next_text:
-                        elem_id = id(elem)
-                        scores[elem_id]['confidence'] = max(
-                            scores[elem_id]['confidence'],
-                            confidence * 0.8
-                        )
-                        scores[elem_id]['reasons'].append(
-                            f"History: {confidence:.0f}%"
-                        )
-                        scores[elem_id]['element'] = elem
-                        break
+        history_hits = [
+            (self._find_by_text(next_text, all_elements, page), confidence)
+            for next_text, confidence in history_predictions
+        ]
         
         # 2. Proximity-based prediction
+        nearby_elements = []
         if use_proximity:
-            nearby_elements = self.analyzer.find_related_elements(
-                current_element, all_elements, max_related=5
-            )
-            
-            for i, elem in enumerate(nearby_elements):
-                proximity_score = (1 - (i / len(nearby_elements))) * 60
-                
+            if page is not None:
+                nearby_elements = page.find_related(current_element, max_related=5)
+            else:
+                nearby_elements = self.analyzer.find_related_elements(
+                    current_element, all_elements, max_related=5
+                )
+        
+        return self._rank(history_hits, nearby_elements, page)
+    
+    def predict_many(
+        self,
+        current_elements: List[Dict],
+        page: PageIndex,
+        use_history: bool = True,
+        use_proximity: bool = True
+    ) -> List[List[Dict]]:
+        """
+        predict_next_element for several current elements of one page.
+        Proximity comes from one batched query, and history lookups are
+        shared by current elements with the same text.
+        """
+        nearby = [[] for _ in current_elements]
+        if use_proximity:
+            nearby = page.find_related_many(current_elements, max_related=5)
+        
+        history_hits = {}  # element text -> [(element, confidence), ...]
+        results = []
+        for current_element, nearby_elements in zip(current_elements, nearby):
+            text = current_element.get('text')
+            hits = []
+            if use_history and text:
+                hits = history_hits.get(text)
+                if hits is None:
+                    hits = history_hits[text] = [
+                        (self._find_by_text(next_text, page.elements, page), confidence)
+                        for next_text, confidence in self.history.get_likely_next_actions(text, top_k=3)
+                    ]
+            results.append(self._rank(hits, nearby_elements, page))
+        return results
+    
+    def _rank(
+        self,
+        history_hits: List[Tuple[Optional[Dict], float]],
+        nearby_elements: List[Dict],
+        page: Optional[PageIndex]
+    ) -> List[Dict]:
+        """Combine history hits and nearby elements into the top 5 predictions"""
+        predictions = []
+        scores = defaultdict(lambda: {'confidence': 0, 'reasons': []})
+        
+        for elem, confidence in history_hits:
+            if elem is not None:
                 elem_id = id(elem)
                 scores[elem_id]['confidence'] = max(
                     scores[elem_id]['confidence'],
-                    proximity_score
+                    confidence * 0.8
                 )
                 scores[elem_id]['reasons'].append(
-                    f"Nearby (rank: {i+1})"
+                    f"History: {confidence:.0f}%"
                 )
                 scores[elem_id]['element'] = elem
         
-        # Build final predictions
-        for elem_id, score_data in scores.items():
+        for i, elem in enumerate(nearby_elements):
+            proximity_score = (1 - (i / len(nearby_elements))) * 60
+            
+            elem_id = id(elem)
+            scores[elem_id]['confidence'] = max(
+                scores[elem_id]['confidence'],
+                proximity_score
+            )
+            scores[elem_id]['reasons'].append(
+                f"Nearby (rank: {i+1})"
+            )
+            scores[elem_id]['element'] = elem
+        
+        # Build predictions for the top 5 only
+        best = top_k(scores.values(), 5, key=lambda x: x['confidence'])
+        for score_data in best:
             elem = score_data['element']
             
             predictions.append({
@@ -173,40 +421,34 @@ class NextElementPredictor:
                 'element_idx': elem.get('idx'),
                 'text': elem.get('text', ''),
                 'bbox': elem.get('bbox', [0, 0, 1, 1]),
-                'action': self._infer_action(elem),
+                'action': page.action_of(elem) if page is not None else self._infer_action(elem),
                 'confidence': score_data['confidence'],
                 'reasons': score_data['reasons'],
-                'reason': ' | '.join(score_data['reasons'])
+                'reason': ' | '.join(score_data['reasons']),
+                'rank': len(predictions) + 1
             })
         
-        # Sort by confidence
-        predictions.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        # Add ranks
-        for i, pred in enumerate(predictions, 1):
-            pred['rank'] = i
+        return predictions
+    
+    def _find_by_text(
+        self,
+        normalized_text: str,
+        all_elements: List[Dict],
+        page: Optional[PageIndex] = None
+    ) -> Optional[Dict]:
+        """First element on the page whose normalized text matches"""
+        if page is not None:
+            matches = page.elements_by_text.get(normalized_text)
+            return matches[0] if matches else None
         
-        return predictions[:5]
+        for elem in all_elements:
+            if normalize_text(elem.get('text', '')) == normalized_text:
+                return elem
+        return None
     
     def _infer_action(self, element: Dict) -> str:
         """Infer appropriate action for element"""
-        tag = element.get('tag', '').lower()
-        elem_type = element.get('type', '').lower()
-        text = element.get('text', '').lower()
-        
-        if tag in ['input', 'textarea'] or elem_type in ['text', 'password', 'email']:
-            return 'input'
-        
-        if tag in ['button', 'a'] or 'button' in text:
-            return 'click'
-        
-        if tag == 'select' or 'select' in text or 'dropdown' in text:
-            return 'select'
-        
-        if elem_type in ['checkbox', 'radio']:
-            return 'toggle'
-        
-        return 'click'
+        return infer_action(element)
     
     def record_action(self, element: Dict, action_type: str = 'click'):
         """Record user action for learning"""
@@ -220,41 +462,219 @@ class NextElementPredictor:
     def get_history_summary(self) -> Dict:
         """Get action history summary"""
         return self.history.to_dict()
+    
+    def approx_bytes(self) -> int:
+        return self.history.approx_bytes()
 
 
 class PredictionSession:
-    """Manage prediction sessions across page interactions"""
+    """
+    Manage prediction sessions across page interactions.
+    Writes (page updates, recorded actions) are serialized by a per-session
+    lock. Predictions take no lock: the page index is immutable once built
+    and history reads use published snapshots.
     
-    def __init__(self):
+    With a history_store shared between worker processes, recorded actions
+    go through the store's log and every session replays it in sequence
+    order, so any worker serving the tab sees the same history. Once the
+    log holds max_actions_per_tab actions past the tab's checkpoint, the
+    session recording the next action stores a new checkpoint.
+    """
+    
+    def __init__(self, tab_id: Optional[str] = None, history_store=None):
         self.predictor = NextElementPredictor()
         self.current_page_url = None
-        self.current_elements = []
+        self.page = None
+        self.lock = threading.Lock()
+        self.tab_id = tab_id
+        self.history_store = history_store
+        self.last_seq = 0  # last history_store entry applied
+        self.log_length = 0  # entries applied since the last checkpoint
+        self.last_touch = 0.0  # when the tab was last marked active in the store
+        self.page_snapshots = OrderedDict()  # snapshot_id -> (url, PageIndex), newest last
+    
+    @property
+    def current_elements(self) -> List[Dict]:
+        page = self.page
+        return page.elements if page is not None else []
+    
+    def update_page(self, url: str, elements: List[Dict]) -> PageIndex:
+        """
+        Update current page context and build its index.
+        No snapshot is kept: inline pages are never referred to by id.
+        """
+        page = PageIndex(elements)
+        with self.lock:
+            self.current_page_url = url
+            self.page = page
+        return page
+    
+    def register_page(self, url: str, elements: List[Dict]) -> Tuple[str, PageIndex]:
+        """Set the current page, returns its snapshot id and index"""
+        return self._publish_page(url, PageIndex(elements))
+    
+    def patch_page(
+        self,
+        snapshot_id: str,
+        added: List[Dict] = (),
+        removed: List = (),
+        changed: List[Dict] = (),
+        url: Optional[str] = None
+    ) -> Tuple[str, PageIndex]:
+        """
+        Apply an element delta to a snapshot and make the result the
+        current page. Removed and changed elements are matched by idx.
+        """
+        base_url, base = self.page_snapshot(snapshot_id)
+        delta = {'added': list(added), 'removed': list(removed), 'changed': list(changed)}
+        return self._publish_page(url or base_url, base.apply_delta(added, removed, changed), (snapshot_id, delta))
+    
+    def page_snapshot(self, snapshot_id: str) -> Tuple[str, PageIndex]:
+        """
+        (url, page) of a recent snapshot, KeyError once it has been dropped.
+        Snapshots another worker registered or patched are rebuilt from the
+        history_store, starting from the newest one held here.
+        """
+        snapshot = self.page_snapshots.get(snapshot_id)
+        if snapshot is not None:
+            return snapshot
+        with self.lock:
+            known = dict(self.page_snapshots)
+        chain = self.history_store.fetch_page(self.tab_id, snapshot_id, known) if self.history_store else None
+        if chain is None:
+            raise KeyError(snapshot_id)
+        
+        *deltas, (base_id, url, elements, _) = chain
+        snapshot = known[base_id] if elements is None else (url, PageIndex(elements))
+        for _, url, _, delta in reversed(deltas):
+            snapshot = (url, snapshot[1].apply_delta(delta['added'], delta['removed'], delta['changed']))
+        with self.lock:
+            self._keep_snapshot(snapshot_id, snapshot)
+        return snapshot
     
-    def update_page(self, url: str, elements: List[Dict]):
-        """Update current page context"""
-        self.current_page_url = url
-        self.current_elements = elements
+    def _publish_page(self, url: str, page: PageIndex, delta: Optional[Tuple[str, Dict]] = None) -> Tuple[str, PageIndex]:
+        """Make page current under a new snapshot id; delta is (base_id, delta) for patched pages"""
+        snapshot_id = uuid.uuid4().hex
+        if self.history_store is not None:
+            # Patches store only their delta, a full page when the base's chain is full
+            if delta is None or not self.history_store.save_delta(
+                    self.tab_id, snapshot_id, delta[0], url, delta[1], MAX_PAGE_SNAPSHOTS):
+                self.history_store.save_page(self.tab_id, snapshot_id, url, page.elements, MAX_PAGE_SNAPSHOTS)
+        with self.lock:
+            self.current_page_url = url
+            self.page = page
+            self._keep_snapshot(snapshot_id, (url, page))
+        return snapshot_id, page
+    
+    def _keep_snapshot(self, snapshot_id: str, snapshot: Tuple[str, PageIndex]):
+        self.page_snapshots[snapshot_id] = snapshot
+        while len(self.page_snapshots) > MAX_PAGE_SNAPSHOTS:
+            self.page_snapshots.popitem(last=False)
     
     def predict(
         self,
         current_element: Dict,
         instruction: Optional[str] = None,
-        top_k: int = 3
+        top_k: int = 3,
+        page: Optional[PageIndex] = None
     ) -> List[Dict]:
-        """Get predictions for next action"""
-        if not self.current_elements:
+        """
+        Get predictions for next action.
+        Pass the page returned by update_page to predict against exactly
+        that page even if another request has replaced it meanwhile.
+        """
+        page = page or self.page
+        if page is None or not page.elements:
             return []
         
+        self.sync()
         predictions = self.predictor.predict_next_element(
             current_element,
-            self.current_elements,
+            page.elements,
             context_instruction=instruction,
             use_history=True,
-            use_proximity=True
+            use_proximity=True,
+            page=page
         )
         
         return predictions[:top_k]
     
+    def predict_many(
+        self,
+        current_elements: List[Dict],
+        top_k: int = 3,
+        page: Optional[PageIndex] = None
+    ) -> List[List[Dict]]:
+        """Predictions for several current elements against one page, in one pass"""
+        page = page or self.page
+        if page is None or not page.elements:
+            return [[] for _ in current_elements]
+        
+        self.sync()
+        return [
+            predictions[:top_k]
+            for predictions in self.predictor.predict_many(current_elements, page)
+        ]
+    
     def record_action(self, element: Dict, action_type: str = 'click'):
         """Record action for learning"""
-        self.predictor.record_action(element, action_type)
+        if self.history_store is None:
+            with self.lock:
+                self.predictor.record_action(element, action_type)
+            return
+        
+        recorded = {
+            'text': element.get('text', 'Unknown'),
+            'idx': element.get('idx', -1),
+            'bbox': element.get('bbox', [0, 0, 1, 1])
+        }
+        self.history_store.append(self.tab_id, recorded, action_type)
+        self.sync()
+        if self.log_length >= self.history_store.max_actions_per_tab:
+            self._checkpoint()
+    
+    def sync(self):
+        """Apply actions other workers appended to the shared history"""
+        if self.history_store is None:
+            return
+        now = time.time()
+        if now - self.last_touch >= TOUCH_INTERVAL:
+            # Predicting keeps a tab alive in the store as recording does
+            self.last_touch = now
+            self.history_store.touch(self.tab_id)
+        with self.lock:
+            checkpoint, entries = self.history_store.fetch_log(self.tab_id, self.last_seq)
+            if checkpoint is not None:
+                self.last_seq, state = checkpoint
+                self.predictor = NextElementPredictor()
+                self.predictor.history.load_state(state)
+                self.log_length = 0
+            for entry in entries:
+                if entry['action_type'] == RESET_ACTION:
+                    self.predictor = NextElementPredictor()
+                    self.log_length = 0
+                else:
+                    self.predictor.record_action(entry['element'], entry['action_type'])
+                    self.log_length += 1
+                self.last_seq = entry['seq']
+    
+    def _checkpoint(self):
+        """Store the replayed history so the actions it covers can be dropped"""
+        with self.lock:
+            seq, state = self.last_seq, self.predictor.history.to_state()
+            self.log_length = 0
+        self.history_store.save_checkpoint(self.tab_id, seq, state)
+    
+    def get_history_summary(self) -> Dict:
+        self.sync()
+        with self.lock:
+            return self.predictor.get_history_summary()
+    
+    def approx_bytes(self) -> int:
+        """Rough memory footprint of the page snapshots and history, O(1)"""
+        # Snapshots derived by deltas share element dicts, so this overestimates
+        pages = [page for _, page in list(self.page_snapshots.values())]
+        current = self.page
+        if current is not None and all(page is not current for page in pages):
+            pages.append(current)
+        return sum(page.nbytes for page in pages) + self.predictor.approx_bytes()
@@ -0,0 +1,30 @@
+"""
+Top-k Selection Utilities
+Partial selection shared by the element selector and the next-element
+predictor, O(n log k) instead of sorting every candidate.
+"""
+
+import heapq
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+def top_k(items: Iterable[T], k: int, key: Optional[Callable] = None) -> List[T]:
+    """
+    The k largest items by key, highest first.
+    Same result as sorted(items, key=key, reverse=True)[:k], ties keep input order.
+    """
+    if k <= 0:
+        return []
+    return heapq.nlargest(k, items, key=key)
+
+
+def bottom_k(items: Iterable[T], k: int, key: Optional[Callable] = None) -> List[T]:
+    """
+    The k smallest items by key, lowest first.
+    Same result as sorted(items, key=key)[:k], ties keep input order.
+    """
+    if k <= 0:
+        return []
+    return heapq.nsmallest(k, items, key=key)
@@ -0,0 +1,134 @@
+"""
+Per-Tab Request Scheduling
+Runs blocking prediction handlers from an asyncio server on a thread pool.
+Identical in-flight requests for a tab share one execution, a newer request
+for the same tab and route supersedes older ones, and a bounded number of
+jobs may run or wait at once.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class Superseded(Exception):
+    """A newer request for the same tab and route replaced this one"""
+
+
+class Overloaded(Exception):
+    """Too many requests running or queued"""
+
+
+class _Job:
+    __slots__ = ('task', 'started')
+
+    def __init__(self):
+        self.task = None
+        self.started = False
+
+
+class RequestScheduler:
+    """
+    Coalescing, superseding and backpressure for per-tab request handlers.
+    handler(superseded) runs on the executor; it should check superseded()
+    between expensive steps and return None once it is true.
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_pending: int = 256,
+                 executor: Optional[Executor] = None):
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.executor = executor
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._active = 0  # jobs running or waiting for a slot
+        self._latest = {}  # (tab_id, route) -> newest job
+        self._inflight = {}  # ((tab_id, route), key) -> job
+        self.counters = {'executed': 0, 'coalesced': 0, 'superseded': 0, 'rejected': 0}
+
+    async def run(
+        self,
+        tab_id: str,
+        route: str,
+        handler: Callable[[Callable[[], bool]], Any],
+        key: Optional[Hashable] = None,
+        supersede: bool = True
+    ) -> Any:
+        """
+        Run handler for a tab's request, or join an identical one in flight.
+        key identifies identical requests (None never coalesces).
+        Raises Superseded or Overloaded.
+        """
+        slot = (tab_id, route)
+        if key is not None:
+            job = self._inflight.get((slot, key))
+            # A job some newer request superseded must not take new waiters
+            if job is not None and (not supersede or self._latest.get(slot) is job):
+                self.counters['coalesced'] += 1
+                return await self._wait(job)
+
+        if self._active >= self.max_concurrent + self.max_pending:
+            self.counters['rejected'] += 1
+            raise Overloaded()
+
+        job = _Job()
+        if supersede:
+            previous = self._latest.get(slot)
+            if previous is not None and not previous.started:
+                # Never started, so nothing to interrupt
+                previous.task.cancel()
+            self._latest[slot] = job
+
+        self._active += 1
+        job.task = asyncio.ensure_future(self._execute(slot, job, handler, supersede))
+        if key is not None:
+            self._inflight[(slot, key)] = job
+        job.task.add_done_callback(lambda task: self._finish(slot, key, job))
+        return await self._wait(job)
+
+    async def _execute(self, slot, job: _Job, handler, supersede: bool):
+        if supersede:
+            def superseded() -> bool:
+                return self._latest.get(slot) is not job
+        else:
+            def superseded() -> bool:
+                return False
+
+        async with self._semaphore:
+            if superseded():
+                raise Superseded()
+            job.started = True
+            self.counters['executed'] += 1
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, handler, superseded)
+        if result is None:
+            raise Superseded()
+        return result
+
+    async def _wait(self, job: _Job):
+        try:
+            return await asyncio.shield(job.task)
+        except asyncio.CancelledError:
+            if job.task.cancelled():
+                raise Superseded() from None
+            raise
+
+    def _finish(self, slot, key, job: _Job):
+        self._active -= 1
+        if key is not None and self._inflight.get((slot, key)) is job:
+            del self._inflight[(slot, key)]
+        if self._latest.get(slot) is job:
+            del self._latest[slot]
+
+        task = job.task
+        # Mark the outcome retrieved even if every waiter disconnected
+        if task.cancelled() or isinstance(task.exception(), Superseded):
+            self.counters['superseded'] += 1
+
+    def stats(self) -> Dict:
+        return {
+            'active': self._active,
+            'max_concurrent': self.max_concurrent,
+            'max_pending': self.max_pending,
+            **self.counters
+        }
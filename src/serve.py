@@ -0,0 +1,156 @@
+# ============================================================================
+# Multi-Process Prediction Service
+# ============================================================================
+# Production entry point: N worker processes accept connections from one
+# shared listening socket. Action history is persisted in an SQLite log
+# that every worker replays, so any worker can serve any tab.
+# Page snapshots (/predict/page) are stored in the same SQLite file, so a
+# worker that did not register a snapshot loads it from there on first use.
+# The supervisor purges tabs idle for SESSION_IDLE_TTL from the file every
+# PURGE_INTERVAL seconds, so closed tabs do not accumulate on disk.
+#
+# Run: python serve.py --workers 4 --port 5000 --history-db ./prediction_history.db
+#
+# The same setup works under gunicorn, which preforks the same way:
+#   PREDICTION_HISTORY_DB=./prediction_history.db \
+#       gunicorn -w 4 --threads 4 -b 0.0.0.0:5000 predictor_service:app
+# ============================================================================
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 60  # Seconds between purges of idle tabs from the history file
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the prediction service with several worker processes')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--history-db', default=os.environ.get('PREDICTION_HISTORY_DB', 'prediction_history.db'),
+                        help='SQLite file holding the shared action history')
+    return parser.parse_args()
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Listening socket created once and inherited by every worker"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, host: str, port: int, fd: int):
+    """Serve requests on the shared socket until terminated"""
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C
+    server = make_server(host, port, app, threaded=True, fd=fd)
+    server.serve_forever()
+
+
+def purge_idle_tabs(store) -> int:
+    """Remove tabs idle for longer than the session TTL from the shared history"""
+    from prediction_api import SESSION_IDLE_TTL
+    try:
+        deleted = store.purge_idle(SESSION_IDLE_TTL)
+    except Exception as e:
+        logger.warning(f"Purging idle tabs failed: {e}")
+        return 0
+    if deleted:
+        logger.info(f"Purged {deleted} rows of idle tabs from the history")
+    return deleted
+
+
+def purge_periodically(store):
+    """Single-process mode has no supervisor loop, purge from a daemon thread"""
+    while True:
+        time.sleep(PURGE_INTERVAL)
+        purge_idle_tabs(store)
+
+
+def spawn_worker(app, host: str, port: int, fd: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, host, port, fd)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    args = parse_args()
+    # Must be set before the service module builds its session store
+    os.environ['PREDICTION_HISTORY_DB'] = args.history_db
+    from predictor_service import app
+    from prediction_api import history_store
+
+    if not hasattr(os, 'fork') or args.workers <= 1:
+        if args.workers > 1:
+            logger.warning("Worker processes need os.fork, serving from a single process")
+        threading.Thread(target=purge_periodically, args=(history_store,), name='purge', daemon=True).start()
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
+        return
+
+    sock = bind_socket(args.host, args.port)
+    fd = sock.fileno()
+    workers = {spawn_worker(app, args.host, args.port, fd) for _ in range(args.workers)}
+    logger.info(f"Serving on http://{args.host}:{args.port} with {len(workers)} workers, "
+                f"history in {args.history_db}")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Restart workers that die, stop all of them on SIGTERM / Ctrl+C
+    next_purge = time.monotonic() + PURGE_INTERVAL
+    while not stopping:
+        if time.monotonic() >= next_purge:
+            purge_idle_tabs(history_store)
+            next_purge = time.monotonic() + PURGE_INTERVAL
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        workers.discard(pid)
+        logger.warning(f"Worker {pid} exited with status {status}, restarting")
+        workers.add(spawn_worker(app, args.host, args.port, fd))
+
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Service Request Helpers
+Body parsing, validation and response encoding shared by the prediction
+services (predictor_service.py, predictor_service_async.py) and the model
+service (model_service.py). Framework-agnostic: Flask and Quart pass in
+their Response class and request proxy.
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import codec
+
+
+class RequestError(Exception):
+    """Invalid request, answered with status 400"""
+    status = 400
+
+
+class UnsupportedBody(RequestError):
+    """Request body in a content type the server has no codec for"""
+    status = 415
+
+
+def parse_body(body: bytes, content_type: Optional[str]) -> Any:
+    """Decode a JSON or MessagePack request body"""
+    try:
+        return codec.decode(body, content_type)
+    except codec.UnsupportedMediaType as e:
+        raise UnsupportedBody(str(e)) from None
+    except ValueError as e:
+        raise RequestError(str(e)) from None
+
+
+def require(data: Optional[Dict], fields: List[str]):
+    """Validate required fields"""
+    if not isinstance(data, dict):
+        raise RequestError('Expected an object body')
+    for field in fields:
+        if field not in data:
+            raise RequestError(f'Missing field: {field}')
+
+
+def responders(response_class, request, logger: logging.Logger) -> Tuple[Callable, Callable]:
+    """
+    respond(payload, status=200, headers=None) encoding payload in the codec
+    the client accepts, and error_response(error, context) answering
+    RequestErrors with their status and anything else with a logged 500.
+    """
+    def respond(payload, status: int = 200, headers=None):
+        out = codec.response_codec(request.headers.get('Accept'))
+        return response_class(out.dumps(payload), status=status, headers=headers, mimetype=out.mimetype)
+
+    def error_response(error: Exception, context: str):
+        if isinstance(error, RequestError):
+            return respond({'success': False, 'error': str(error)}, error.status)
+        logger.error(f"{context} error: {str(error)}", exc_info=error)
+        return respond({'success': False, 'error': str(error)}, 500)
+
+    return respond, error_response
@@ -0,0 +1,133 @@
+"""
+Prediction Session Store
+Bounded store of per-tab PredictionSessions with idle TTL, a maximum session
+count and a memory budget, evicting least recently used tabs first.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from predictor_simplified import PredictionSession
+
+
+class SessionStore:
+    """
+    LRU map of tab_id -> PredictionSession with TTL and size limits.
+    factory(tab_id) creates a missing session.
+    Thread-safe; the store lock is only held for bookkeeping, never while
+    a session does prediction work.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], PredictionSession] = PredictionSession,
+        max_sessions: int = 5000,
+        idle_ttl: float = 30 * 60,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+
+        # tab_id -> [session, last_access, approx_bytes], least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.created = 0
+        self.evictions = {'ttl': 0, 'lru': 0, 'memory': 0}
+
+    def __contains__(self, tab_id: str) -> bool:
+        return tab_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, tab_id: str) -> PredictionSession:
+        """Get or create the session for a tab and mark it recently used"""
+        with self._lock:
+            return self._get(tab_id)
+
+    def _get(self, tab_id: str) -> PredictionSession:
+        now = self.clock()
+        self._expire(now)
+        if self._entries:
+            # The most recently used session is the one most likely to have grown
+            self._account(next(reversed(self._entries.values())))
+
+        entry = self._entries.get(tab_id)
+        if entry is None:
+            entry = self._entries[tab_id] = [self.factory(tab_id), now, 0]
+            self.created += 1
+        else:
+            entry[1] = now
+            self._entries.move_to_end(tab_id)
+
+        # Sizes are refreshed on access, so they reflect the previous request
+        self._account(entry)
+        self._enforce_limits(keep=tab_id)
+        return entry[0]
+
+    def remove(self, tab_id: str) -> bool:
+        """Drop a tab's session, returns whether it existed"""
+        with self._lock:
+            entry = self._entries.pop(tab_id, None)
+            if entry is None:
+                return False
+            self.total_bytes -= entry[2]
+            return True
+
+    def _account(self, entry):
+        size = entry[0].approx_bytes()
+        self.total_bytes += size - entry[2]
+        entry[2] = size
+
+    def _evict_oldest(self, reason: str):
+        _, (_, _, size) = self._entries.popitem(last=False)
+        self.total_bytes -= size
+        self.evictions[reason] += 1
+
+    def _expire(self, now: float):
+        """Evict sessions idle for longer than idle_ttl"""
+        while self._entries:
+            _, last_access, _ = next(iter(self._entries.values()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._evict_oldest('ttl')
+
+    def _enforce_limits(self, keep: str):
+        """Evict least recently used sessions beyond the count or byte budget"""
+        while len(self._entries) > self.max_sessions and next(iter(self._entries)) != keep:
+            self._evict_oldest('lru')
+        while (self.max_bytes is not None and self.total_bytes > self.max_bytes
+               and next(iter(self._entries)) != keep):
+            self._evict_oldest('memory')
+
+    def stats(self) -> Dict:
+        """
+        Live sessions, evictions and approximate memory use.
+        Every session is re-accounted, so sessions that grew since their
+        last access are evicted here if the store is over its byte budget.
+        """
+        with self._lock:
+            self._expire(self.clock())
+            for entry in self._entries.values():
+                self._account(entry)
+            if self._entries:
+                self._enforce_limits(keep=next(reversed(self._entries)))
+            return self._stats()
+
+    def _stats(self) -> Dict:
+        return {
+            'live_sessions': len(self._entries),
+            'created': self.created,
+            'evictions': dict(self.evictions),
+            'approx_bytes': self.total_bytes,
+            'max_sessions': self.max_sessions,
+            'max_bytes': self.max_bytes,
+            'idle_ttl_seconds': self.idle_ttl,
+        }
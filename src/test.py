@@ -1,201 +1,52 @@
 import os
-import torch
-import torch.nn.functional as F
-from transformers import AutoTokenizer, AutoModel
-from dataclasses import dataclass, asdict
+import time
 import warnings
 warnings.filterwarnings('ignore')
-os.environ['TRANSFORMERS_OFFLINE'] = '0'  # Allow online access
-os.environ['HF_HUB_OFFLINE'] = '0'
 
+# torch and the model are imported by the functions that run it, so
+# importing this module for TEST_SCENARIOS stays cheap
 
-# ============================================================================
-# Configuration (must match training config)
-# ============================================================================
-
-@dataclass
-class ElementFocusedConfig:
-    encoder_model: str = r"D:\Neuro Final\WebAgent\distilbert-base-uncased"
-    hidden_size: int = 768
-    fusion_hidden_size: int = 384
-    num_fusion_layers: int = 2
-    max_task_length: int = 128
-    max_content_length: int = 512
-    max_page_text_length: int = 256
-    num_element_candidates: int = 20
-    dropout: float = 0.4
-    max_value_length: int = 64
-    vocab_size: int = 30522
-    freeze_encoders: bool = True
 
 # ============================================================================
-# Model Architecture (must match training)
+# Test Functions
 # ============================================================================
 
-class ContrastiveFusion(torch.nn.Module):
-    def __init__(self, hidden_size, dropout=0.4):
-        super().__init__()
-        self.cross_attn = torch.nn.MultiheadAttention(
-            hidden_size, num_heads=8, dropout=dropout, batch_first=True
-        )
-        self.self_attn = torch.nn.MultiheadAttention(
-            hidden_size, num_heads=8, dropout=dropout, batch_first=True
-        )
-        self.norm1 = torch.nn.LayerNorm(hidden_size)
-        self.norm2 = torch.nn.LayerNorm(hidden_size)
-        self.dropout = torch.nn.Dropout(dropout)
-        
-        self.ffn = torch.nn.Sequential(
-            torch.nn.Linear(hidden_size, hidden_size * 2),
-            torch.nn.GELU(),
-            torch.nn.Dropout(dropout),
-            torch.nn.Linear(hidden_size * 2, hidden_size),
-            torch.nn.Dropout(dropout)
-        )
-        self.norm3 = torch.nn.LayerNorm(hidden_size)
-
-    def forward(self, query, key_value, key_mask=None):
-        attn_out, _ = self.cross_attn(query, key_value, key_value, key_padding_mask=key_mask)
-        query = self.norm1(query + self.dropout(attn_out))
-        
-        self_out, _ = self.self_attn(query, query, query)
-        query = self.norm2(query + self.dropout(self_out))
-        
-        ffn_out = self.ffn(query)
-        query = self.norm3(query + ffn_out)
-        
-        return query
-
-
-class ElementFocusedModel(torch.nn.Module):
-    def __init__(self, config: ElementFocusedConfig):
-        super().__init__()
-        self.config = config
-
-        self.encoder = AutoModel.from_pretrained(config.encoder_model)
-        
-        if config.freeze_encoders:
-            for param in self.encoder.parameters():
-                param.requires_grad = False
-
-        self.proj = torch.nn.Sequential(
-            torch.nn.Linear(config.hidden_size, config.fusion_hidden_size),
-            torch.nn.LayerNorm(config.fusion_hidden_size),
-            torch.nn.GELU(),
-            torch.nn.Dropout(config.dropout)
-        )
-
-        self.fusion_layers = torch.nn.ModuleList([
-            ContrastiveFusion(config.fusion_hidden_size, dropout=config.dropout)
-            for _ in range(config.num_fusion_layers)
-        ])
-
-        self.element_head = torch.nn.Sequential(
-            torch.nn.Dropout(config.dropout),
-            torch.nn.Linear(config.fusion_hidden_size, 256),
-            torch.nn.LayerNorm(256),
-            torch.nn.GELU(),
-            torch.nn.Dropout(config.dropout * 0.5),
-            torch.nn.Linear(256, 128),
-            torch.nn.LayerNorm(128),
-            torch.nn.GELU(),
-            torch.nn.Dropout(config.dropout * 0.3),
-            torch.nn.Linear(128, config.num_element_candidates)
-        )
-
-        self.value_head = torch.nn.Sequential(
-            torch.nn.Dropout(config.dropout),
-            torch.nn.Linear(config.fusion_hidden_size, 512),
-            torch.nn.LayerNorm(512),
-            torch.nn.GELU(),
-            torch.nn.Dropout(config.dropout * 0.5),
-            torch.nn.Linear(512, config.vocab_size)
-        )
-
-        self.ranking_head = torch.nn.Sequential(
-            torch.nn.Dropout(config.dropout),
-            torch.nn.Linear(config.fusion_hidden_size, 128),
-            torch.nn.LayerNorm(128),
-            torch.nn.GELU(),
-            torch.nn.Dropout(config.dropout * 0.5),
-            torch.nn.Linear(128, config.num_element_candidates)
-        )
-
-    def forward(self, task_input_ids, task_attention_mask, 
-                content_input_ids, content_attention_mask, **kwargs):
-
-        if self.config.freeze_encoders:
-            self.encoder.eval()
-            with torch.no_grad():
-                task_out = self.encoder(task_input_ids, task_attention_mask)
-                content_out = self.encoder(content_input_ids, content_attention_mask)
-        else:
-            task_out = self.encoder(task_input_ids, task_attention_mask)
-            content_out = self.encoder(content_input_ids, content_attention_mask)
-
-        task_hidden = self.proj(task_out.last_hidden_state)
-        content_hidden = self.proj(content_out.last_hidden_state)
-
-        fused = task_hidden
-        content_key_mask = ~content_attention_mask.bool()
-        
-        for fusion_layer in self.fusion_layers:
-            fused = fusion_layer(fused, content_hidden, content_key_mask)
-
-        mask = task_attention_mask.unsqueeze(-1).float()
-        pooled = (fused * mask).sum(1) / task_attention_mask.sum(1, keepdim=True).clamp(min=1e-9)
-
-        element_logits = self.element_head(pooled)
-        value_logits = self.value_head(pooled)
-        ranking_logits = self.ranking_head(pooled)
-
-        return {
-            'element_logits': element_logits,
-            'value_logits': value_logits,
-            'ranking_logits': ranking_logits,
-        }
-
-# ============================================================================
-# Load Model from Drive
-# ============================================================================
+TEST_SCENARIOS = [
+    {
+        'task': "Search for python tutorials",
+        'page': "Search Engine",
+        'history': "None",
+        'elements': [
+            {'idx': 0, 'type': 'input', 'purpose': 'search', 'text': 'Search box'},
+            {'idx': 2, 'type': 'a', 'purpose': 'link', 'text': 'Advanced Search'},
+        ],
+        'target': 0  # Should focus on input first
+    },
+    {
+        'task': "Submit the login form",
+        'page': "Login Page",
+        'history': "Typed username | Typed password",
+        'elements': [
+            {'idx': 0, 'type': 'input', 'purpose': 'input', 'text': 'Username'},
+            {'idx': 1, 'type': 'input', 'purpose': 'input', 'text': 'Password'},
+            {'idx': 2, 'type': 'button', 'purpose': 'submit', 'text': 'Login'},
+            {'idx': 3, 'type': 'a', 'purpose': 'link', 'text': 'Forgot password?'},
+        ],
+        'target': 2  # Submit button
+    },
+    {
+        'task': "Navigate to the homepage",
+        'page': "Product Page",
+        'history': "Viewed product details",
+        'elements': [
+            {'idx': 0, 'type': 'a', 'purpose': 'link', 'text': 'Home'},
+            {'idx': 1, 'type': 'button', 'purpose': 'button', 'text': 'Add to Cart'},
+            {'idx': 2, 'type': 'button', 'purpose': 'button', 'text': 'Buy Now'},
+        ],
+        'target': 0  # Home link
+    }
+]
 
-def load_model_from_drive(drive_path=r'D:\Neuro Final\WebAgent\ElementFocused'):
-    """Load model and tokenizer"""
-    print("🔄 Loading model...")
-    
-    # Check if model weights exist
-    model_path = os.path.join(drive_path, 'element_focused_model.pt')
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model file not found at {model_path}")
-    
-    print(f"✓ Found model at {model_path}")
-    
-    # Load tokenizer (will download and cache on first run)
-    print("📚 Loading tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased")
-    
-    # Initialize model
-    print("🏗️ Initializing model architecture...")
-    config = ElementFocusedConfig()
-    # Keep the default encoder_model = "distilbert-base-uncased"
-    
-    model = ElementFocusedModel(config)
-    
-    # Load your trained weights
-    print("⚙️ Loading model weights...")
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
-    state_dict = torch.load(model_path, map_location=device, weights_only=True)
-    model.load_state_dict(state_dict)
-    model.to(device)
-    model.eval()
-    
-    print(f"✅ Model loaded successfully on {device}!")
-    
-    return model, tokenizer, device, config
-# ============================================================================
-# Test Functions
-# ============================================================================
 
 def create_sample_test_case():
     """Create a sample test case with task and elements"""
@@ -217,48 +68,11 @@ def create_sample_test_case():
     return task, page_summary, prev_actions, elements, 0  # Target is element 1
 
 
-def prepare_input(task, page_summary, prev_actions, elements, tokenizer, config, device):
-    """Prepare input for the model"""
-    
-    # Format task text
-    task_text = f"Task: {task} | Current page: {page_summary} | History: {prev_actions}"
-    
-    # Format elements
-    content_descriptions = []
-    for elem in elements[:config.num_element_candidates]:
-        desc = f"[{elem['idx']}] {elem['type']} ({elem['purpose']}): {elem['text']}"
-        content_descriptions.append(desc)
-    
-    content_text = " | ".join(content_descriptions)
-    
-    # Tokenize
-    task_encoding = tokenizer(
-        task_text,
-        max_length=config.max_task_length,
-        padding='max_length',
-        truncation=True,
-        return_tensors='pt'
-    )
-    
-    content_encoding = tokenizer(
-        content_text,
-        max_length=config.max_content_length,
-        padding='max_length',
-        truncation=True,
-        return_tensors='pt'
-    )
-    
-    # Move to device
-    return {
-        'task_input_ids': task_encoding['input_ids'].to(device),
-        'task_attention_mask': task_encoding['attention_mask'].to(device),
-        'content_input_ids': content_encoding['input_ids'].to(device),
-        'content_attention_mask': content_encoding['attention_mask'].to(device),
-    }
-
-
 def test_model(model, tokenizer, device, config):
     """Run inference on sample test case"""
+    import torch
+    import torch.nn.functional as F
+    from element_model import prepare_input
     
     print("\n" + "="*70)
     print("🧪 TESTING MODEL")
@@ -284,7 +98,7 @@ def test_model(model, tokenizer, device, config):
     # Run inference
     print(f"\n🔮 Running inference...")
     with torch.no_grad():
-        outputs = model(**inputs)
+        outputs = model(**inputs, heads=('element',))
     
     # Get predictions
     element_logits = outputs['element_logits'][0]  # Remove batch dim
@@ -323,42 +137,11 @@ def test_model(model, tokenizer, device, config):
 
 def test_multiple_scenarios(model, tokenizer, device, config):
     """Test on multiple scenarios"""
+    import torch
+    import torch.nn.functional as F
+    from element_model import prepare_input
     
-    scenarios = [
-        {
-            'task': "Search for python tutorials",
-            'page': "Search Engine",
-            'history': "None",
-            'elements': [
-                {'idx': 0, 'type': 'input', 'purpose': 'search', 'text': 'Search box'},
-                {'idx': 2, 'type': 'a', 'purpose': 'link', 'text': 'Advanced Search'},
-            ],
-            'target': 0  # Should focus on input first
-        },
-        {
-            'task': "Submit the login form",
-            'page': "Login Page",
-            'history': "Typed username | Typed password",
-            'elements': [
-                {'idx': 0, 'type': 'input', 'purpose': 'input', 'text': 'Username'},
-                {'idx': 1, 'type': 'input', 'purpose': 'input', 'text': 'Password'},
-                {'idx': 2, 'type': 'button', 'purpose': 'submit', 'text': 'Login'},
-                {'idx': 3, 'type': 'a', 'purpose': 'link', 'text': 'Forgot password?'},
-            ],
-            'target': 2  # Submit button
-        },
-        {
-            'task': "Navigate to the homepage",
-            'page': "Product Page",
-            'history': "Viewed product details",
-            'elements': [
-                {'idx': 0, 'type': 'a', 'purpose': 'link', 'text': 'Home'},
-                {'idx': 1, 'type': 'button', 'purpose': 'button', 'text': 'Add to Cart'},
-                {'idx': 2, 'type': 'button', 'purpose': 'button', 'text': 'Buy Now'},
-            ],
-            'target': 0  # Home link
-        }
-    ]
+    scenarios = TEST_SCENARIOS
     
     print("\n" + "="*70)
     print("🧪 TESTING MULTIPLE SCENARIOS")
@@ -383,7 +166,7 @@ def test_multiple_scenarios(model, tokenizer, device, config):
         )
         
         with torch.no_grad():
-            outputs = model(**inputs)
+            outputs = model(**inputs, heads=('element',))
         
         element_probs = F.softmax(outputs['element_logits'][0], dim=0)
         top_probs, top_indices = torch.topk(element_probs, k=3)
@@ -412,11 +195,65 @@ def test_multiple_scenarios(model, tokenizer, device, config):
     print(f"{'='*70}\n")
 
 
+def compare_models(reference, candidate, tokenizer, config, repeats=20):
+    """
+    Accuracy and latency of a candidate model (e.g. the int8 export) against
+    the fp32 reference on TEST_SCENARIOS. Models are (model, device) pairs.
+    """
+    import torch
+    import torch.nn.functional as F
+    from element_model import prepare_input
+    
+    print("\n" + "="*70)
+    print("⚖️  COMPARING MODELS")
+    print("="*70)
+    
+    results = {}
+    for name, (model, device) in (('fp32', reference), ('candidate', candidate)):
+        inputs = [
+            prepare_input(s['task'], s['page'], s['history'], s['elements'], tokenizer, config, device)
+            for s in TEST_SCENARIOS
+        ]
+        # Time full forward passes, not encoder cache hits
+        cache, model.encoder_cache = model.encoder_cache, None
+        with torch.inference_mode():
+            probs = [F.softmax(model(**batch, heads=('element',))['element_logits'][0], dim=0).cpu() for batch in inputs]
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for batch in inputs:
+                    model(**batch, heads=('element',))
+        model.encoder_cache = cache
+        latency = (time.perf_counter() - start) * 1000 / (repeats * len(inputs))
+        results[name] = (probs, latency)
+    
+    (ref_probs, ref_latency), (cand_probs, cand_latency) = results['fp32'], results['candidate']
+    agree = correct_ref = correct_cand = 0
+    max_diff = 0.0
+    for scenario, p_ref, p_cand in zip(TEST_SCENARIOS, ref_probs, cand_probs):
+        top_ref, top_cand = p_ref.argmax().item(), p_cand.argmax().item()
+        agree += top_ref == top_cand
+        correct_ref += top_ref == scenario['target']
+        correct_cand += top_cand == scenario['target']
+        max_diff = max(max_diff, (p_ref - p_cand).abs().max().item())
+    
+    n = len(TEST_SCENARIOS)
+    print(f"Top-1 accuracy:   fp32 {correct_ref}/{n}, candidate {correct_cand}/{n}")
+    print(f"Top-1 agreement:  {agree}/{n}")
+    print(f"Max prob. diff:   {max_diff * 100:.2f} points")
+    print(f"Latency:          fp32 {ref_latency:.1f} ms, candidate {cand_latency:.1f} ms "
+          f"({ref_latency / cand_latency:.1f}x)")
+    print(f"{'='*70}\n")
+    
+    return agree, max_diff
+
+
 # ============================================================================
 # Main
 # ============================================================================
 
 if __name__ == '__main__':
+    from element_model import QUANTIZED_WEIGHTS, load_model_from_drive, model_dir
+    
     # Load model
     model, tokenizer, device, config = load_model_from_drive()
     
@@ -424,4 +261,9 @@ if __name__ == '__main__':
     test_model(model, tokenizer, device, config)
     test_multiple_scenarios(model, tokenizer, device, config)
     
+    # Compare the int8 CPU artifact, if export_model.py has written one
+    if os.path.exists(os.path.join(model_dir(), QUANTIZED_WEIGHTS)):
+        quantized, _, cpu, _ = load_model_from_drive(quantized=True)
+        compare_models((model, device), (quantized, cpu), tokenizer, config)
+    
     print("✨ Testing complete!")
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Shared Text Processing
+Text normalization and keyword extraction used by the element selector and
+the next-element predictor. Both are memoized in bounded LRU caches since the
+same labels recur across requests and tabs.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# ASCII characters _PUNCTUATION_RE removes, derived from the pattern itself
+_ASCII_PUNCTUATION = {c: None for c in range(128) if _PUNCTUATION_RE.match(chr(c))}
+
+# Common action words to remove
+STOP_WORDS = frozenset({
+    'click', 'press', 'tap', 'select', 'choose', 'open', 'close',
+    'the', 'a', 'an', 'on', 'to', 'of', 'in', 'for', 'at', 'by',
+    'navigate', 'go', 'view', 'see', 'show', 'display'
+})
+
+# Longer strings (page dumps, long descriptions) are processed but not cached
+MAX_CACHED_LENGTH = 256
+
+
+def _normalize_text(text: str) -> str:
+    text = text.lower().strip()
+    if text.isascii():
+        text = text.translate(_ASCII_PUNCTUATION)
+        # Printable ASCII without double spaces has nothing to collapse
+        if text.isprintable() and '  ' not in text:
+            return text
+    else:
+        text = _PUNCTUATION_RE.sub('', text)  # Remove punctuation
+    return _WHITESPACE_RE.sub(' ', text)  # Normalize whitespace
+
+
+def _extract_keywords(instruction: str) -> Tuple[str, ...]:
+    # Convert to lowercase and split
+    words = instruction.lower().split()
+
+    # Remove stop words and short words
+    keywords = [w for w in words if w not in STOP_WORDS and len(w) > 2]
+
+    # Also keep original phrases
+    if len(keywords) >= 2:
+        keywords.append(' '.join(keywords[:2]))  # First two keywords as phrase
+
+    return tuple(keywords)
+
+
+_normalize_cached = lru_cache(maxsize=8192)(_normalize_text)
+_keywords_cached = lru_cache(maxsize=2048)(_extract_keywords)
+
+
+def configure_text_cache(normalize_size: int = 8192, keywords_size: int = 2048):
+    """Resize (and clear) the normalize_text / extract_keywords caches"""
+    global _normalize_cached, _keywords_cached
+    _normalize_cached = lru_cache(maxsize=normalize_size)(_normalize_text)
+    _keywords_cached = lru_cache(maxsize=keywords_size)(_extract_keywords)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for comparison"""
+    if len(text) > MAX_CACHED_LENGTH:
+        return _normalize_text(text)
+    return _normalize_cached(text)
+
+
+def extract_keywords(instruction: str) -> List[str]:
+    """
+    Extract meaningful keywords from instruction.
+    Remove stop words and common verbs.
+    """
+    if len(instruction) > MAX_CACHED_LENGTH:
+        return list(_extract_keywords(instruction))
+    return list(_keywords_cached(instruction))
+
+
+def text_cache_stats() -> Dict:
+    """Hit/miss counters and sizes of the text caches"""
+    stats = {}
+    for name, cached in (('normalize_text', _normalize_cached), ('extract_keywords', _keywords_cached)):
+        info = cached.cache_info()
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+        }
+    return stats